@@ -1,4 +1,9 @@
 from enduWorkoutGen.workout_dashboard import WorkoutDashboard
 
 dashboard = WorkoutDashboard()
-dashboard.run_server(debug=False)
\ No newline at end of file
+
+# WSGI application for production servers, e.g. `gunicorn --workers 4 --threads 4 app:server`
+server = dashboard.app.server
+
+if __name__ == "__main__":
+    dashboard.run_server(debug=False)
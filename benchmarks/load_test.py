@@ -0,0 +1,186 @@
+"""
+Local load test for the dashboard: generate + download round trips against gunicorn.
+
+Usage:
+    python benchmarks/load_test.py --workers 1 2 4 --threads 4 --concurrency 16 --duration 15
+
+For every worker count a gunicorn server is started on app:server, and client threads
+replay the generate and download callbacks through Dash's HTTP endpoint for the given
+duration. Downloads are sent with the token from the generate response, so they may land
+on a different worker than the one that generated the workout, exactly like production.
+"""
+import argparse
+import json
+import os
+import socket
+import subprocess
+import sys
+import threading
+import time
+import urllib.request
+from typing import Dict, List, Optional
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+GENERATE_OUTPUTS = [
+    {"id": "workout-graph", "property": "figure"},
+    {"id": "workout-info", "property": "children"},
+    {"id": "download-button", "property": "style"},
+    {"id": "graph-container", "property": "style"},
+    {"id": "download-button", "property": "n_clicks"},
+    {"id": "workout-token", "property": "data"},
+]
+
+
+def generate_payload(total_duration: int, segments: List[List], token: Optional[dict] = None,
+                     ftp: int = 250) -> dict:
+    # The state list must match the generate callback's States, in order
+    card_ids = [{"type": "segment-type", "index": i} for i in range(len(segments))]
+    return {
+        "output": ".." + "...".join(f"{o['id']}.{o['property']}" for o in GENERATE_OUTPUTS) + "..",
+        "outputs": GENERATE_OUTPUTS,
+        "inputs": [{"id": "generate-button", "property": "n_clicks", "value": 1}],
+        "changedPropIds": ["generate-button.n_clicks"],
+        "state": [
+            {"id": "total-duration", "property": "value", "value": total_duration},
+            [{"id": {"type": "segment-type", "index": i}, "property": "value", "value": workout_type}
+             for i, (workout_type, _) in enumerate(segments)],
+            [{"id": {"type": "segment-duration", "index": i}, "property": "value", "value": minutes}
+             for i, (_, minutes) in enumerate(segments)],
+            {"id": "workout-token", "property": "data", "value": token},
+            {"id": "download-ftp", "property": "value", "value": ftp},
+            [{"id": card_id, "property": "id", "value": card_id} for card_id in card_ids],
+        ],
+    }
+
+
+def download_payload(token: dict, file_type: str = "mrc", ftp: int = 250) -> dict:
+    # The state list must match the download callback's States, in order
+    return {
+        "output": "download-workout.data",
+        "outputs": {"id": "download-workout", "property": "data"},
+        "inputs": [{"id": "download-button", "property": "n_clicks", "value": 1}],
+        "changedPropIds": ["download-button.n_clicks"],
+        "state": [
+            {"id": "workout-token", "property": "data", "value": token},
+            {"id": "download-format", "property": "value", "value": file_type},
+            {"id": "download-ftp", "property": "value", "value": ftp},
+        ],
+    }
+
+
+def post(url: str, payload: dict) -> dict:
+    request = urllib.request.Request(url, data=json.dumps(payload).encode(),
+                                     headers={"Content-Type": "application/json"})
+    with urllib.request.urlopen(request, timeout=30) as response:
+        # urlopen raises for 4xx/5xx; a 204 (PreventUpdate) means the request didn't do anything either
+        if response.status != 200:
+            raise RuntimeError(f"HTTP {response.status} from {url}")
+        return json.loads(response.read())
+
+
+def free_port() -> int:
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        return s.getsockname()[1]
+
+
+def wait_until_ready(base_url: str, timeout: float = 30):
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        try:
+            urllib.request.urlopen(base_url + "/", timeout=1).read()
+            return
+        except OSError:
+            time.sleep(0.2)
+    raise RuntimeError(f"server at {base_url} did not come up within {timeout}s")
+
+
+def run_clients(base_url: str, concurrency: int, duration: float, total_duration: int,
+                segments: List[List]) -> Dict[str, List[float]]:
+    """Each client loops generate -> download until the time is up; returns latencies per kind"""
+    url = base_url + "/_dash-update-component"
+    latencies: Dict[str, List[float]] = {"generate": [], "download": [], "round_trip": []}
+    errors = []
+    lock = threading.Lock()
+    stop_at = time.monotonic() + duration
+
+    def client():
+        token = None  # like a browser tab, every generate sends the previous workout's token
+        while time.monotonic() < stop_at:
+            try:
+                start = time.perf_counter()
+                response = post(url, generate_payload(total_duration, segments, token))
+                generated = time.perf_counter()
+                token = response["response"]["workout-token"]["data"]
+                post(url, download_payload(token))
+                done = time.perf_counter()
+            except Exception as exc:  # finish the run, then fail it
+                with lock:
+                    errors.append(repr(exc))
+                continue
+            with lock:
+                latencies["generate"].append(generated - start)
+                latencies["download"].append(done - generated)
+                latencies["round_trip"].append(done - start)
+
+    threads = [threading.Thread(target=client) for _ in range(concurrency)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    latencies["errors"] = errors
+    return latencies
+
+
+def percentile(values: List[float], q: float) -> float:
+    if not values:
+        return float("nan")
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, int(round(q * (len(ordered) - 1))))]
+
+
+def main(argv=None) -> int:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--workers", nargs="+", type=int, default=[1, 2, 4], help="gunicorn worker counts")
+    parser.add_argument("--threads", type=int, default=4, help="Threads per gunicorn worker (default: 4)")
+    parser.add_argument("--concurrency", type=int, default=16, help="Concurrent client threads (default: 16)")
+    parser.add_argument("--duration", type=float, default=15, help="Seconds per worker count (default: 15)")
+    parser.add_argument("--total", type=int, default=60, help="Workout duration in minutes (default: 60)")
+    args = parser.parse_args(argv)
+    segments = [["tempo", 20], ["vo2", 15], ["threshold", 25]]
+
+    print(f"{'workers':>7} {'req/s':>8} {'round trips':>11} {'gen p50':>9} {'gen p99':>9} "
+          f"{'dl p50':>9} {'dl p99':>9}")
+    for workers in args.workers:
+        port = free_port()
+        server = subprocess.Popen(
+            [sys.executable, "-m", "gunicorn", "--workers", str(workers), "--threads", str(args.threads),
+             "--bind", f"127.0.0.1:{port}", "--log-level", "warning", "app:server"],
+            cwd=ROOT,
+        )
+        try:
+            base_url = f"http://127.0.0.1:{port}"
+            wait_until_ready(base_url)
+            latencies = run_clients(base_url, args.concurrency, args.duration, args.total, segments)
+        finally:
+            server.terminate()
+            server.wait()
+
+        if latencies["errors"]:
+            # Latencies of a run with failing requests don't mean anything
+            print(f"{workers:>7} {len(latencies['errors'])} failed requests, first error: {latencies['errors'][0]}")
+            return 1
+
+        round_trips = len(latencies["round_trip"])
+        requests_per_second = 2 * round_trips / args.duration
+        print(f"{workers:>7} {requests_per_second:>8.1f} {round_trips:>11} "
+              f"{percentile(latencies['generate'], 0.5) * 1e3:>7.1f}ms "
+              f"{percentile(latencies['generate'], 0.99) * 1e3:>7.1f}ms "
+              f"{percentile(latencies['download'], 0.5) * 1e3:>7.1f}ms "
+              f"{percentile(latencies['download'], 0.99) * 1e3:>7.1f}ms")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
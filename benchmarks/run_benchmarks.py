@@ -0,0 +1,327 @@
+"""
+Benchmarks for workout generation, metrics, exporters and dashboard callbacks.
+
+Usage:
+    python benchmarks/run_benchmarks.py                     # run and print timings
+    python benchmarks/run_benchmarks.py --save-baseline     # also store them as the baseline
+    python benchmarks/run_benchmarks.py --compare           # report regressions against the baseline
+    python benchmarks/run_benchmarks.py -k export           # only benchmarks whose name contains "export"
+
+Wall time is the median of several timed runs; peak memory is measured in a separate
+run under tracemalloc so that tracing doesn't distort the timings.
+"""
+import argparse
+import io
+import itertools
+import json
+import os
+import platform
+import statistics
+import sys
+import time
+import tracemalloc
+from typing import Callable, Dict, List, Tuple
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from enduWorkoutGen.workoutgen import WorkoutGenerator, WorkoutParameters, WorkoutSegment, WorkoutType  # noqa: E402
+
+DEFAULT_BASELINE = os.path.join(os.path.dirname(os.path.abspath(__file__)), "baseline.json")
+
+# Segment mixes, as (type, minutes) pairs scaled to the total duration by generate_workout
+MIXES = {
+    "endurance": [(WorkoutType.ENDURANCE, 60)],
+    "sprints": [(WorkoutType.SPRINTS, 60)],
+    "tempo+vo2+threshold": [(WorkoutType.TEMPO, 20), (WorkoutType.VO2, 15), (WorkoutType.THRESHOLD, 25)],
+    "all-types": [(wt, 10) for wt in WorkoutType],
+}
+
+# The dashboard slider goes from 20 to 180 minutes
+DURATIONS = (20, 60, 120, 180)
+
+# name -> factory; the factory does the setup and returns the callable to time
+BENCHMARKS: Dict[str, Callable[[], Callable[[], object]]] = {}
+
+
+def benchmark(name: str):
+    def register(factory):
+        BENCHMARKS[name] = factory
+        return factory
+    return register
+
+
+def params_for(mix: str, duration: int) -> WorkoutParameters:
+    return WorkoutParameters([WorkoutSegment(wt, minutes) for wt, minutes in MIXES[mix]], duration)
+
+
+def _register_generation():
+    for mix in MIXES:
+        for duration in DURATIONS:
+            def factory(mix=mix, duration=duration):
+                generator = WorkoutGenerator(seed=1)
+                params = params_for(mix, duration)
+                return lambda: generator.generate_workout(params)
+            benchmark(f"generate_workout[{mix},{duration}min]")(factory)
+
+
+_register_generation()
+
+
+@benchmark("generate_workouts_batch[tempo+vo2+threshold,60min,n=1000]")
+def bench_batch():
+    generator = WorkoutGenerator()
+    params = params_for("tempo+vo2+threshold", 60)
+    return lambda: generator.generate_workouts_batch(params, 1000, seed=1)
+
+
+@benchmark("generate_workout_for_target[tempo+vo2+threshold,60min,tss=90]")
+def bench_target():
+    generator = WorkoutGenerator(seed=1)
+    params = params_for("tempo+vo2+threshold", 60)
+    return lambda: generator.generate_workout_for_target(params, 90)
+
+
+@benchmark("generate_plan[5 days/week,16 weeks]")
+def bench_plan():
+    from enduWorkoutGen.training_plan import generate_plan, weekly_tss_ramp
+    week = [None, params_for("tempo+vo2+threshold", 60), params_for("endurance", 90),
+            params_for("tempo+vo2+threshold", 75), None, params_for("endurance", 150), params_for("endurance", 90)]
+    targets = weekly_tss_ramp(16, 330)
+    return lambda: generate_plan(week, targets, seed=1)
+
+
+@benchmark("IncrementalWorkout.set_segment[15 segments,180min]")
+def bench_incremental_edit():
+    from enduWorkoutGen.incremental import IncrementalWorkout
+    types = list(WorkoutType)
+    workout = IncrementalWorkout(WorkoutGenerator(seed=1),
+                                 WorkoutParameters([WorkoutSegment(types[i % len(types)], 10) for i in range(15)], 180))
+    edits = iter(range(1 << 62))
+
+    # Change the middle segment to a new one (a fresh seed every call) and read the result back
+    def edit():
+        workout.set_segment(7, WorkoutSegment(WorkoutType.VO2, 10), seed=next(edits))
+        return workout.intervals(), workout.metrics()
+
+    return edit
+
+
+@benchmark("calculate_metrics[all-types,180min]")
+def bench_calculate_metrics():
+    generator = WorkoutGenerator(seed=1)
+    intervals = generator.generate_workout(params_for("all-types", 180))
+    return lambda: generator.calculate_metrics(intervals)
+
+
+@benchmark("calculate_workout_metrics[batch,60min,n=1000]")
+def bench_batch_metrics():
+    generator = WorkoutGenerator()
+    workouts = generator.generate_workouts_batch(params_for("tempo+vo2+threshold", 60), 1000, seed=1)
+    return lambda: generator.calculate_workout_metrics(workouts)
+
+
+@benchmark("Deduplicator.unique[tempo+vo2+threshold,60min,n=1000]")
+def bench_dedup():
+    from enduWorkoutGen.canonical import Deduplicator
+    workouts = WorkoutGenerator().generate_workouts_batch(params_for("tempo+vo2+threshold", 60), 1000, seed=1)
+    return lambda: Deduplicator(power_step=5, time_step=30).unique(workouts)
+
+
+@benchmark("expand_power[all-types,180min]")
+def bench_expand_power():
+    from enduWorkoutGen.streams import expand_power
+    intervals = WorkoutGenerator(seed=1).generate_workout(params_for("all-types", 180))
+    return lambda: expand_power(intervals)
+
+
+def _register_exports():
+    for duration in (60, 180):
+        def mrc_factory(duration=duration):
+            generator = WorkoutGenerator(seed=1)
+            intervals = generator.generate_workout(params_for("all-types", duration))
+            return lambda: generator.export_mrc(intervals, io.StringIO(), "Benchmark workout")
+
+        def zwo_factory(duration=duration):
+            generator = WorkoutGenerator(seed=1)
+            intervals = generator.generate_workout(params_for("all-types", duration))
+            return lambda: generator.export_zwo(intervals, io.StringIO(), "Benchmark workout")
+
+        def all_formats_factory(duration=duration):
+            from enduWorkoutGen.exporters import EXPORTERS
+            generator = WorkoutGenerator(seed=1)
+            intervals = generator.generate_workout(params_for("all-types", duration))
+            return lambda: generator.render(intervals, list(EXPORTERS))
+
+        benchmark(f"export_mrc[all-types,{duration}min]")(mrc_factory)
+        benchmark(f"export_zwo[all-types,{duration}min]")(zwo_factory)
+        benchmark(f"render[all formats,all-types,{duration}min]")(all_formats_factory)
+
+
+_register_exports()
+
+
+def _segment_states(mix: str):
+    return [wt.value for wt, _ in MIXES[mix]], [minutes for _, minutes in MIXES[mix]]
+
+
+@benchmark("dashboard.generate_workout[tempo+vo2+threshold,60min]")
+def bench_dashboard_generate():
+    from enduWorkoutGen.workout_dashboard import WorkoutDashboard
+    dashboard = WorkoutDashboard()
+    segment_types, segment_durations = _segment_states("tempo+vo2+threshold")
+    return lambda: dashboard.generate_workout(1, 60, segment_types, segment_durations)
+
+
+# Distinct workouts the cold download benchmark cycles through
+COLD_DOWNLOAD_POOL = 1024
+
+
+@benchmark("dashboard.download_workout[cold,tempo+vo2+threshold,60min]")
+def bench_dashboard_download():
+    from enduWorkoutGen.generation_cache import GenerationCache
+    from enduWorkoutGen.workout_dashboard import WorkoutDashboard
+    from enduWorkoutGen.workout_store import WorkoutStore
+    # A cache that keeps nothing: every render is a miss, but still pays for its key
+    dashboard = WorkoutDashboard(store=WorkoutStore(max_entries=COLD_DOWNLOAD_POOL, max_bytes=1 << 30),
+                                 cache=GenerationCache(max_entries=0))
+    segment_types, segment_durations = _segment_states("tempo+vo2+threshold")
+    params = params_for("tempo+vo2+threshold", 60)
+    description = dashboard.workout_generator.create_workout_description(params)
+
+    # Stored like a freshly generated workout with nothing prerendered, so only the download is timed
+    tokens = []
+    for i, intervals in enumerate(dashboard.workout_generator.generate_workouts_batch(params, COLD_DOWNLOAD_POOL,
+                                                                                      seed=1)):
+        name = f"Cold_{i}"
+        tokens.append({'id': dashboard.workout_store.put(intervals, name, description), 'name': name, 'total': 60,
+                       'segments': [list(segment) for segment in zip(segment_types, segment_durations)]})
+    pool = itertools.cycle(tokens)
+
+    def download():
+        token = next(pool)
+        content = dashboard.download_workout(1, token)
+        # Forget the export again, so the next time round this workout is rendered from scratch
+        dashboard.workout_store.drop_exports(token['id'])
+        return content
+
+    return download
+
+
+@benchmark("dashboard.download_workout[prerendered,tempo+vo2+threshold,60min]")
+def bench_dashboard_download_prerendered():
+    from enduWorkoutGen.workout_dashboard import WorkoutDashboard
+    dashboard = WorkoutDashboard()
+    segment_types, segment_durations = _segment_states("tempo+vo2+threshold")
+    token = dashboard.generate_workout(1, 60, segment_types, segment_durations)[-1]
+    dashboard.workout_store.get(token['id']).pending.result()  # what a user's think time gives us
+    return lambda: dashboard.download_workout(1, token)
+
+
+def measure(func: Callable[[], object], repeat: int, min_time: float = 0.05) -> Tuple[float, float, int]:
+    """Returns (median seconds per call, min seconds per call, peak traced bytes of one call)"""
+    func()  # warm-up
+
+    # Calibrate the number of calls per run so that a run lasts at least min_time
+    number = 1
+    while True:
+        start = time.perf_counter()
+        for _ in range(number):
+            func()
+        elapsed = time.perf_counter() - start
+        if elapsed >= min_time or number >= 1 << 20:
+            break
+        number *= 2
+
+    timings = [elapsed / number]
+    for _ in range(repeat - 1):
+        start = time.perf_counter()
+        for _ in range(number):
+            func()
+        timings.append((time.perf_counter() - start) / number)
+
+    tracemalloc.start()
+    try:
+        func()
+        peak = tracemalloc.get_traced_memory()[1]
+    finally:
+        tracemalloc.stop()
+    return statistics.median(timings), min(timings), peak
+
+
+def run(selected: List[str], repeat: int) -> Dict[str, Dict[str, float]]:
+    results = {}
+    for name in selected:
+        func = BENCHMARKS[name]()
+        median, best, peak = measure(func, repeat)
+        results[name] = {"median_s": median, "min_s": best, "peak_bytes": peak}
+        print(f"{name:<64} {median * 1e3:10.3f} ms  (min {best * 1e3:.3f} ms)  peak {peak / 1024:10.1f} KiB")
+    return results
+
+
+def compare(results: Dict[str, Dict[str, float]], baseline: Dict[str, Dict[str, float]],
+            threshold: float) -> List[str]:
+    """Print the change against the baseline and return the names of regressed benchmarks"""
+    regressions = []
+    print(f"\nComparison against baseline (regression threshold {threshold:.0%}):")
+    for name, result in results.items():
+        base = baseline.get(name)
+        if base is None:
+            print(f"{name:<64} new")
+            continue
+        time_change = result["median_s"] / base["median_s"] - 1
+        memory_change = result["peak_bytes"] / max(base["peak_bytes"], 1) - 1
+        regressed = time_change > threshold or memory_change > threshold
+        flag = "REGRESSION" if regressed else "ok"
+        print(f"{name:<64} time {time_change:+8.1%}  memory {memory_change:+8.1%}  {flag}")
+        if regressed:
+            regressions.append(name)
+    return regressions
+
+
+def main(argv=None) -> int:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("-k", "--filter", default="", help="Only run benchmarks whose name contains this")
+    parser.add_argument("-r", "--repeat", type=int, default=5, help="Timed runs per benchmark (default: 5)")
+    parser.add_argument("--baseline", default=DEFAULT_BASELINE, help="Baseline file (default: benchmarks/baseline.json)")
+    parser.add_argument("--save-baseline", action="store_true", help="Write the results to the baseline file")
+    parser.add_argument("--compare", action="store_true", help="Compare the results against the baseline file")
+    parser.add_argument("--threshold", type=float, default=0.2,
+                        help="Relative slowdown or memory growth reported as a regression (default: 0.2)")
+    args = parser.parse_args(argv)
+
+    selected = [name for name in BENCHMARKS if args.filter in name]
+    results = run(selected, args.repeat)
+
+    exit_code = 0
+    if args.compare:
+        if not os.path.exists(args.baseline):
+            print(f"\nNo baseline at {args.baseline}; run with --save-baseline first")
+            exit_code = 2
+        else:
+            with open(args.baseline) as f:
+                baseline = json.load(f)["results"]
+            regressions = compare(results, baseline, args.threshold)
+            if regressions:
+                print(f"\n{len(regressions)} regression(s)")
+                exit_code = 1
+
+    if args.save_baseline:
+        # Merge, so saving a filtered run only replaces the benchmarks that ran
+        saved = {}
+        if os.path.exists(args.baseline):
+            with open(args.baseline) as f:
+                saved = json.load(f)["results"]
+        saved.update(results)
+        with open(args.baseline, "w") as f:
+            json.dump({
+                "python": platform.python_version(),
+                "machine": platform.platform(),
+                "created": time.strftime("%Y-%m-%dT%H:%M:%S"),
+                "results": saved,
+            }, f, indent=2)
+        print(f"\nBaseline saved to {args.baseline}")
+    return exit_code
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,114 @@
+"""
+Startup budget for short-lived scripts that import the generator.
+
+Usage:
+    python benchmarks/startup.py                    # measure and check against the default budgets
+    python benchmarks/startup.py --import-budget 20 --script-budget 60 -r 20
+
+Every measurement runs in a fresh interpreter, like a serverless job would:
+  * import: cumulative time of `import enduWorkoutGen.workoutgen` as reported by -X importtime
+  * script: wall time of a main.py-style script (generate, name, render MRC and ZWO)
+    minus the wall time of an empty interpreter
+It also checks that the generator's import path doesn't pull in the optional extras.
+Exits with 1 when a budget is exceeded or a heavy module leaks into the import.
+"""
+import argparse
+import os
+import statistics
+import subprocess
+import sys
+import time
+from typing import List
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+# Optional extras that must stay out of `import enduWorkoutGen.workoutgen`
+HEAVY_MODULES = ("numpy", "dash", "plotly", "flask", "dash_bootstrap_components", "cProfile", "xml.sax")
+
+SCRIPT = """
+from enduWorkoutGen.workoutgen import WorkoutGenerator, WorkoutParameters, WorkoutSegment, WorkoutType
+generator = WorkoutGenerator()
+params = WorkoutParameters(
+    segments=[WorkoutSegment(WorkoutType.TEMPO, 20), WorkoutSegment(WorkoutType.VO2, 15),
+              WorkoutSegment(WorkoutType.THRESHOLD, 25)],
+    total_duration_minutes=60
+)
+intervals = generator.generate_workout(params)
+name = generator.generate_workout_name(params)
+description = generator.create_workout_description(params)
+generator.render_mrc(intervals, description, generator.create_filename(name))
+generator.render_zwo(intervals, name, description=description)
+generator.calculate_metrics(intervals)
+"""
+
+
+def _env() -> dict:
+    env = dict(os.environ, PYTHONPATH=ROOT)
+    # Measure with bytecode caching, as an installed package would run
+    env.pop("PYTHONDONTWRITEBYTECODE", None)
+    return env
+
+
+def _run(args: List[str]) -> subprocess.CompletedProcess:
+    return subprocess.run([sys.executable, *args], cwd=ROOT, env=_env(), capture_output=True, text=True,
+                          check=True)
+
+
+def import_time(module: str) -> float:
+    """Cumulative import time of module in seconds, from -X importtime"""
+    stderr = _run(["-X", "importtime", "-c", f"import {module}"]).stderr
+    for line in stderr.splitlines():
+        fields = line.split("|")
+        if len(fields) == 3 and fields[2].strip() == module:
+            return int(fields[1]) / 1e6
+    raise RuntimeError(f"{module} not found in -X importtime output")
+
+
+def wall_time(code: str) -> float:
+    start = time.perf_counter()
+    _run(["-c", code])
+    return time.perf_counter() - start
+
+
+def leaked_modules(module: str) -> List[str]:
+    code = f"import sys, {module}; print(' '.join(m for m in {HEAVY_MODULES!r} if m in sys.modules))"
+    return _run(["-c", code]).stdout.split()
+
+
+def main(argv=None) -> int:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("-r", "--repeat", type=int, default=10, help="Fresh interpreters per measurement (default: 10)")
+    parser.add_argument("--import-budget", type=float, default=25,
+                        help="Budget for importing the generator in ms (default: 25)")
+    parser.add_argument("--script-budget", type=float, default=50,
+                        help="Budget for a main.py-style script on top of the interpreter in ms (default: 50)")
+    args = parser.parse_args(argv)
+
+    module = "enduWorkoutGen.workoutgen"
+    wall_time(SCRIPT)  # warm-up, also writes the bytecode caches
+
+    imports = [import_time(module) for _ in range(args.repeat)]
+    interpreter = [wall_time("pass") for _ in range(args.repeat)]
+    script = [wall_time(SCRIPT) for _ in range(args.repeat)]
+    import_ms = statistics.median(imports) * 1e3
+    interpreter_ms = statistics.median(interpreter) * 1e3
+    script_ms = statistics.median(script) * 1e3 - interpreter_ms
+
+    exit_code = 0
+    print(f"{'empty interpreter':<32} {interpreter_ms:8.1f} ms")
+    for label, value, budget in ((f"import {module}", import_ms, args.import_budget),
+                                 ("main.py-style script", script_ms, args.script_budget)):
+        flag = "ok" if value <= budget else "OVER BUDGET"
+        print(f"{label:<32} {value:8.1f} ms  (budget {budget:.0f} ms)  {flag}")
+        if value > budget:
+            exit_code = 1
+
+    leaked = leaked_modules(module)
+    if leaked:
+        print(f"Optional extras imported by {module}: {', '.join(leaked)}")
+        exit_code = 1
+    return exit_code
+
+
+if __name__ == "__main__":
+    sys.exit(main())
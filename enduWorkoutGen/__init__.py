@@ -0,0 +1,28 @@
+"""
+Public names are resolved lazily, so `import enduWorkoutGen` stays cheap and the
+dashboard (Dash, Plotly) and NumPy-backed metrics are only imported when used.
+"""
+import importlib
+
+_LAZY_ATTRIBUTES = {
+    "WorkoutGenerator": "enduWorkoutGen.workoutgen",
+    "WorkoutParameters": "enduWorkoutGen.workoutgen",
+    "WorkoutSegment": "enduWorkoutGen.workoutgen",
+    "WorkoutType": "enduWorkoutGen.workoutgen",
+    "IntervalTable": "enduWorkoutGen.workoutgen",
+    "compute_metrics": "enduWorkoutGen.metrics",
+    "WorkoutDashboard": "enduWorkoutGen.workout_dashboard",
+}
+
+__all__ = list(_LAZY_ATTRIBUTES)
+
+
+def __getattr__(name):
+    module = _LAZY_ATTRIBUTES.get(name)
+    if module is None:
+        raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
+    return getattr(importlib.import_module(module), name)
+
+
+def __dir__():
+    return sorted(list(globals()) + __all__)
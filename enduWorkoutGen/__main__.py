@@ -0,0 +1,3 @@
+from enduWorkoutGen.cli import main
+
+main()
@@ -0,0 +1,126 @@
+import hashlib
+from typing import Iterable, List, Sequence, Tuple
+
+import numpy as np
+
+from enduWorkoutGen.workoutgen import IntervalTable, IntervalsLike
+
+# Default grid: whole % of FTP and whole seconds, so the canonical form only merges, it doesn't quantize
+DEFAULT_POWER_STEP = 1
+DEFAULT_TIME_STEP = 1
+
+
+def _snap(values: np.ndarray, step: int) -> np.ndarray:
+    """Round to the nearest multiple of step (halves up)"""
+    return values if step == 1 else (values + step // 2) // step * step
+
+
+def _canonical_columns(workouts: Sequence[IntervalsLike], power_step: int, time_step: int):
+    """Canonical (starts, ends, powers) of many workouts at once, and the offset of each workout's rows"""
+    if power_step < 1 or time_step < 1:
+        raise ValueError("grid steps must be at least 1")
+    tables = [IntervalTable.from_intervals(workout) for workout in workouts]
+    counts = np.fromiter((len(table) for table in tables), dtype=np.int64, count=len(tables))
+    starts, ends, powers = (
+        _snap(np.frombuffer(b"".join(getattr(table, name).tobytes() for table in tables), dtype=np.intc)
+              .astype(np.int64), step)
+        for name, step in (("starts", time_step), ("ends", time_step), ("powers", power_step)))
+    workout_ids = np.repeat(np.arange(len(tables)), counts)
+    keep = ends > starts
+    starts, ends, powers, workout_ids = starts[keep], ends[keep], powers[keep], workout_ids[keep]
+
+    # A run starts at every workout's first interval and wherever the power changes or there's a gap
+    new_run = np.ones(len(starts), dtype=bool)
+    new_run[1:] = (powers[1:] != powers[:-1]) | (starts[1:] != ends[:-1]) | (workout_ids[1:] != workout_ids[:-1])
+    run_ends = np.ones(len(starts), dtype=bool)
+    run_ends[:-1] = new_run[1:]
+    first, last = np.flatnonzero(new_run), np.flatnonzero(run_ends)
+    offsets = np.concatenate([[0], np.cumsum(np.bincount(workout_ids[first], minlength=len(tables)))])
+    return (*(column.astype(np.intc) for column in (starts[first], ends[last], powers[first])), offsets)
+
+
+def canonicalize(intervals: IntervalsLike, power_step: int = DEFAULT_POWER_STEP,
+                 time_step: int = DEFAULT_TIME_STEP) -> IntervalTable:
+    """
+    Canonical form of a workout: run-length encoded on a power/time grid.
+
+    Powers and interval boundaries are snapped to multiples of power_step (% of FTP) and
+    time_step (seconds), intervals left empty are dropped and adjacent intervals of equal
+    power are merged. On the default grid the power profile stays exactly the same, it
+    just takes fewer intervals.
+    """
+    starts, ends, powers, _ = _canonical_columns([intervals], power_step, time_step)
+    return IntervalTable.from_buffers(starts, ends, powers)
+
+
+def _digest(starts: np.ndarray, ends: np.ndarray, powers: np.ndarray) -> str:
+    # The bytes of IntervalTable.tobytes(), without building the table
+    return hashlib.blake2b(starts.tobytes() + ends.tobytes() + powers.tobytes(), digest_size=16).hexdigest()
+
+
+def fingerprints(workouts: Sequence[IntervalsLike], power_step: int = DEFAULT_POWER_STEP,
+                 time_step: int = DEFAULT_TIME_STEP) -> List[str]:
+    """
+    Hashes of the canonical forms: workouts that are the same on the grid get the same fingerprint.
+
+    All workouts are canonicalized in one vectorized pass; only the hashing is per workout.
+    """
+    starts, ends, powers, offsets = _canonical_columns(workouts, power_step, time_step)
+    return [_digest(starts[a:b], ends[a:b], powers[a:b]) for a, b in zip(offsets[:-1], offsets[1:])]
+
+
+def canonicalize_batch(workouts: Sequence[IntervalsLike], power_step: int = DEFAULT_POWER_STEP,
+                       time_step: int = DEFAULT_TIME_STEP) -> List[Tuple[IntervalTable, str]]:
+    """Canonical form and fingerprint of every workout, from the same vectorized pass as fingerprints"""
+    starts, ends, powers, offsets = _canonical_columns(workouts, power_step, time_step)
+    return [(IntervalTable.from_buffers(starts[a:b], ends[a:b], powers[a:b]),
+             _digest(starts[a:b], ends[a:b], powers[a:b]))
+            for a, b in zip(offsets[:-1], offsets[1:])]
+
+
+def fingerprint(intervals: IntervalsLike, power_step: int = DEFAULT_POWER_STEP,
+                time_step: int = DEFAULT_TIME_STEP) -> str:
+    """Hash of the canonical form of one workout, see fingerprints"""
+    return fingerprints([intervals], power_step, time_step)[0]
+
+
+class Deduplicator:
+    """
+    Remembers the fingerprints it has seen, to drop workouts that are duplicates on its grid.
+
+    A coarser grid (e.g. power_step=5, time_step=30) also catches workouts that only
+    differ by a few % or seconds here and there.
+    """
+
+    def __init__(self, power_step: int = DEFAULT_POWER_STEP, time_step: int = DEFAULT_TIME_STEP,
+                 seen: Iterable[str] = ()):
+        self.power_step = power_step
+        self.time_step = time_step
+        self.seen = set(seen)
+        self.dropped = 0
+
+    def fingerprint(self, intervals: IntervalsLike) -> str:
+        return fingerprint(intervals, self.power_step, self.time_step)
+
+    def add(self, intervals: IntervalsLike) -> bool:
+        """Remember a workout, False if an equivalent one was seen before"""
+        key = self.fingerprint(intervals)
+        if key in self.seen:
+            self.dropped += 1
+            return False
+        self.seen.add(key)
+        return True
+
+    def unique(self, workouts: Sequence[IntervalsLike]) -> List[int]:
+        """Indices of the workouts that are new, the first of each group of duplicates"""
+        new = []
+        for i, key in enumerate(fingerprints(workouts, self.power_step, self.time_step)):
+            if key in self.seen:
+                self.dropped += 1
+            else:
+                self.seen.add(key)
+                new.append(i)
+        return new
+
+    def __len__(self):
+        return len(self.seen)
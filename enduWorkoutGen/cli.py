@@ -0,0 +1,269 @@
+import argparse
+import itertools
+import os
+import random
+import time
+from dataclasses import dataclass
+from typing import List, Optional, Sequence, Tuple
+
+from enduWorkoutGen.exporters import EXPORTERS, ExportInfo
+from enduWorkoutGen.generation_cache import GenerationCache
+from enduWorkoutGen.workoutgen import (IntervalTable, WorkoutGenerator, WorkoutParameters, WorkoutSegment,
+                                       WorkoutType, derive_seed)
+
+DEFAULT_FORMATS = ("mrc", "zwo")
+
+
+@dataclass(frozen=True)
+class GenerationJob:
+    workout_types: Tuple[WorkoutType, ...]
+    duration_minutes: int
+    variant: int
+    seed: int
+
+    def parameters(self) -> WorkoutParameters:
+        # Split the duration evenly across the segments
+        segment_minutes = self.duration_minutes // len(self.workout_types)
+        return WorkoutParameters(
+            segments=[WorkoutSegment(wt, segment_minutes) for wt in self.workout_types],
+            total_duration_minutes=self.duration_minutes
+        )
+
+    @property
+    def file_stem(self) -> str:
+        # Unique per job and the same on every run, e.g. "tempo-vo2_60min_v3"
+        return f"{'-'.join(wt.value for wt in self.workout_types)}_{self.duration_minutes}min_v{self.variant + 1}"
+
+
+def build_jobs(workout_types: Sequence[WorkoutType], durations: Sequence[int], variants: int,
+               max_segments: int, base_seed: int) -> List[GenerationJob]:
+    """
+    Builds one job per type combination x duration x variant.
+
+    Every job gets its own seed derived from the base seed and the job itself, so
+    the library is reproducible regardless of worker count or scheduling order.
+    """
+    jobs = []
+    for size in range(1, max_segments + 1):
+        for combination in itertools.combinations(workout_types, size):
+            for duration in durations:
+                for variant in range(variants):
+                    seed = derive_seed(base_seed, tuple(wt.value for wt in combination), duration, variant)
+                    jobs.append(GenerationJob(combination, duration, variant, seed))
+    return jobs
+
+
+Grid = Tuple[int, int]  # (power step, time step) of canonical.canonicalize
+
+_generator: Optional[WorkoutGenerator] = None
+
+
+def _get_generator(cache_dir: Optional[str]) -> WorkoutGenerator:
+    global _generator
+    if _generator is None:
+        # With a cache directory, rebuilding a library reuses the intervals and files of earlier runs
+        _generator = WorkoutGenerator(cache=GenerationCache(directory=cache_dir) if cache_dir else None)
+    return _generator
+
+
+def _fingerprint_chunk(jobs: Sequence[GenerationJob], grid: Grid,
+                       cache_dir: Optional[str] = None) -> List[Tuple[str, bytes]]:
+    """
+    (fingerprint, packed canonical intervals) of the workouts of jobs on grid, without exporting
+    anything; the intervals are handed to the export pass so no workout is generated twice
+    """
+    from enduWorkoutGen.canonical import canonicalize_batch
+
+    generator = _get_generator(cache_dir)
+    workouts = [generator.generate_workout(job.parameters(), seed=job.seed) for job in jobs]
+    return [(key, table.tobytes()) for table, key in canonicalize_batch(workouts, *grid)]
+
+
+def dedup_jobs(jobs: Sequence, fingerprints: Sequence[str]) -> list:
+    """
+    The first job (or (job, intervals) pair) of every fingerprint, in job order, so the
+    result doesn't depend on the workers
+    """
+    seen = set()
+    kept = []
+    for job, key in zip(jobs, fingerprints):
+        if key not in seen:
+            seen.add(key)
+            kept.append(job)
+    return kept
+
+
+def run_job(job: GenerationJob, output_dir: str, formats: Sequence[str], cache_dir: Optional[str] = None,
+            ftp: Optional[float] = None, grid: Optional[Grid] = None, overwrite: bool = False,
+            intervals: Optional[IntervalTable] = None) -> Tuple[IntervalTable, str, str, int, int]:
+    """
+    Generate and export one workout, returns (intervals, name, description, files written, files skipped).
+
+    Files are named after the job (GenerationJob.file_stem). Existing files are skipped
+    unless overwrite is set. With grid, the workout is written in its canonical form on
+    that grid (see canonical.canonicalize). Intervals that were already generated (and
+    canonicalized, with grid) are written as they are.
+    """
+    generator = _get_generator(cache_dir)
+    params = job.parameters()
+    if intervals is None:
+        intervals = generator.generate_workout(params, seed=job.seed)
+        if grid is not None:
+            from enduWorkoutGen.canonical import canonicalize
+            intervals = canonicalize(intervals, *grid)
+    # No date in the name: it ends up in the files, which should be the same on every run
+    workout_name = f"{generator.generate_workout_name(params, seed=job.seed, dated=False)}_v{job.variant + 1}"
+    description = generator.create_workout_description(params)
+
+    # All formats in one pass over the intervals
+    file_names = {file_type: generator.create_filename(job.file_stem, file_type) for file_type in formats}
+    files = generator.render(intervals, formats, ExportInfo(workout_name, description, ftp=ftp), file_names)
+    written = 0
+    for file_type, content in files.items():
+        try:
+            with open(os.path.join(output_dir, file_names[file_type]), "wb" if overwrite else "xb") as f:
+                f.write(content)
+        except FileExistsError:
+            continue
+        written += 1
+    return intervals, workout_name, description, written, len(files) - written
+
+
+def _run_chunk(jobs: Sequence[Tuple[GenerationJob, Optional[bytes]]], output_dir: str, formats: Sequence[str],
+               cache_dir: Optional[str] = None, collect: bool = False, ftp: Optional[float] = None,
+               grid: Optional[Grid] = None, overwrite: bool = False) -> Tuple[int, int, int, list]:
+    """
+    Run (job, packed intervals or None to generate them) pairs, returns (intervals, files written,
+    files skipped, [(job, name, description, packed intervals)] if collect)
+    """
+    interval_count = file_count = skipped_count = 0
+    collected = []
+    for job, packed in jobs:
+        intervals, workout_name, description, files, skipped = run_job(
+            job, output_dir, formats, cache_dir, ftp, grid, overwrite,
+            IntervalTable.frombytes(packed) if packed is not None else None)
+        interval_count += len(intervals)
+        file_count += files
+        skipped_count += skipped
+        if collect:
+            collected.append((job, workout_name, description, intervals.tobytes()))
+    return interval_count, file_count, skipped_count, collected
+
+
+def _positive_int(value: str) -> int:
+    """argparse type for counts and steps that must be at least 1"""
+    try:
+        number = int(value)
+    except ValueError:
+        raise argparse.ArgumentTypeError(f"invalid int value: {value!r}")
+    if number < 1:
+        raise argparse.ArgumentTypeError(f"must be at least 1, got {number}")
+    return number
+
+
+def parse_args(argv: Optional[Sequence[str]] = None) -> argparse.Namespace:
+    parser = argparse.ArgumentParser(
+        prog="workoutgen",
+        description="Generate a library of workouts (type combinations x durations x variants) in parallel."
+    )
+    parser.add_argument("-o", "--output", default="workouts", help="Output directory (default: workouts)")
+    parser.add_argument("-t", "--types", nargs="+", choices=[wt.value for wt in WorkoutType],
+                        default=[wt.value for wt in WorkoutType], help="Workout types to combine (default: all)")
+    parser.add_argument("-d", "--durations", nargs="+", type=int, default=[60],
+                        help="Total durations in minutes (default: 60)")
+    parser.add_argument("-k", "--variants", type=int, default=1, help="Variants per combination and duration")
+    parser.add_argument("--max-segments", type=int, default=1,
+                        help="Combine up to this many distinct types per workout (default: 1)")
+    parser.add_argument("-f", "--formats", nargs="+", choices=sorted(EXPORTERS), default=list(DEFAULT_FORMATS),
+                        help="File formats to write (default: mrc zwo)")
+    parser.add_argument("--ftp", type=float, default=None, help="FTP in watts for .erg files (default: 250)")
+    parser.add_argument("-j", "--workers", type=_positive_int, default=os.cpu_count() or 1,
+                        help="Worker processes (default: CPU count)")
+    parser.add_argument("--seed", type=int, default=None, help="Base seed, printed when omitted")
+    parser.add_argument("--cache-dir", default=None,
+                        help="Cache generated workouts and rendered files here, shared by all workers")
+    parser.add_argument("--overwrite", action="store_true",
+                        help="Replace files that already exist in the output directory (default: skip them)")
+    parser.add_argument("--index", default=None,
+                        help="Also record every workout with its metrics in this SQLite workout index")
+    parser.add_argument("--dedup", action="store_true",
+                        help="Skip workouts that are the same as an earlier one on the --power-step/--time-step grid, "
+                             "and write the rest in canonical form (equal adjacent intervals merged)")
+    parser.add_argument("--power-step", type=_positive_int, default=1,
+                        help="With --dedup, round powers to multiples of this many %% of FTP (default: 1)")
+    parser.add_argument("--time-step", type=_positive_int, default=1,
+                        help="With --dedup, round interval boundaries to multiples of this many seconds (default: 1)")
+    parser.add_argument("--list-types", action="store_true", help="Describe the workout types and exit")
+    return parser.parse_args(argv)
+
+
+def main(argv: Optional[Sequence[str]] = None):
+    args = parse_args(argv)
+    if args.list_types:
+        WorkoutType.list_workout_types()
+        return
+
+    base_seed = args.seed if args.seed is not None else random.SystemRandom().randrange(2 ** 32)
+    jobs = build_jobs([WorkoutType(t) for t in args.types], args.durations, args.variants,
+                      args.max_segments, base_seed)
+    os.makedirs(args.output, exist_ok=True)
+    print(f"Generating {len(jobs)} workouts with {args.workers} workers (seed {base_seed})")
+
+    start = time.perf_counter()
+    collect = args.index is not None
+    grid = (args.power_step, args.time_step) if args.dedup else None
+    # A few chunks per worker keeps the pool busy without pickling every job separately
+    chunk_size = max(1, len(jobs) // (args.workers * 4))
+    executor = None
+    if args.workers > 1:
+        # Imported here: multiprocessing is a sizeable share of a single-worker run's startup
+        from concurrent.futures import ProcessPoolExecutor
+        executor = ProcessPoolExecutor(max_workers=args.workers)
+
+    def run_chunks(func, jobs, *shared):
+        if executor is None:
+            return [func(jobs, *shared)]
+        chunks = [jobs[i:i + chunk_size] for i in range(0, len(jobs), chunk_size)]
+        return list(executor.map(func, chunks, *(itertools.repeat(arg) for arg in shared)))
+
+    try:
+        if grid is not None:
+            # Fingerprint everything first, then export only the first of every group of duplicates,
+            # from the intervals the fingerprint pass already generated
+            found = [entry for entries in run_chunks(_fingerprint_chunk, jobs, grid, args.cache_dir)
+                     for entry in entries]
+            pending = dedup_jobs([(job, packed) for job, (_, packed) in zip(jobs, found)], [key for key, _ in found])
+            print(f"Skipping {len(jobs) - len(pending)} duplicate workouts")
+            jobs = [job for job, _ in pending]
+        else:
+            pending = [(job, None) for job in jobs]
+        results = run_chunks(_run_chunk, pending, args.output, args.formats, args.cache_dir, collect, args.ftp,
+                             grid, args.overwrite)
+    finally:
+        if executor is not None:
+            executor.shutdown()
+    interval_count = sum(r[0] for r in results)
+    file_count = sum(r[1] for r in results)
+    skipped_count = sum(r[2] for r in results)
+
+    if collect:
+        from enduWorkoutGen.workout_index import WorkoutIndex
+
+        # SQLite is written from this process only; workers just hand back the packed intervals
+        index = WorkoutIndex(args.index)
+        added = index.add_many([
+            (job.parameters(), job.seed, workout_name, description, IntervalTable.frombytes(packed))
+            for r in results for job, workout_name, description, packed in r[3]
+        ], dedup=args.dedup)
+        index.close()
+        print(f"Indexed {sum(workout_id is not None for workout_id in added)} new workouts in {args.index}")
+    elapsed = time.perf_counter() - start
+
+    print(f"Wrote {file_count} files ({interval_count} intervals) to {args.output} in {elapsed:.2f}s")
+    if skipped_count:
+        print(f"Skipped {skipped_count} files that already existed (use --overwrite to replace them)")
+    print(f"Throughput: {len(jobs) / elapsed:.1f} workouts/s, {file_count / elapsed:.1f} files/s")
+
+
+if __name__ == "__main__":
+    main()
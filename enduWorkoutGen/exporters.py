@@ -0,0 +1,320 @@
+import io
+import struct
+import time
+from dataclasses import dataclass
+from typing import Callable, Dict, Iterator, List, Mapping, Optional, Sequence, Tuple, Type
+
+from enduWorkoutGen.workoutgen import IntervalTable, IntervalsLike
+
+
+@dataclass
+class ExportInfo:
+    name: str = "Workout"
+    description: str = ""
+    author: str = "Unknown"
+    ftp: Optional[float] = None  # watts, for formats in absolute power (ERG); metrics.DEFAULT_FTP if not given
+    created: Optional[float] = None  # Unix time stamped into FIT files, now if not given
+
+
+class Exporter:
+    """
+    One output format.
+
+    render() creates an exporter per requested format and feeds every interval to all
+    of them in a single pass over the interval table, then collects finish().
+    """
+    extension = ""
+
+    def __init__(self, info: ExportInfo, file_name: str):
+        self.info = info
+        self.file_name = file_name
+
+    def interval(self, start: int, end: int, power: int):
+        raise NotImplementedError
+
+    def finish(self) -> bytes:
+        raise NotImplementedError
+
+
+# File type -> exporter class; add formats with @register_exporter
+EXPORTERS: Dict[str, Type[Exporter]] = {}
+
+
+def register_exporter(file_type: str) -> Callable[[Type[Exporter]], Type[Exporter]]:
+    def register(cls):
+        EXPORTERS[file_type] = cls
+        return cls
+    return register
+
+
+def render(intervals: IntervalsLike, formats: Sequence[str], info: Optional[ExportInfo] = None,
+           file_names: Optional[Mapping[str, str]] = None) -> Dict[str, bytes]:
+    """
+    Serialize a workout to several formats in one pass over its intervals.
+
+    Args:
+        intervals (IntervalsLike): Workout intervals.
+        formats (Sequence[str]): File types from EXPORTERS, e.g. ["mrc", "zwo", "erg", "fit"].
+        info (Optional[ExportInfo]): Name, description, author and FTP.
+        file_names (Optional[Mapping[str, str]]): File name written into a format's header
+            (MRC/ERG), info.name plus the extension by default.
+
+    Returns:
+        Dict[str, bytes]: Encoded file content per file type.
+    """
+    info = info or ExportInfo()
+    exporters = {}
+    for file_type in formats:
+        cls = EXPORTERS.get(file_type)
+        if cls is None:
+            raise ValueError(f"unknown export format: {file_type}")
+        exporters[file_type] = cls(info, (file_names or {}).get(file_type) or f"{info.name}.{cls.extension}")
+
+    handlers = [exporter.interval for exporter in exporters.values()]
+    table = IntervalTable.from_intervals(intervals)
+    for start, end, power in zip(table.starts, table.ends, table.powers):
+        for handler in handlers:
+            handler(start, end, power)
+    return {file_type: exporter.finish() for file_type, exporter in exporters.items()}
+
+
+def zip_bundle(files: Mapping[str, bytes], stem: str) -> bytes:
+    """In-memory ZIP with one <stem>.<extension> entry per rendered file type"""
+    import zipfile
+
+    buffer = io.BytesIO()
+    with zipfile.ZipFile(buffer, "w", zipfile.ZIP_DEFLATED) as bundle:
+        for file_type, content in files.items():
+            bundle.writestr(f"{stem}.{EXPORTERS[file_type].extension}", content)
+    return buffer.getvalue()
+
+
+@register_exporter("mrc")
+class MrcExporter(Exporter):
+    """Course file with power in % of FTP; every interval is a flat step with a point at each end"""
+    extension = "mrc"
+    columns = "MINUTES PERCENT"
+
+    def __init__(self, info: ExportInfo, file_name: str):
+        super().__init__(info, file_name)
+        self.lines = [
+            "[COURSE HEADER]\n"
+            "VERSION = 2\n"
+            "UNITS = ENGLISH\n"
+            f"DESCRIPTION = {info.description}\n"
+            f"FILE NAME = {file_name}\n"
+            f"{self.extra_header()}"
+            f"{self.columns}\n"
+            "[END COURSE HEADER]\n\n"
+            "[COURSE DATA]\n"
+        ]
+
+    def extra_header(self) -> str:
+        return ""
+
+    def value(self, power: int):
+        return power
+
+    def interval(self, start: int, end: int, power: int):
+        value = self.value(power)
+        self.lines.append(f"{start / 60:.2f}\t{value}\n{end / 60:.2f}\t{value}\n")
+
+    def finish(self) -> bytes:
+        self.lines.append("[END COURSE DATA]\n")
+        return "".join(self.lines).encode()
+
+
+@register_exporter("erg")
+class ErgExporter(MrcExporter):
+    """MRC layout in absolute watts for the athlete's FTP, which goes into the header"""
+    extension = "erg"
+    columns = "MINUTES WATTS"
+
+    def __init__(self, info: ExportInfo, file_name: str):
+        if info.ftp is None:
+            from enduWorkoutGen.metrics import DEFAULT_FTP
+            self.ftp = DEFAULT_FTP
+        else:
+            self.ftp = info.ftp
+        super().__init__(info, file_name)
+
+    def extra_header(self) -> str:
+        return f"FTP = {self.ftp:g}\n"
+
+    def value(self, power: int):
+        return round(power * self.ftp / 100)
+
+
+class StepExporter(Exporter):
+    """Exporter that works on steps: adjacent intervals at the same power merged into (duration, power)"""
+
+    def __init__(self, info: ExportInfo, file_name: str):
+        super().__init__(info, file_name)
+        self.steps: List[Tuple[int, int]] = []
+
+    def interval(self, start: int, end: int, power: int):
+        if end <= start:
+            return
+        if self.steps and self.steps[-1][1] == power:
+            self.steps[-1] = (self.steps[-1][0] + end - start, power)
+        else:
+            self.steps.append((end - start, power))
+
+    def blocks(self) -> Iterator[Tuple[int, Tuple[int, int], Optional[Tuple[int, int]]]]:
+        """(repeat, on, off) blocks; runs of identical on/off pairs (like sprints and their recovery) collapse"""
+        steps = self.steps
+        i = 0
+        while i < len(steps):
+            on, off = steps[i], steps[i + 1] if i + 1 < len(steps) else None
+
+            # Count how many times the (on, off) pair repeats back to back
+            repeat = 1
+            while off is not None and steps[i + 2 * repeat:i + 2 * repeat + 2] == [on, off]:
+                repeat += 1
+
+            if repeat > 1:
+                yield repeat, on, off
+                i += 2 * repeat
+            else:
+                yield 1, on, None
+                i += 1
+
+
+def _xml_escape(text: str) -> str:
+    return text.replace("&", "&amp;").replace("<", "&lt;").replace(">", "&gt;")
+
+
+@register_exporter("zwo")
+class ZwoExporter(StepExporter):
+    """Zwift workout: SteadyState steps, repeated on/off pairs as IntervalsT"""
+    extension = "zwo"
+
+    def finish(self) -> bytes:
+        info = self.info
+        lines = [
+            '<?xml version="1.0" encoding="utf-8"?>\n',
+            '<workout_file>\n',
+            f'    <author>{_xml_escape(info.author)}</author>\n',
+            f'    <name>{_xml_escape(info.name)}</name>\n',
+            f'    <description>{_xml_escape(info.description)}</description>\n',
+            '    <sportType>bike</sportType>\n',
+            '    <workout>\n',
+        ]
+        for repeat, on, off in self.blocks():
+            if off is not None:
+                lines.append(
+                    f'        <IntervalsT Repeat="{repeat}" OnDuration="{on[0]}" OffDuration="{off[0]}" '
+                    f'OnPower="{on[1] / 100:.2f}" OffPower="{off[1] / 100:.2f}"/>\n'
+                )
+            else:
+                lines.append(f'        <SteadyState Duration="{on[0]}" Power="{on[1] / 100:.2f}"/>\n')
+        lines.append('    </workout>\n</workout_file>\n')
+        return "".join(lines).encode()
+
+
+# FIT profile values used by workout files
+_FIT_EPOCH = 631065600  # 1989-12-31T00:00:00Z as Unix time
+_FIT_PROTOCOL_VERSION = 0x20  # 2.0
+_FIT_PROFILE_VERSION = 2132  # 21.32
+_FIT_FILE_WORKOUT = 5
+_FIT_MANUFACTURER_DEVELOPMENT = 255
+_FIT_SPORT_CYCLING = 2
+_FIT_DURATION_TIME = 0  # milliseconds
+_FIT_DURATION_REPEAT_UNTIL_STEPS_COMPLETE = 6
+_FIT_TARGET_POWER = 4  # custom values 0-1000 are % of FTP
+_FIT_INTENSITY_ACTIVE, _FIT_INTENSITY_REST, _FIT_INTENSITY_WARMUP, _FIT_INTENSITY_COOLDOWN = 0, 1, 2, 3
+_FIT_MAX_NAME_BYTES = 63
+
+# (struct format, FIT base type) of the field types used here; invalid values mark unset fields
+_FIT_ENUM, _FIT_UINT16, _FIT_UINT32 = ("B", 0x00), ("H", 0x84), ("I", 0x86)
+_FIT_INVALID = {"B": 0xFF, "H": 0xFFFF, "I": 0xFFFFFFFF}
+
+
+def _fit_crc_byte(byte: int) -> int:
+    # The FIT SDK's CRC-16 (CRC-16/ARC), one byte at a time starting from 0
+    crc = byte
+    for _ in range(8):
+        crc = (crc >> 1) ^ 0xA001 if crc & 1 else crc >> 1
+    return crc
+
+
+_FIT_CRC_TABLE = tuple(_fit_crc_byte(byte) for byte in range(256))
+
+
+def _fit_crc(data: bytes, crc: int = 0) -> int:
+    table = _FIT_CRC_TABLE
+    for byte in data:
+        crc = (crc >> 8) ^ table[(crc ^ byte) & 0xFF]
+    return crc
+
+
+def _fit_definition(local_type: int, global_number: int, fields) -> bytes:
+    """Definition record for (number, type, value) fields; bytes values are null-terminated strings"""
+    record = bytearray(struct.pack("<BBBHB", 0x40 | local_type, 0, 0, global_number, len(fields)))
+    for number, field_type, value in fields:
+        if isinstance(value, bytes):
+            record += bytes([number, len(value), 0x07])
+        else:
+            record += bytes([number, struct.calcsize(field_type[0]), field_type[1]])
+    return bytes(record)
+
+
+def _fit_data(local_type: int, fields) -> bytes:
+    record = bytearray([local_type])
+    for _, field_type, value in fields:
+        if isinstance(value, bytes):
+            record += value
+        else:
+            fmt = field_type[0]
+            record += struct.pack("<" + fmt, _FIT_INVALID[fmt] if value is None else value)
+    return bytes(record)
+
+
+@register_exporter("fit")
+class FitExporter(StepExporter):
+    """
+    Binary FIT workout file (what Garmin and Wahoo head units load), with power targets
+    in % of FTP and repeated on/off pairs as repeat steps.
+    """
+    extension = "fit"
+
+    @staticmethod
+    def _step(index: int, duration_type: int, duration_value: int, target_type: Optional[int],
+              target_value: Optional[int], power: Optional[int], intensity: Optional[int]):
+        return [(254, _FIT_UINT16, index), (1, _FIT_ENUM, duration_type), (2, _FIT_UINT32, duration_value),
+                (3, _FIT_ENUM, target_type), (4, _FIT_UINT32, target_value),
+                (5, _FIT_UINT32, power), (6, _FIT_UINT32, power), (7, _FIT_ENUM, intensity)]
+
+    def finish(self) -> bytes:
+        steps = []  # fields of the workout_step messages
+        blocks = list(self.blocks())
+        for b, (repeat, on, off) in enumerate(blocks):
+            first = len(steps)
+            for duration, power in (on, off) if off is not None else (on,):
+                if len(blocks) > 1 and off is None and b in (0, len(blocks) - 1):
+                    intensity = _FIT_INTENSITY_WARMUP if b == 0 else _FIT_INTENSITY_COOLDOWN
+                else:
+                    intensity = _FIT_INTENSITY_REST if power <= 55 else _FIT_INTENSITY_ACTIVE
+                steps.append(self._step(len(steps), _FIT_DURATION_TIME, duration * 1000, _FIT_TARGET_POWER,
+                                        0, min(power, 1000), intensity))
+            if repeat > 1:
+                # Go back to the on step until the pair ran repeat times
+                steps.append(self._step(len(steps), _FIT_DURATION_REPEAT_UNTIL_STEPS_COMPLETE, first,
+                                        None, repeat, None, None))
+
+        name = self.info.name.encode()[:_FIT_MAX_NAME_BYTES].decode("utf-8", "ignore").encode() + b"\0"
+        created = int(self.info.created if self.info.created is not None else time.time()) - _FIT_EPOCH
+        file_id = [(0, _FIT_ENUM, _FIT_FILE_WORKOUT), (1, _FIT_UINT16, _FIT_MANUFACTURER_DEVELOPMENT),
+                   (2, _FIT_UINT16, 0), (4, _FIT_UINT32, created)]
+        workout = [(4, _FIT_ENUM, _FIT_SPORT_CYCLING), (6, _FIT_UINT16, len(steps)), (8, None, name)]
+        records = [_fit_definition(0, 0, file_id), _fit_data(0, file_id),
+                   _fit_definition(1, 26, workout), _fit_data(1, workout)]
+        if steps:
+            # All steps share one definition
+            records.append(_fit_definition(2, 27, steps[0]))
+            records.extend(_fit_data(2, fields) for fields in steps)
+        data = b"".join(records)
+
+        header = struct.pack("<BBHI4s", 14, _FIT_PROTOCOL_VERSION, _FIT_PROFILE_VERSION, len(data), b".FIT")
+        header += struct.pack("<H", _fit_crc(header))
+        return header + data + struct.pack("<H", _fit_crc(data, _fit_crc(header)))
@@ -0,0 +1,131 @@
+import threading
+from collections import OrderedDict
+from typing import Callable, Hashable, Optional, Sequence, Tuple
+
+import numpy as np
+import plotly.graph_objects as go
+
+from enduWorkoutGen.workoutgen import IntervalTable, IntervalsLike
+
+# Upper bound on points drawn per workout trace; longer profiles are reduced, so a single
+# workout stays a plain SVG Scatter (which, unlike Scattergl, draws hv steps)
+MAX_POINTS_PER_WORKOUT = 2000
+
+
+def step_points(intervals: IntervalsLike) -> Tuple[np.ndarray, np.ndarray]:
+    """
+    Points of the power profile as a step line, read straight from the interval columns.
+
+    With line_shape='hv' each step needs a single point at its start, so adjacent
+    intervals at the same power are merged and one closing point is added at the end.
+    Time is in minutes, power in % of FTP.
+    """
+    table = IntervalTable.from_intervals(intervals)
+    if not len(table):
+        return np.empty(0), np.empty(0)
+    starts, ends, powers = table.to_numpy()
+    keep = np.ones(len(powers), dtype=bool)
+    keep[1:] = powers[1:] != powers[:-1]
+    x = np.append(starts[keep], ends[-1]) / 60
+    y = np.append(powers[keep], powers[-1])
+    return x, y
+
+
+def reduce_points(x: np.ndarray, y: np.ndarray, max_points: int = MAX_POINTS_PER_WORKOUT
+                  ) -> Tuple[np.ndarray, np.ndarray]:
+    """
+    Downsample a profile to at most max_points, keeping the peaks.
+
+    Time is split into equal buckets and only the first and last point plus the lowest
+    and highest point of each bucket survive, so short sprints stay visible after reduction.
+    """
+    if len(x) <= max_points:
+        return x, y
+    buckets = max(1, (max_points - 2) // 2)
+    span = (x[-1] - x[0]) or 1
+    bucket = np.minimum(((x - x[0]) / span * buckets).astype(np.int64), buckets - 1)
+
+    # Sorted by bucket then power: the first point of a bucket is its minimum, the last its maximum
+    order = np.lexsort((y, bucket))
+    sorted_bucket = bucket[order]
+    first = np.flatnonzero(np.r_[True, sorted_bucket[1:] != sorted_bucket[:-1]])
+    last = np.r_[first[1:] - 1, len(order) - 1]
+    selected = np.unique(np.concatenate([order[first], order[last], [0, len(x) - 1]]))
+    return x[selected], y[selected]
+
+
+def _layout(fig: go.Figure, title: str):
+    fig.update_layout(
+        title=title,
+        xaxis_title='Time (minutes)',
+        yaxis_title='Power (% FTP)',
+        showlegend=True,
+        template='plotly_white'
+    )
+
+
+def build_power_figure(intervals: IntervalsLike, title: str = 'Workout Profile',
+                       max_points: int = MAX_POINTS_PER_WORKOUT) -> go.Figure:
+    """Power profile of one workout, reduced to at most max_points"""
+    x, y = reduce_points(*step_points(intervals), max_points)
+    fig = go.Figure(go.Scatter(x=x, y=y, mode='lines', line_shape='hv', name='Power'))
+    _layout(fig, title)
+    return fig
+
+
+def build_overlay_figure(workouts: Sequence[IntervalsLike], title: str = 'Candidate Workouts',
+                         highlight: Optional[IntervalsLike] = None,
+                         max_points_per_workout: int = 200) -> go.Figure:
+    """
+    Overlay many candidate workouts in a single WebGL trace.
+
+    All profiles are concatenated with NaN gaps between them, so the browser draws one
+    trace no matter how many candidates there are. Scattergl has no step shape, so each
+    step is written as two points, after reducing every profile to max_points_per_workout.
+    """
+    xs, ys = [], []
+    gap = np.array([np.nan])
+    for workout in workouts:
+        x, y = reduce_points(*step_points(workout), max_points_per_workout)
+        xs.extend([np.repeat(x, 2)[1:], gap])
+        ys.extend([np.repeat(y, 2)[:-1], gap])
+
+    fig = go.Figure(go.Scattergl(
+        x=np.concatenate(xs) if xs else [],
+        y=np.concatenate(ys) if ys else [],
+        mode='lines',
+        line=dict(width=1),
+        opacity=0.25,
+        name=f'{len(workouts)} candidates'
+    ))
+    if highlight is not None:
+        x, y = step_points(highlight)
+        fig.add_trace(go.Scattergl(x=np.repeat(x, 2)[1:], y=np.repeat(y, 2)[:-1], mode='lines',
+                                   line=dict(width=3), name='Selected'))
+    _layout(fig, title)
+    return fig
+
+
+class FigureCache:
+    """Small thread-safe LRU of built figures, keyed by workout id"""
+
+    def __init__(self, max_entries: int = 128):
+        self.max_entries = max_entries
+        self._figures: "OrderedDict[Hashable, go.Figure]" = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get_or_build(self, key: Hashable, build: Callable[[], go.Figure]) -> go.Figure:
+        with self._lock:
+            fig = self._figures.get(key)
+            if fig is not None:
+                self._figures.move_to_end(key)
+                return fig
+        fig = build()
+        with self._lock:
+            self._figures[key] = fig
+            while len(self._figures) > self.max_entries:
+                self._figures.popitem(last=False)
+        return fig
+
+    def __len__(self):
+        return len(self._figures)
@@ -0,0 +1,169 @@
+import hashlib
+import os
+import tempfile
+import threading
+from collections import OrderedDict
+from typing import Callable, Optional
+
+from enduWorkoutGen.instrumentation import record_cache_lookup
+
+# Part of every key; bump it when generation or rendering changes, so stale disk entries are never read
+CACHE_VERSION = 1
+
+
+def cache_key(*parts) -> str:
+    """
+    Content address for a cached artifact.
+
+    Bytes parts (packed intervals) are hashed as they are, anything else through its
+    repr, each prefixed with its length so that different splits never collide.
+    """
+    digest = hashlib.blake2b(digest_size=16)
+    for part in (CACHE_VERSION,) + parts:
+        data = part if isinstance(part, bytes) else repr(part).encode()
+        digest.update(len(data).to_bytes(8, "little"))
+        digest.update(data)
+    return digest.hexdigest()
+
+
+class GenerationCache:
+    """
+    Two-tier cache of generated workouts, metrics and rendered exports, keyed by cache_key.
+
+    The in-process tier is an LRU bounded by max_entries and max_bytes. With a directory,
+    entries are also written to disk (atomically, so several processes can share it) and
+    the least recently used files are removed once they take more than max_disk_bytes.
+    Values are plain bytes; WorkoutGenerator decides what goes in.
+    """
+
+    def __init__(self, max_entries: int = 1024, max_bytes: int = 32 * 1024 * 1024,
+                 directory: Optional[str] = None, max_disk_bytes: int = 256 * 1024 * 1024):
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        self.directory = os.path.expanduser(directory) if directory is not None else None
+        self.max_disk_bytes = max_disk_bytes
+        self._entries: "OrderedDict[str, bytes]" = OrderedDict()
+        self._nbytes = 0
+        self._lock = threading.Lock()
+        self._disk_lock = threading.Lock()
+        self._disk_bytes = 0
+        if self.directory is not None:
+            os.makedirs(self.directory, exist_ok=True)
+            self._disk_bytes = sum(size for _, size, _ in self._disk_files())
+
+    key = staticmethod(cache_key)
+
+    def get(self, key: str) -> Optional[bytes]:
+        with self._lock:
+            data = self._entries.get(key)
+            if data is not None:
+                self._entries.move_to_end(key)
+        if data is not None:
+            record_cache_lookup("memory")
+            return data
+
+        data = self._read(key) if self.directory is not None else None
+        if data is None:
+            record_cache_lookup("miss")
+            return None
+        record_cache_lookup("disk")
+        self._remember(key, data)
+        return data
+
+    def put(self, key: str, data: bytes):
+        self._remember(key, data)
+        if self.directory is not None:
+            self._write(key, data)
+
+    def get_or_compute(self, key: str, compute: Callable[[], bytes]) -> bytes:
+        """Cached value for key, calling compute (outside any lock) on a miss"""
+        data = self.get(key)
+        if data is None:
+            data = compute()
+            self.put(key, data)
+        return data
+
+    @property
+    def nbytes(self) -> int:
+        return self._nbytes
+
+    @property
+    def disk_bytes(self) -> int:
+        return self._disk_bytes
+
+    def __len__(self):
+        return len(self._entries)
+
+    def __contains__(self, key):
+        return key in self._entries
+
+    def _remember(self, key: str, data: bytes):
+        with self._lock:
+            previous = self._entries.pop(key, None)
+            if previous is not None:
+                self._nbytes -= len(previous)
+            self._entries[key] = data
+            self._nbytes += len(data)
+            while self._entries and (len(self._entries) > self.max_entries or self._nbytes > self.max_bytes):
+                self._nbytes -= len(self._entries.popitem(last=False)[1])
+
+    def _path(self, key: str) -> str:
+        # Fan out over 256 subdirectories to keep directory listings short
+        return os.path.join(self.directory, key[:2], key)
+
+    def _read(self, key: str) -> Optional[bytes]:
+        path = self._path(key)
+        try:
+            with open(path, "rb") as f:
+                data = f.read()
+            os.utime(path)  # the file's mtime is its last use, for LRU eviction
+        except OSError:
+            return None
+        return data
+
+    def _write(self, key: str, data: bytes):
+        path = self._path(key)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        fd, tmp_path = tempfile.mkstemp(dir=os.path.dirname(path), prefix=".tmp-")
+        try:
+            with os.fdopen(fd, "wb") as f:
+                f.write(data)
+            os.replace(tmp_path, path)
+        except OSError:
+            # The disk tier is best effort; the value is still in memory
+            if os.path.exists(tmp_path):
+                os.remove(tmp_path)
+            return
+        with self._disk_lock:
+            self._disk_bytes += len(data)
+            if self._disk_bytes > self.max_disk_bytes:
+                self._evict_disk()
+
+    def _disk_files(self):
+        for entry in os.scandir(self.directory):
+            if not entry.is_dir():
+                continue
+            for file in os.scandir(entry.path):
+                if file.name.startswith(".tmp-"):
+                    continue
+                try:
+                    stat = file.stat()
+                except OSError:  # removed by another process meanwhile
+                    continue
+                yield stat.st_mtime, stat.st_size, file.path
+
+    def _evict_disk(self):
+        # Caller holds the disk lock. Rescan, since other processes may share the directory,
+        # and remove the oldest files until 90% of the budget so eviction doesn't run on every write
+        files = sorted(self._disk_files())
+        total = sum(size for _, size, _ in files)
+        target = self.max_disk_bytes * 9 // 10
+        for _, size, path in files:
+            if total <= target:
+                break
+            try:
+                os.remove(path)
+            except OSError:
+                continue
+            total -= size
+        self._disk_bytes = total
@@ -0,0 +1,196 @@
+import os
+from array import array
+from contextlib import nullcontext
+from dataclasses import dataclass
+from typing import IO, Iterator, Optional, Tuple, Union
+
+from enduWorkoutGen.workoutgen import IntervalTable
+
+# Ramps (ZWO Warmup/Cooldown/Ramp, sloped MRC segments) become flat steps of at most this many seconds
+RAMP_STEP_SECONDS = 10
+
+# Zwift doesn't set a target in FreeRide/MaxEffort blocks; they are counted as easy spinning
+FREE_RIDE_POWER = 50
+
+ImportSource = Union[str, os.PathLike, IO]
+
+# MRC/ERG header keys; a multi-line DESCRIPTION runs until one of them, the columns or the end of the header
+MRC_HEADER_KEYS = frozenset({"VERSION", "UNITS", "DESCRIPTION", "FILE NAME", "FTP"})
+MRC_COLUMNS = frozenset({"MINUTES PERCENT", "MINUTES WATTS"})
+
+
+@dataclass
+class ImportedWorkout:
+    name: str
+    description: str
+    file_type: str
+    intervals: IntervalTable
+
+
+def _open(source: ImportSource, binary: bool):
+    if isinstance(source, (str, os.PathLike)):
+        return open(source, "rb") if binary else open(source, "r", encoding="utf-8", errors="replace")
+    return nullcontext(source)  # the caller's stream, left open
+
+
+def _source_name(source: ImportSource) -> Tuple[str, str]:
+    """(stem, lower-case extension) of the file behind source, empty for anonymous streams"""
+    name = os.fspath(source) if isinstance(source, (str, os.PathLike)) else getattr(source, "name", "")
+    if not isinstance(name, str):
+        return "", ""
+    stem, extension = os.path.splitext(os.path.basename(name))
+    return stem, extension.lower()
+
+
+def _append_segment(table: IntervalTable, start: int, end: int, power_start: float, power_end: float):
+    """Append a flat or sloped segment, splitting slopes into steps at their mid-point power"""
+    if end <= start:
+        return
+    if power_start == power_end:
+        table.append(start, end, round(power_start))
+        return
+    steps = -(-(end - start) // RAMP_STEP_SECONDS)
+    for k in range(steps):
+        step_start = start + (end - start) * k // steps
+        step_end = start + (end - start) * (k + 1) // steps
+        middle = (step_start + step_end) / 2
+        fraction = (middle - start) / (end - start)
+        table.append(step_start, step_end, round(power_start + (power_end - power_start) * fraction))
+
+
+def _ends_description(upper: str) -> bool:
+    """Whether an upper-cased header line is no longer part of a multi-line DESCRIPTION"""
+    if upper in ("[END COURSE HEADER]", "[COURSE DATA]") or " ".join(upper.split()) in MRC_COLUMNS:
+        return True
+    return "=" in upper and upper.split("=", 1)[0].strip() in MRC_HEADER_KEYS
+
+
+def _mrc_points(lines: Iterator[str], header: dict) -> Iterator[Tuple[float, float]]:
+    """(minutes, value) points of the [COURSE DATA] block; header lines are collected into header"""
+    in_data = False
+    key = None
+    for line in lines:
+        line = line.strip()
+        upper = line.upper()
+        if in_data:
+            if upper == "[END COURSE DATA]":
+                return
+            fields = line.split()
+            if len(fields) >= 2 and not line.startswith(";"):
+                yield float(fields[0]), float(fields[1])
+        elif key == "DESCRIPTION" and not _ends_description(upper):
+            # export_mrc writes multi-line descriptions as they are, "=" and all
+            header[key] += "\n" + line
+        elif upper == "[COURSE DATA]":
+            in_data = True
+        elif upper.startswith("MINUTES"):
+            header["COLUMNS"] = upper  # "MINUTES PERCENT" or "MINUTES WATTS"
+            key = None
+        elif "=" in line:
+            key, value = line.split("=", 1)
+            key = key.strip().upper()
+            header[key] = value.strip()
+        else:
+            key = None
+
+
+def read_mrc(source: ImportSource, ftp: Optional[float] = None) -> ImportedWorkout:
+    """
+    Stream an .mrc (or .erg) file into an interval table, line by line.
+
+    Points are (minutes, power); equal consecutive powers form a flat interval, points
+    at the same time switch power, and anything else is a ramp. Files in WATTS are
+    converted to % of FTP with the file's FTP header, or ftp when it has none.
+    """
+    header = {}
+    table = IntervalTable()
+    with _open(source, binary=False) as f:  # a text stream; iterating it reads one line at a time
+        previous = None
+        for minutes, value in _mrc_points(iter(f), header):
+            point = (round(minutes * 60), value)
+            if previous is not None:
+                _append_segment(table, previous[0], point[0], previous[1], point[1])
+            previous = point
+
+    if "WATTS" in header.get("COLUMNS", ""):
+        ftp = float(header.get("FTP", 0)) or ftp
+        if not ftp:
+            raise ValueError("workout is in watts but has no FTP header; pass ftp")
+        # Convert once at the end, on the whole power column
+        table.powers = array('i', [round(watts * 100 / ftp) for watts in table.powers])
+
+    stem, extension = _source_name(source)
+    name = header.get("FILE NAME")
+    name = os.path.splitext(name)[0] if name else stem
+    return ImportedWorkout(name, header.get("DESCRIPTION", "").strip(), "erg" if extension == ".erg" else "mrc", table)
+
+
+def _fraction(element, attribute: str, default: float = 0.0) -> float:
+    value = element.get(attribute)
+    return float(value) * 100 if value is not None else default
+
+
+def read_zwo(source: ImportSource) -> ImportedWorkout:
+    """
+    Stream a Zwift .zwo file into an interval table.
+
+    Uses iterparse and drops every workout step once it is converted, so memory stays
+    flat however long the file is; no XML tree is kept.
+    """
+    from xml.etree.ElementTree import iterparse
+
+    table = IntervalTable()
+    texts = {}
+    current_time = 0
+    workout = None
+    with _open(source, binary=True) as f:
+        for event, element in iterparse(f, events=("start", "end")):
+            tag = element.tag
+            if event == "start":
+                if tag == "workout":
+                    workout = element
+                continue
+            if workout is None or tag == "workout":
+                if tag in ("name", "description", "author"):
+                    texts[tag] = (element.text or "").strip()
+                continue
+
+            duration = int(float(element.get("Duration", 0)))
+            if tag == "SteadyState":
+                average = (_fraction(element, "PowerLow") + _fraction(element, "PowerHigh")) / 2
+                power = _fraction(element, "Power", average)
+                _append_segment(table, current_time, current_time + duration, power, power)
+                current_time += duration
+            elif tag in ("Warmup", "Cooldown", "Ramp"):
+                _append_segment(table, current_time, current_time + duration,
+                                _fraction(element, "PowerLow"), _fraction(element, "PowerHigh"))
+                current_time += duration
+            elif tag == "IntervalsT":
+                on_duration = int(float(element.get("OnDuration", 0)))
+                off_duration = int(float(element.get("OffDuration", 0)))
+                on_power, off_power = _fraction(element, "OnPower"), _fraction(element, "OffPower")
+                for _ in range(int(element.get("Repeat", 1))):
+                    _append_segment(table, current_time, current_time + on_duration, on_power, on_power)
+                    current_time += on_duration
+                    _append_segment(table, current_time, current_time + off_duration, off_power, off_power)
+                    current_time += off_duration
+            elif tag in ("FreeRide", "MaxEffort"):
+                _append_segment(table, current_time, current_time + duration, FREE_RIDE_POWER, FREE_RIDE_POWER)
+                current_time += duration
+            else:
+                continue  # text events and other children of a step
+            workout.clear()  # the step is converted, drop it
+
+    return ImportedWorkout(texts.get("name") or _source_name(source)[0], texts.get("description", ""), "zwo", table)
+
+
+READERS = {".mrc": read_mrc, ".erg": read_mrc, ".zwo": read_zwo}
+
+
+def read_workout(path: Union[str, os.PathLike], ftp: Optional[float] = None) -> ImportedWorkout:
+    """Read a workout file, picking the parser by extension"""
+    extension = os.path.splitext(os.fspath(path))[1].lower()
+    reader = READERS.get(extension)
+    if reader is None:
+        raise ValueError(f"unsupported workout file type: {extension or path}")
+    return reader(path, ftp) if reader is read_mrc else reader(path)
@@ -0,0 +1,248 @@
+import threading
+from collections import OrderedDict
+from typing import List, Optional, Sequence, Tuple
+
+import numpy as np
+
+from enduWorkoutGen.metrics import DEFAULT_FTP, NP_WINDOW_SECONDS, WorkoutMetrics, zone_bounds
+from enduWorkoutGen.workoutgen import IntervalTable, WorkoutGenerator, WorkoutParameters, WorkoutSegment
+
+# Warmup and cooldown as in generate_workout
+WARMUP_SECONDS = 300
+WARMUP_POWER = 40
+COOLDOWN_POWER = 40
+
+# Layout of a piece's sums; they add up over pieces, so the workout's are updated by delta
+_SECONDS, _WEIGHTED, _WEIGHTED_SQUARE, _FOURTH, _WINDOWS, _ZONES = range(6)
+
+SegmentKey = Tuple[str, int, int]  # (workout type, allotted seconds, seed)
+Piece = Tuple[np.ndarray, np.ndarray]  # ((starts, ends, powers) as a (3, n) intc array, sums)
+
+
+def _window_sums(stream: np.ndarray) -> Tuple[float, int]:
+    """Sum of the 4th powers of the 30 s rolling averages of a 1 Hz stream, and the number of windows"""
+    window = NP_WINDOW_SECONDS
+    if len(stream) < window:
+        return 0.0, 0
+    cumulative = np.concatenate([[0.0], np.cumsum(stream)])
+    rolling = (cumulative[window:] - cumulative[:-window]) / window
+    return float(np.sum(rolling ** 4)), len(rolling)
+
+
+def _piece_sums(columns: np.ndarray, lower_bounds: np.ndarray) -> np.ndarray:
+    """Additive metric sums of one back-to-back piece; NP only counts windows that lie inside it"""
+    starts, ends, powers = columns
+    durations = np.maximum(ends - starts, 0).astype(np.int64)
+    powers = powers.astype(np.float64)
+    sums = np.zeros(_ZONES + len(lower_bounds) + 1)
+    sums[_SECONDS] = durations.sum()
+    sums[_WEIGHTED] = durations @ powers
+    sums[_WEIGHTED_SQUARE] = durations @ powers ** 2
+    sums[_FOURTH], sums[_WINDOWS] = _window_sums(np.repeat(powers, durations))
+    # Column 0 is recovery, like compute_batch_metrics
+    sums[_ZONES:] = np.bincount(np.searchsorted(lower_bounds, powers, side='right'), weights=durations,
+                                minlength=len(lower_bounds) + 1)
+    return sums
+
+
+class SegmentMemo:
+    """
+    LRU of generated segments and their metric sums, keyed by (type, allotted seconds, seed).
+
+    Thread-safe; share one between the IncrementalWorkouts of a generator (the dashboard
+    keeps one per process). The generator's own cache, if any, keeps the intervals across
+    processes.
+    """
+
+    def __init__(self, generator: WorkoutGenerator, max_entries: int = 4096):
+        self.generator = generator
+        self.max_entries = max_entries
+        self.zones, self.lower_bounds = zone_bounds(generator.intensity_ranges)
+        self._entries: "OrderedDict[SegmentKey, Piece]" = OrderedDict()
+        self.generated = 0  # segments generated (or read from the generator's cache) rather than memoized
+        self._lock = threading.Lock()
+
+    def get(self, segment: WorkoutSegment, allotted_seconds: int, seed: int) -> Piece:
+        key = (segment.workout_type.value, allotted_seconds, seed)
+        with self._lock:
+            found = self._entries.get(key)
+            if found is not None:
+                self._entries.move_to_end(key)
+                return found
+        # Generate outside the lock; two concurrent misses just generate the same segment twice
+        columns = np.array(self.generator.generate_segment(segment.workout_type, allotted_seconds, seed).to_numpy())
+        found = (columns, _piece_sums(columns, self.lower_bounds))
+        with self._lock:
+            self._entries[key] = found
+            self.generated += 1
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+        return found
+
+    def __len__(self):
+        return len(self._entries)
+
+
+class IncrementalWorkout:
+    """
+    A workout built from separately generated segments, for editing one segment at a time.
+
+    Every segment has its own seed and is generated on its own for the time generate_workout
+    would give it (see WorkoutGenerator.segment_seconds), which only depends on its own
+    minutes and the total. Editing, adding, removing or moving a segment therefore
+    regenerates at most that segment; the others are re-stitched at their new start
+    times. Metrics come from per-segment sums updated by delta, plus the few 30 s
+    windows of normalized power that straddle two segments.
+    """
+
+    def __init__(self, generator: WorkoutGenerator, params: WorkoutParameters, seeds: Optional[Sequence[int]] = None,
+                 memo: Optional[SegmentMemo] = None):
+        self.generator = generator
+        self.memo = memo if memo is not None else SegmentMemo(generator)
+        self.total_duration_minutes = params.total_duration_minutes
+        self.segments: List[WorkoutSegment] = []
+        self.seeds: List[int] = []
+        self._pieces: List[Piece] = []
+        self._sums = np.zeros(_ZONES + len(self.memo.lower_bounds) + 1)  # of all segments
+        self._columns: Optional[np.ndarray] = None  # of the stitched workout
+        self._intervals: Optional[IntervalTable] = None
+        if seeds is not None and len(seeds) != len(params.segments):
+            raise ValueError("one seed per segment")
+        for i, segment in enumerate(params.segments):
+            self.insert_segment(i, segment, seeds[i] if seeds is not None else None)
+
+    @property
+    def params(self) -> WorkoutParameters:
+        return WorkoutParameters(segments=list(self.segments), total_duration_minutes=self.total_duration_minutes)
+
+    def _piece(self, segment: WorkoutSegment, seed: int) -> Piece:
+        allotted = self.generator.segment_seconds(segment, self.params)
+        return self.memo.get(segment, allotted, seed)
+
+    def _changed(self, old: Optional[np.ndarray], new: Optional[np.ndarray]):
+        if old is not None:
+            self._sums -= old
+        if new is not None:
+            self._sums += new
+        self._columns = self._intervals = None
+
+    def set_segment(self, index: int, segment: WorkoutSegment, seed: Optional[int] = None):
+        """Replace a segment, keeping its seed unless one is given"""
+        self.segments[index] = segment
+        if seed is not None:
+            self.seeds[index] = seed
+        old = self._pieces[index][1]
+        self._pieces[index] = self._piece(segment, self.seeds[index])
+        self._changed(old, self._pieces[index][1])
+
+    def insert_segment(self, index: int, segment: WorkoutSegment, seed: Optional[int] = None):
+        """Add a segment before index (len(segments) appends it), with a fresh seed unless one is given"""
+        seed = seed if seed is not None else self.generator.rng.getrandbits(63)
+        self.segments.insert(index, segment)
+        self.seeds.insert(index, seed)
+        self._pieces.insert(index, self._piece(segment, seed))
+        self._changed(None, self._pieces[index][1])
+
+    def append_segment(self, segment: WorkoutSegment, seed: Optional[int] = None):
+        self.insert_segment(len(self.segments), segment, seed)
+
+    def remove_segment(self, index: int):
+        del self.segments[index], self.seeds[index]
+        self._changed(self._pieces.pop(index)[1], None)
+
+    def move_segment(self, old_index: int, new_index: int):
+        """Reorder; the segment keeps its intervals, only start times change"""
+        for column in (self.segments, self.seeds, self._pieces):
+            column.insert(new_index, column.pop(old_index))
+        self._columns = self._intervals = None
+
+    def set_total_duration(self, minutes: int):
+        """Change the total; every segment's allotted time changes with it, so all are regenerated"""
+        self.total_duration_minutes = minutes
+        for i in range(len(self.segments)):
+            self.set_segment(i, self.segments[i])
+
+    def _layout(self) -> Tuple[np.ndarray, int]:
+        """Start time of every segment, and where the cooldown starts"""
+        lengths = np.fromiter((sums[_SECONDS] for _, sums in self._pieces), dtype=np.int64, count=len(self._pieces))
+        offsets = WARMUP_SECONDS + np.concatenate([[0], np.cumsum(lengths)])
+        return offsets[:-1], int(offsets[-1])
+
+    def _stitched(self) -> np.ndarray:
+        """(starts, ends, powers) of the whole workout, every segment shifted to its start time"""
+        if self._columns is None:
+            offsets, cooldown_start = self._layout()
+            warmup = np.array([[0], [WARMUP_SECONDS], [WARMUP_POWER]], dtype=np.intc)
+            cooldown = np.array([[cooldown_start], [self.total_duration_minutes * 60], [COOLDOWN_POWER]], dtype=np.intc)
+            pieces = [warmup] + [columns for columns, _ in self._pieces] + [cooldown]
+            columns = np.concatenate(pieces, axis=1)
+            counts = [piece.shape[1] for piece in pieces]
+            columns[:2] += np.repeat(np.concatenate([[0], offsets, [0]]), counts).astype(np.intc)
+            self._columns = columns
+        return self._columns
+
+    def intervals(self) -> IntervalTable:
+        """The stitched workout: warmup, the segments shifted to their start times, cooldown"""
+        if self._intervals is None:
+            self._intervals = IntervalTable.from_buffers(*self._stitched())
+        return self._intervals
+
+    def _seam_sums(self, boundaries: np.ndarray) -> Tuple[float, int]:
+        """NP windows that straddle a boundary between pieces, without expanding the 1 Hz stream"""
+        window = NP_WINDOW_SECONDS
+        # Positions in the 1 Hz stream as compute_metrics expands it, i.e. with negative durations as 0
+        starts, ends, powers = self._stitched().astype(np.int64)
+        durations = np.maximum(ends - starts, 0)
+        ends = np.cumsum(durations)
+        starts = ends - durations
+        work = np.concatenate([[0], np.cumsum(durations * powers)])
+
+        # Windows starting in [boundary - window + 1, boundary - 1] cross it; one that crosses
+        # several boundaries is counted at the first, so it has to start at or after the one before
+        first = (boundaries - window + 1)[:, None] + np.arange(window - 1)
+        previous = np.concatenate([[0], boundaries[:-1]])[:, None]
+        first = first[(first >= previous) & (first <= ends[-1] - window)]
+
+        def work_until(t):
+            # Work (power x seconds) of the stream before second t, read off the interval it falls in
+            row = np.minimum(np.searchsorted(ends, t, side='right'), len(ends) - 1)
+            return work[row] + powers[row] * (t - starts[row])
+
+        rolling = (work_until(first + window) - work_until(first)) / window
+        return float(np.sum(rolling ** 4)), len(first)
+
+    def metrics(self, ftp: int = DEFAULT_FTP) -> WorkoutMetrics:
+        """Same numbers as compute_metrics on intervals(), without going over the whole workout"""
+        offsets, cooldown_start = self._layout()
+        cooldown = self.total_duration_minutes * 60 - cooldown_start
+        sums = self._sums.copy()
+        for seconds, power in ((WARMUP_SECONDS, WARMUP_POWER), (cooldown, COOLDOWN_POWER)):
+            if seconds <= 0:
+                continue
+            sums[_SECONDS] += seconds
+            sums[_WEIGHTED] += seconds * power
+            sums[_WEIGHTED_SQUARE] += seconds * power ** 2
+            inside = max(seconds - NP_WINDOW_SECONDS + 1, 0)
+            sums[_FOURTH] += inside * float(power) ** 4
+            sums[_WINDOWS] += inside
+            sums[_ZONES + int(np.searchsorted(self.memo.lower_bounds, power, side='right'))] += seconds
+
+        # Seams are where every segment and the cooldown start
+        boundaries = np.concatenate([offsets, [cooldown_start]]) if cooldown > 0 else offsets
+        seam_sum, seam_windows = self._seam_sums(boundaries)
+        windows = sums[_WINDOWS] + seam_windows
+        if windows:
+            normalized_power = ((sums[_FOURTH] + seam_sum) / windows) ** 0.25
+        else:
+            normalized_power = sums[_WEIGHTED] / sums[_SECONDS] if sums[_SECONDS] else 0.0
+
+        zone_seconds = sums[_ZONES:].astype(np.int64)
+        return WorkoutMetrics(
+            tss=round(float(sums[_WEIGHTED_SQUARE] / 360000), 1),
+            normalized_power=round(float(normalized_power), 1),
+            intensity_factor=round(float(normalized_power / 100), 3),
+            kilojoules=round(float(sums[_WEIGHTED] * ftp / 100 / 1000), 1),
+            duration_seconds=int(sums[_SECONDS]),
+            time_in_zone={zone: int(seconds) for zone, seconds in zip(self.memo.zones, zone_seconds[1:])},
+            recovery_seconds=int(zone_seconds[0]),
+        )
@@ -0,0 +1,261 @@
+import bisect
+import collections
+import functools
+import os
+import threading
+import time
+from typing import Callable, Deque, Dict, Iterable, Optional, Sequence, Tuple
+
+# Latency buckets in seconds, from sub-millisecond generation up to slow callbacks
+LATENCY_BUCKETS = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0)
+
+# Intervals per generated workout
+INTERVAL_BUCKETS = (5, 10, 20, 40, 80, 160, 320, 640)
+
+LabelValues = Tuple[str, ...]
+
+
+class Counter:
+    def __init__(self, name: str, documentation: str, labels: Sequence[str] = ()):
+        self.name = name
+        self.documentation = documentation
+        self.labels = tuple(labels)
+        self._values: Dict[LabelValues, float] = {}
+        self._lock = threading.Lock()
+
+    def inc(self, *label_values: str, amount: float = 1):
+        with self._lock:
+            self._values[label_values] = self._values.get(label_values, 0) + amount
+
+    def value(self, *label_values: str) -> float:
+        return self._values.get(label_values, 0)
+
+    def render(self) -> Iterable[str]:
+        yield f"# HELP {self.name} {self.documentation}"
+        yield f"# TYPE {self.name} counter"
+        with self._lock:
+            items = sorted(self._values.items())
+        for label_values, value in items:
+            yield f"{self.name}{_labels(self.labels, label_values)} {value:g}"
+
+
+class Histogram:
+    def __init__(self, name: str, documentation: str, labels: Sequence[str] = (),
+                 buckets: Sequence[float] = LATENCY_BUCKETS):
+        self.name = name
+        self.documentation = documentation
+        self.labels = tuple(labels)
+        self.buckets = tuple(buckets)
+        # label values -> [per-bucket counts (+Inf last), sum, count]
+        self._values: Dict[LabelValues, list] = {}
+        self._lock = threading.Lock()
+
+    def observe(self, value: float, *label_values: str):
+        index = bisect.bisect_left(self.buckets, value)
+        with self._lock:
+            state = self._values.get(label_values)
+            if state is None:
+                state = self._values[label_values] = [[0] * (len(self.buckets) + 1), 0.0, 0]
+            state[0][index] += 1
+            state[1] += value
+            state[2] += 1
+
+    def count(self, *label_values: str) -> int:
+        state = self._values.get(label_values)
+        return state[2] if state else 0
+
+    def render(self) -> Iterable[str]:
+        yield f"# HELP {self.name} {self.documentation}"
+        yield f"# TYPE {self.name} histogram"
+        with self._lock:
+            items = sorted((key, ([*state[0]], state[1], state[2])) for key, state in self._values.items())
+        for label_values, (bucket_counts, total, count) in items:
+            cumulative = 0
+            for bound, bucket_count in zip((*self.buckets, "+Inf"), bucket_counts):
+                cumulative += bucket_count
+                le = bound if isinstance(bound, str) else f"{bound:g}"
+                yield (f"{self.name}_bucket{_labels(self.labels + ('le',), label_values + (le,))} "
+                       f"{cumulative}")
+            yield f"{self.name}_sum{_labels(self.labels, label_values)} {total:g}"
+            yield f"{self.name}_count{_labels(self.labels, label_values)} {count}"
+
+
+def _escape(value) -> str:
+    return str(value).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+
+def _labels(names: Sequence[str], values: Sequence[str]) -> str:
+    if not names:
+        return ""
+    return "{" + ",".join(f'{name}="{_escape(value)}"' for name, value in zip(names, values)) + "}"
+
+
+class MetricsRegistry:
+    """
+    Process-wide counters and histograms for the hot paths.
+
+    Disabled by default; while disabled the instrumented functions only pay for one
+    attribute check. Enable with enable() or the WORKOUTGEN_METRICS=1 environment variable.
+    """
+
+    def __init__(self, enabled: bool = False):
+        self.enabled = enabled
+        self.operation_seconds = Histogram(
+            "workoutgen_operation_seconds", "Latency of generator, metrics and export operations.",
+            labels=("operation",))
+        self.operation_errors = Counter(
+            "workoutgen_operation_errors_total", "Operations that raised an exception.", labels=("operation",))
+        self.callback_seconds = Histogram(
+            "workoutgen_callback_seconds", "Latency of dashboard callbacks.", labels=("callback",))
+        self.callback_errors = Counter(
+            "workoutgen_callback_errors_total", "Dashboard callbacks that raised an exception.",
+            labels=("callback",))
+        self.intervals_per_workout = Histogram(
+            "workoutgen_intervals_per_workout", "Intervals in each workout from generate_workout.",
+            buckets=INTERVAL_BUCKETS)
+        self.intervals_generated = Counter(
+            "workoutgen_intervals_generated_total", "Intervals generated, single and batch.")
+        self.workouts_generated = Counter(
+            "workoutgen_workouts_generated_total", "Workouts generated, single and batch.")
+        self.cache_lookups = Counter(
+            "workoutgen_cache_lookups_total", "Generation cache lookups by the tier that answered (or miss).",
+            labels=("result",))
+
+    def metrics(self):
+        return [self.operation_seconds, self.operation_errors, self.callback_seconds, self.callback_errors,
+                self.intervals_per_workout, self.intervals_generated, self.workouts_generated,
+                self.cache_lookups]
+
+    def render_prometheus(self) -> str:
+        """All metrics in the Prometheus text exposition format"""
+        return "\n".join(line for metric in self.metrics() for line in metric.render()) + "\n"
+
+
+REGISTRY = MetricsRegistry(enabled=os.environ.get("WORKOUTGEN_METRICS", "") not in ("", "0"))
+
+
+def enable(enabled: bool = True):
+    REGISTRY.enabled = enabled
+
+
+def record_workouts(workouts: int, intervals: int, per_workout: Optional[int] = None):
+    """Count generated workouts and intervals (no-op unless enabled)"""
+    if REGISTRY.enabled:
+        REGISTRY.workouts_generated.inc(amount=workouts)
+        REGISTRY.intervals_generated.inc(amount=intervals)
+        if per_workout is not None:
+            REGISTRY.intervals_per_workout.observe(per_workout)
+
+
+def record_cache_lookup(result: str):
+    """Count a generation cache lookup answered by "memory", "disk", or a "miss" (no-op unless enabled)"""
+    if REGISTRY.enabled:
+        REGISTRY.cache_lookups.inc(result)
+
+
+def _timed(histogram_attr: str, errors_attr: str, name: str, ignored: Tuple[type, ...] = ()):
+    def decorator(func: Callable) -> Callable:
+        @functools.wraps(func)
+        def wrapper(*args, **kwargs):
+            if not REGISTRY.enabled:
+                return func(*args, **kwargs)
+            start = time.perf_counter()
+            try:
+                return func(*args, **kwargs)
+            except ignored:
+                raise
+            except Exception:
+                getattr(REGISTRY, errors_attr).inc(name)
+                raise
+            finally:
+                getattr(REGISTRY, histogram_attr).observe(time.perf_counter() - start, name)
+        return wrapper
+    return decorator
+
+
+def timed(operation: str) -> Callable[[Callable], Callable]:
+    """Record latency and errors of a generator/metrics/export operation"""
+    return _timed("operation_seconds", "operation_errors", operation)
+
+
+def timed_callback(callback: str, ignored: Tuple[type, ...] = ()) -> Callable[[Callable], Callable]:
+    """Record latency and errors of a dashboard callback; exceptions in ignored (e.g. PreventUpdate) aren't errors"""
+    return _timed("callback_seconds", "callback_errors", callback, ignored)
+
+
+class RequestProfiler:
+    """
+    Opt-in cProfile hook for single requests on the dashboard's Flask server.
+
+    A request is profiled when it carries the X-Workoutgen-Profile header, or when
+    profiling has been armed for the next N requests through /debug/profile/arm?count=N.
+    Only one request is profiled at a time (cProfile can't nest); the most recent
+    results are listed at /debug/profile.
+    """
+    HEADER = "X-Workoutgen-Profile"
+
+    def __init__(self, keep: int = 20, top: int = 30):
+        self.top = top
+        self.results: Deque[str] = collections.deque(maxlen=keep)
+        self._armed = 0
+        self._lock = threading.Lock()
+        self._active = threading.Lock()
+
+    def arm(self, count: int = 1):
+        with self._lock:
+            self._armed += count
+
+    def _should_profile(self, headers) -> bool:
+        if headers.get(self.HEADER):
+            return True
+        with self._lock:
+            if self._armed > 0:
+                self._armed -= 1
+                return True
+        return False
+
+    def install(self, server):
+        # cProfile/pstats are only needed once profiling is installed, keep them out of the generator's import
+        import cProfile
+        import io
+        import pstats
+        from flask import Response, g, request
+
+        @server.before_request
+        def start_profile():
+            if self._should_profile(request.headers) and self._active.acquire(blocking=False):
+                g.workoutgen_profile = cProfile.Profile()
+                g.workoutgen_profile_start = time.perf_counter()
+                g.workoutgen_profile.enable()
+
+        @server.teardown_request
+        def stop_profile(exc=None):
+            profile = g.pop("workoutgen_profile", None)
+            if profile is None:
+                return
+            profile.disable()
+            self._active.release()
+            elapsed = time.perf_counter() - g.pop("workoutgen_profile_start")
+            out = io.StringIO()
+            pstats.Stats(profile, stream=out).sort_stats("cumulative").print_stats(self.top)
+            self.results.append(f"{request.method} {request.path} took {elapsed * 1e3:.1f} ms\n{out.getvalue()}")
+
+        @server.route("/debug/profile")
+        def list_profiles():
+            body = ("\n" + "=" * 80 + "\n").join(reversed(self.results)) or "No profiled requests yet\n"
+            return Response(body, mimetype="text/plain")
+
+        @server.route("/debug/profile/arm")
+        def arm_profiles():
+            count = request.args.get("count", default=1, type=int)
+            self.arm(count)
+            return Response(f"Profiling the next {count} request(s)\n", mimetype="text/plain")
+
+
+def install_metrics_endpoint(server, registry: MetricsRegistry = REGISTRY, path: str = "/metrics"):
+    """Serve the registry in Prometheus text format on the dashboard's Flask server"""
+    from flask import Response
+
+    @server.route(path)
+    def prometheus_metrics():
+        return Response(registry.render_prometheus(), mimetype="text/plain; version=0.0.4")
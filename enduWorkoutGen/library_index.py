@@ -0,0 +1,266 @@
+"""
+Index a directory of .mrc/.zwo/.erg files into SQLite with name, duration, TSS and time in zone.
+
+Usage:
+    python -m enduWorkoutGen.library_index workouts/ --db library.sqlite -j 8
+
+Rescans are incremental: files whose mtime and size haven't changed are skipped,
+changed and new files are parsed and measured in parallel, and deleted ones are dropped.
+"""
+import argparse
+import itertools
+import os
+import sqlite3
+import threading
+import time
+from dataclasses import dataclass
+from typing import Dict, Iterator, List, Optional, Sequence, Tuple
+
+from enduWorkoutGen.importers import READERS, read_workout
+from enduWorkoutGen.workoutgen import INTENSITY_RANGES, WorkoutType
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS files (
+    path TEXT PRIMARY KEY,
+    mtime_ns INTEGER NOT NULL,
+    size INTEGER NOT NULL,
+    name TEXT,
+    description TEXT,
+    file_type TEXT,
+    duration_seconds INTEGER,
+    tss REAL,
+    normalized_power REAL,
+    intensity_factor REAL,
+    recovery_seconds INTEGER,
+    error TEXT,
+    fingerprint TEXT  -- canonical.fingerprint of the intervals
+);
+CREATE TABLE IF NOT EXISTS file_zones (
+    path TEXT NOT NULL REFERENCES files(path) ON DELETE CASCADE,
+    zone TEXT NOT NULL,
+    seconds INTEGER NOT NULL,
+    PRIMARY KEY (path, zone)
+);
+"""
+
+FileStamp = Tuple[int, int]  # (mtime_ns, size)
+
+
+@dataclass
+class IndexedFile:
+    path: str
+    mtime_ns: int
+    size: int
+    name: str = ""
+    description: str = ""
+    file_type: str = ""
+    duration_seconds: int = 0
+    tss: float = 0.0
+    normalized_power: float = 0.0
+    intensity_factor: float = 0.0
+    recovery_seconds: int = 0
+    time_in_zone: Optional[Dict[WorkoutType, int]] = None  # seconds
+    error: Optional[str] = None  # why the file couldn't be read
+    fingerprint: Optional[str] = None  # the same for files with the same intervals
+
+
+@dataclass
+class IndexStats:
+    scanned: int = 0
+    added: int = 0
+    updated: int = 0
+    removed: int = 0
+    unchanged: int = 0
+    failed: int = 0
+    seconds: float = 0.0
+
+
+def scan(root: str) -> Dict[str, FileStamp]:
+    """All workout files below root, with the stamp used to detect changes"""
+    found = {}
+    stack = [os.path.abspath(root)]
+    while stack:
+        with os.scandir(stack.pop()) as entries:
+            for entry in entries:
+                if entry.is_dir(follow_symlinks=False):
+                    stack.append(entry.path)
+                elif os.path.splitext(entry.name)[1].lower() in READERS:
+                    stat = entry.stat()
+                    found[entry.path] = (stat.st_mtime_ns, stat.st_size)
+    return found
+
+
+def index_files(files: Sequence[Tuple[str, FileStamp]], ftp: Optional[float] = None) -> List[IndexedFile]:
+    """
+    Parse files and compute their metrics.
+
+    Metrics for all readable files are computed together with the same vectorized
+    engine as generated batches (metrics.compute_batch_metrics), once per distinct
+    fingerprint.
+    """
+    from enduWorkoutGen.canonical import fingerprints
+    from enduWorkoutGen.metrics import DEFAULT_FTP, compute_batch_metrics
+
+    records, tables = [], []
+    for path, (mtime_ns, size) in files:
+        record = IndexedFile(path, mtime_ns, size)
+        try:
+            workout = read_workout(path, ftp)
+            if not len(workout.intervals):
+                raise ValueError("no intervals")
+        except (OSError, ValueError, SyntaxError) as exc:  # ParseError is a SyntaxError
+            record.error = f"{type(exc).__name__}: {exc}"
+        else:
+            record.name, record.description, record.file_type = workout.name, workout.description, workout.file_type
+            tables.append((record, workout.intervals))
+        records.append(record)
+
+    if tables:
+        # Files with the same intervals (e.g. the .mrc and .zwo of one workout) are measured once
+        slots: Dict[str, int] = {}
+        distinct = []
+        for (record, table), key in zip(tables, fingerprints([table for _, table in tables])):
+            record.fingerprint = key
+            if record.fingerprint not in slots:
+                slots[record.fingerprint] = len(distinct)
+                distinct.append(table)
+        batch = compute_batch_metrics(distinct, INTENSITY_RANGES, ftp or DEFAULT_FTP)
+        for record, _ in tables:
+            metrics = batch[slots[record.fingerprint]]
+            record.duration_seconds = metrics.duration_seconds
+            record.tss = metrics.tss
+            record.normalized_power = metrics.normalized_power
+            record.intensity_factor = metrics.intensity_factor
+            record.recovery_seconds = metrics.recovery_seconds
+            record.time_in_zone = metrics.time_in_zone
+    return records
+
+
+class LibraryIndex:
+    """SQLite index of a workout library, safe to share between threads"""
+
+    def __init__(self, db_path: str = "library.sqlite"):
+        self.db_path = db_path
+        self._db = sqlite3.connect(db_path, check_same_thread=False)
+        self._db.execute("PRAGMA foreign_keys = ON")
+        self._db.executescript(SCHEMA)
+        if "fingerprint" not in {row[1] for row in self._db.execute("PRAGMA table_info(files)")}:
+            with self._db:
+                self._db.execute("ALTER TABLE files ADD COLUMN fingerprint TEXT")
+        self._db.execute("CREATE INDEX IF NOT EXISTS files_fingerprint ON files (fingerprint)")
+        self._lock = threading.Lock()
+
+    def close(self):
+        self._db.close()
+
+    def stamps(self) -> Dict[str, FileStamp]:
+        # Files indexed before fingerprints existed get a size that never matches, so the next update measures them
+        with self._lock:
+            return {path: (mtime_ns, size) for path, mtime_ns, size in self._db.execute(
+                "SELECT path, mtime_ns, CASE WHEN fingerprint IS NULL AND error IS NULL THEN -1 ELSE size END "
+                "FROM files")}
+
+    def update(self, root: str, workers: int = 1, chunk_size: int = 256, ftp: Optional[float] = None) -> IndexStats:
+        """
+        Bring the index up to date with the files below root.
+
+        Only new files and files whose mtime or size changed are parsed; with workers > 1
+        they are spread over a process pool in chunks of chunk_size files.
+        """
+        start = time.perf_counter()
+        root = os.path.abspath(root)
+        found = scan(root)
+        known = {path: stamp for path, stamp in self.stamps().items()
+                 if path.startswith(root + os.sep)}
+
+        stats = IndexStats(scanned=len(found))
+        changed = [(path, stamp) for path, stamp in found.items() if known.get(path) != stamp]
+        removed = [path for path in known if path not in found]
+        stats.unchanged = len(found) - len(changed)
+
+        chunks = [changed[i:i + chunk_size] for i in range(0, len(changed), chunk_size)]
+        if workers > 1 and len(chunks) > 1:
+            from concurrent.futures import ProcessPoolExecutor
+            with ProcessPoolExecutor(max_workers=workers) as executor:
+                results = executor.map(index_files, chunks, itertools.repeat(ftp))
+                for records in results:
+                    self._store(records, known, stats)
+        else:
+            for chunk in chunks:
+                self._store(index_files(chunk, ftp), known, stats)
+
+        with self._lock, self._db:
+            self._db.executemany("DELETE FROM files WHERE path = ?", [(path,) for path in removed])
+        stats.removed = len(removed)
+        stats.seconds = time.perf_counter() - start
+        return stats
+
+    def _store(self, records: List[IndexedFile], known: Dict[str, FileStamp], stats: IndexStats):
+        for record in records:
+            if record.error:
+                stats.failed += 1
+            elif record.path in known:
+                stats.updated += 1
+            else:
+                stats.added += 1
+        with self._lock, self._db:
+            self._db.executemany("DELETE FROM file_zones WHERE path = ?", [(r.path,) for r in records])
+            self._db.executemany(
+                "INSERT OR REPLACE INTO files VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)",
+                [(r.path, r.mtime_ns, r.size, r.name, r.description, r.file_type, r.duration_seconds, r.tss,
+                  r.normalized_power, r.intensity_factor, r.recovery_seconds, r.error, r.fingerprint)
+                 for r in records])
+            self._db.executemany(
+                "INSERT INTO file_zones VALUES (?, ?, ?)",
+                [(r.path, zone.value, seconds) for r in records for zone, seconds in (r.time_in_zone or {}).items()])
+
+    def records(self) -> Iterator[IndexedFile]:
+        """All indexed files, with their time in zone"""
+        with self._lock:
+            zones: Dict[str, Dict[WorkoutType, int]] = {}
+            for path, zone, seconds in self._db.execute("SELECT path, zone, seconds FROM file_zones"):
+                zones.setdefault(path, {})[WorkoutType(zone)] = seconds
+            rows = self._db.execute("SELECT * FROM files ORDER BY path").fetchall()
+        for row in rows:
+            *fields, error, fingerprint = row
+            yield IndexedFile(*fields, time_in_zone=zones.get(row[0], {}), error=error, fingerprint=fingerprint)
+
+    def duplicates(self) -> List[List[str]]:
+        """Groups of files with the same intervals, e.g. one workout exported in several formats"""
+        with self._lock:
+            rows = self._db.execute(
+                "SELECT fingerprint, path FROM files WHERE fingerprint IN "
+                "(SELECT fingerprint FROM files WHERE fingerprint IS NOT NULL GROUP BY fingerprint HAVING COUNT(*) > 1) "
+                "ORDER BY fingerprint, path").fetchall()
+        groups: Dict[str, List[str]] = {}
+        for key, path in rows:
+            groups.setdefault(key, []).append(path)
+        return list(groups.values())
+
+    def __len__(self):
+        with self._lock:
+            return self._db.execute("SELECT COUNT(*) FROM files").fetchone()[0]
+
+
+def main(argv: Optional[Sequence[str]] = None):
+    parser = argparse.ArgumentParser(prog="python -m enduWorkoutGen.library_index", description=__doc__,
+                                     formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("root", help="Directory with .mrc/.zwo/.erg files")
+    parser.add_argument("--db", default="library.sqlite", help="Index database (default: library.sqlite)")
+    parser.add_argument("-j", "--workers", type=int, default=os.cpu_count() or 1,
+                        help="Worker processes (default: CPU count)")
+    parser.add_argument("--ftp", type=float, default=None, help="FTP for files in watts without an FTP header")
+    args = parser.parse_args(argv)
+
+    index = LibraryIndex(args.db)
+    stats = index.update(args.root, workers=args.workers, ftp=args.ftp)
+    duplicates = index.duplicates()
+    index.close()
+    print(f"Scanned {stats.scanned} files in {stats.seconds:.2f}s: {stats.added} added, {stats.updated} updated, "
+          f"{stats.removed} removed, {stats.unchanged} unchanged, {stats.failed} failed")
+    if duplicates:
+        print(f"{sum(len(group) for group in duplicates)} files hold only {len(duplicates)} distinct workouts")
+
+
+if __name__ == "__main__":
+    main()
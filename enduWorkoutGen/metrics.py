@@ -0,0 +1,201 @@
+import json
+from dataclasses import asdict, dataclass
+from typing import Dict, Mapping, Sequence, Tuple, Union
+
+import numpy as np
+
+from enduWorkoutGen.workoutgen import IntervalTable, IntervalsLike, WorkoutInterval, WorkoutType
+
+# Used for kJ when the caller doesn't know the athlete's FTP (watts)
+DEFAULT_FTP = 250
+
+# Window of the rolling average used for normalized power (seconds)
+NP_WINDOW_SECONDS = 30
+
+# Upper bound on 1 Hz samples expanded at once while computing normalized power
+_MAX_SAMPLES_PER_CHUNK = 1 << 20
+
+
+@dataclass
+class WorkoutMetrics:
+    tss: float
+    normalized_power: float  # % of FTP
+    intensity_factor: float
+    kilojoules: float
+    duration_seconds: int
+    time_in_zone: Dict[WorkoutType, int]  # seconds
+    recovery_seconds: int  # seconds below the lowest workout type zone
+
+    def tobytes(self) -> bytes:
+        """JSON encoding, e.g. for the generation cache"""
+        fields = asdict(self)
+        fields["time_in_zone"] = {wt.value: seconds for wt, seconds in self.time_in_zone.items()}
+        return json.dumps(fields).encode()
+
+    @classmethod
+    def frombytes(cls, data: bytes) -> "WorkoutMetrics":
+        fields = json.loads(data)
+        fields["time_in_zone"] = {WorkoutType(value): seconds for value, seconds in fields["time_in_zone"].items()}
+        return cls(**fields)
+
+
+@dataclass
+class BatchMetrics:
+    """
+    Metrics for many workouts, one array entry per workout.
+
+    zone_seconds has one column per entry of zones (ordered by intensity), so
+    candidates can be ranked with plain NumPy, e.g. np.argsort(metrics.tss).
+    """
+    tss: np.ndarray
+    normalized_power: np.ndarray
+    intensity_factor: np.ndarray
+    kilojoules: np.ndarray
+    duration_seconds: np.ndarray
+    zones: Tuple[WorkoutType, ...]
+    zone_seconds: np.ndarray  # shape (workouts, len(zones))
+    recovery_seconds: np.ndarray
+
+    def __len__(self):
+        return len(self.tss)
+
+    def __getitem__(self, index: int) -> WorkoutMetrics:
+        return WorkoutMetrics(
+            tss=round(float(self.tss[index]), 1),
+            normalized_power=round(float(self.normalized_power[index]), 1),
+            intensity_factor=round(float(self.intensity_factor[index]), 3),
+            kilojoules=round(float(self.kilojoules[index]), 1),
+            duration_seconds=int(self.duration_seconds[index]),
+            time_in_zone={zone: int(seconds) for zone, seconds in zip(self.zones, self.zone_seconds[index])},
+            recovery_seconds=int(self.recovery_seconds[index]),
+        )
+
+    def seconds_in(self, workout_type: WorkoutType) -> np.ndarray:
+        """Time in the given zone for every workout"""
+        return self.zone_seconds[:, self.zones.index(workout_type)]
+
+
+def zone_bounds(intensity_ranges: Mapping[WorkoutType, Tuple[int, int]]) -> Tuple[Tuple[WorkoutType, ...], np.ndarray]:
+    """
+    Split the power axis into one zone per workout type.
+
+    The intensity ranges overlap (Z2 and endurance share 65-75%), so each zone
+    runs from the bottom of its own range up to the bottom of the next one.
+    Anything below the lowest range counts as recovery.
+    """
+    zones = tuple(sorted(intensity_ranges, key=lambda wt: intensity_ranges[wt][0]))
+    lower_bounds = np.array([intensity_ranges[wt][0] for wt in zones])
+    return zones, lower_bounds
+
+
+def _stack(workouts: Sequence[IntervalsLike]):
+    """Concatenate the columns of all workouts and label every interval with its workout index"""
+    tables = [IntervalTable.from_intervals(workout) for workout in workouts]
+    counts = np.fromiter((len(table) for table in tables), dtype=np.int64, count=len(tables))
+    starts = np.frombuffer(b"".join(table.starts.tobytes() for table in tables), dtype=np.intc).astype(np.int64)
+    ends = np.frombuffer(b"".join(table.ends.tobytes() for table in tables), dtype=np.intc).astype(np.int64)
+    powers = np.frombuffer(b"".join(table.powers.tobytes() for table in tables), dtype=np.intc).astype(np.float64)
+    workout_ids = np.repeat(np.arange(len(tables)), counts)
+    return workout_ids, np.maximum(ends - starts, 0), powers
+
+
+def _normalized_power(workout_ids: np.ndarray, durations: np.ndarray, powers: np.ndarray, n: int) -> np.ndarray:
+    """Normalized power per workout from the 30 s rolling average of the 1 Hz power stream"""
+    window = NP_WINDOW_SECONDS
+    samples_per_workout = np.bincount(workout_ids, weights=durations, minlength=n).astype(np.int64)
+    interval_offsets = np.concatenate([[0], np.cumsum(np.bincount(workout_ids, minlength=n))])
+    fourth_power_sum = np.zeros(n)
+    rolling_count = np.zeros(n, dtype=np.int64)
+
+    # Expand a run of whole workouts at a time to keep the 1 Hz buffer bounded
+    first = 0
+    while first < n:
+        last = first + 1
+        budget = samples_per_workout[first]
+        while last < n and budget + samples_per_workout[last] <= _MAX_SAMPLES_PER_CHUNK:
+            budget += samples_per_workout[last]
+            last += 1
+
+        rows = slice(interval_offsets[first], interval_offsets[last])
+        stream = np.repeat(powers[rows], durations[rows])
+
+        # rolling[k] is the average of the window ending at sample k + window - 1; windows
+        # that straddle two workouts are skipped below through the per-workout bounds
+        cumulative = np.concatenate([[0.0], np.cumsum(stream)])
+        rolling = cumulative[window:] - cumulative[:-window]
+        rolling /= window
+        rolling *= rolling
+        rolling *= rolling
+        cumulative_fourth = np.concatenate([[0.0], np.cumsum(rolling)])
+
+        lengths = samples_per_workout[first:last]
+        lower = np.concatenate([[0], np.cumsum(lengths)[:-1]])
+        upper = np.maximum(lower + lengths - window + 1, lower)
+        top = len(cumulative_fourth) - 1
+        fourth_power_sum[first:last] = (cumulative_fourth[np.minimum(upper, top)]
+                                        - cumulative_fourth[np.minimum(lower, top)])
+        rolling_count[first:last] = upper - lower
+        first = last
+
+    normalized = np.zeros(n)
+    has_window = rolling_count > 0
+    normalized[has_window] = (fourth_power_sum[has_window] / rolling_count[has_window]) ** 0.25
+
+    # Workouts shorter than the window fall back to their average power
+    short = ~has_window & (samples_per_workout > 0)
+    if short.any():
+        weighted = np.bincount(workout_ids, weights=durations * powers, minlength=n)
+        normalized[short] = weighted[short] / samples_per_workout[short]
+    return normalized
+
+
+def compute_batch_metrics(workouts: Sequence[IntervalsLike],
+                          intensity_ranges: Mapping[WorkoutType, Tuple[int, int]],
+                          ftp: int = DEFAULT_FTP) -> BatchMetrics:
+    """
+    Computes TSS, normalized power, intensity factor, kJ and time in zone for many workouts.
+
+    Args:
+        workouts (Sequence[IntervalsLike]): Interval tables (or interval lists), one per workout.
+        intensity_ranges (Mapping[WorkoutType, Tuple[int, int]]): Ranges used to define the zones.
+        ftp (int): Athlete FTP in watts, only used for kJ.
+
+    Returns:
+        BatchMetrics: Arrays with one entry per workout.
+    """
+    n = len(workouts)
+    workout_ids, durations, powers = _stack(workouts)
+
+    # Same per-interval TSS as WorkoutGenerator.calculate_metrics: 100 * hours * (power / 100) ^ 2
+    tss = np.bincount(workout_ids, weights=durations * powers ** 2, minlength=n) / 360000
+    kilojoules = np.bincount(workout_ids, weights=durations * powers, minlength=n) * ftp / 100 / 1000
+    duration_seconds = np.bincount(workout_ids, weights=durations, minlength=n).astype(np.int64)
+
+    zones, lower_bounds = zone_bounds(intensity_ranges)
+    # Zone column 0 is recovery, column k is zones[k - 1]
+    zone_index = np.searchsorted(lower_bounds, powers, side='right')
+    zone_table = np.bincount(
+        workout_ids * (len(zones) + 1) + zone_index, weights=durations, minlength=n * (len(zones) + 1)
+    ).reshape(n, len(zones) + 1).astype(np.int64)
+
+    normalized_power = _normalized_power(workout_ids, durations, powers, n)
+
+    return BatchMetrics(
+        tss=tss,
+        normalized_power=normalized_power,
+        intensity_factor=normalized_power / 100,
+        kilojoules=kilojoules,
+        duration_seconds=duration_seconds,
+        zones=zones,
+        zone_seconds=zone_table[:, 1:],
+        recovery_seconds=zone_table[:, 0],
+    )
+
+
+def compute_metrics(workouts: Union[IntervalsLike, Sequence[IntervalsLike]],
+                    intensity_ranges: Mapping[WorkoutType, Tuple[int, int]],
+                    ftp: int = DEFAULT_FTP) -> Union[WorkoutMetrics, BatchMetrics]:
+    """Metrics for a single workout (WorkoutMetrics) or a batch of workouts (BatchMetrics)"""
+    if isinstance(workouts, IntervalTable) or (workouts and isinstance(workouts[0], WorkoutInterval)):
+        return compute_batch_metrics([workouts], intensity_ranges, ftp)[0]
+    return compute_batch_metrics(workouts, intensity_ranges, ftp)
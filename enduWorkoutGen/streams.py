@@ -0,0 +1,106 @@
+import os
+from typing import Sequence, Union
+
+import numpy as np
+
+from enduWorkoutGen.workoutgen import IntervalTable, IntervalsLike
+
+# Power in % of FTP fits comfortably in 16 bits and halves the size of long streams
+DEFAULT_DTYPE = np.int16
+
+
+def _fill(out: np.ndarray, starts: np.ndarray, ends: np.ndarray, powers: np.ndarray):
+    """Write the 1 Hz power of one workout into out (which starts at second 0)"""
+    durations = np.maximum(ends - starts, 0)
+    if not len(durations):
+        return
+    if starts[0] == 0 and np.array_equal(starts[1:], ends[:-1]):
+        # Back-to-back intervals, as generated: a single repeat
+        out[:ends[-1]] = np.repeat(powers, durations)
+    else:
+        # Gaps (left at 0) or overlaps (later intervals win): write every second by index
+        first_sample = np.cumsum(durations) - durations
+        index = np.repeat(starts - first_sample, durations) + np.arange(durations.sum())
+        out[index] = np.repeat(powers, durations)
+
+
+def expand_power(intervals: IntervalsLike, dtype=DEFAULT_DTYPE) -> np.ndarray:
+    """
+    Per-second target power (% of FTP) from second 0 to the end of the last interval.
+
+    One vectorized np.repeat over the interval columns; multiply by ftp / 100 for watts.
+    """
+    starts, ends, powers = IntervalTable.from_intervals(intervals).to_numpy()
+    out = np.zeros(int(ends.max()) if len(ends) else 0, dtype=dtype)
+    _fill(out, starts, ends, powers)
+    return out
+
+
+def write_power_streams(workouts: Sequence[IntervalsLike], path: Union[str, os.PathLike],
+                        dtype=DEFAULT_DTYPE) -> "PowerStreams":
+    """
+    Expand many workouts straight into a memory-mapped file and return a reader for it.
+
+    Streams are stored back to back in <path>.power.npy with their start offsets in
+    <path>.offsets.npy, so a multi-week set never has to fit in RAM at once.
+    """
+    path = os.fspath(path)
+    tables = [IntervalTable.from_intervals(workout) for workout in workouts]
+    lengths = np.fromiter((max(table.ends) if len(table) else 0 for table in tables), dtype=np.int64,
+                          count=len(tables))
+    offsets = np.concatenate([[0], np.cumsum(lengths)])
+
+    if offsets[-1]:
+        power = np.lib.format.open_memmap(path + ".power.npy", mode="w+", dtype=dtype, shape=(int(offsets[-1]),))
+        for i, table in enumerate(tables):
+            _fill(power[offsets[i]:offsets[i + 1]], *table.to_numpy())
+        power.flush()
+        del power
+    else:
+        np.save(path + ".power.npy", np.zeros(0, dtype=dtype))  # mmap can't map an empty file
+    np.save(path + ".offsets.npy", offsets)
+    return PowerStreams(path)
+
+
+class PowerStreams:
+    """
+    Read-only view of streams written by write_power_streams.
+
+    Indexing returns zero-copy slices of the memory map: streams[i] is one workout,
+    streams.span(first, last) the back-to-back streams of workouts first..last-1.
+    """
+
+    def __init__(self, path: Union[str, os.PathLike]):
+        path = os.fspath(path)
+        self.offsets = np.load(path + ".offsets.npy")
+        self.power = np.load(path + ".power.npy", mmap_mode="r" if self.offsets[-1] else None)
+
+    def __len__(self):
+        return len(self.offsets) - 1
+
+    def __getitem__(self, index: int) -> np.ndarray:
+        if index < 0:
+            index += len(self)
+        if not 0 <= index < len(self):
+            raise IndexError("workout index out of range")
+        return self.power[self.offsets[index]:self.offsets[index + 1]]
+
+    def span(self, first: int, last: int) -> np.ndarray:
+        return self.power[self.offsets[first]:self.offsets[last]]
+
+    def duration_seconds(self) -> np.ndarray:
+        return np.diff(self.offsets)
+
+
+def normalized_power(stream: np.ndarray, window: int = 30) -> float:
+    """
+    Normalized power of a 1 Hz stream, the same definition as metrics.compute_metrics.
+
+    Works on memory-mapped slices without copying the whole stream; streams shorter
+    than the window fall back to their average power.
+    """
+    if len(stream) < window:
+        return float(stream.mean()) if len(stream) else 0.0
+    cumulative = np.concatenate([[0.0], np.cumsum(stream, dtype=np.float64)])
+    rolling = (cumulative[window:] - cumulative[:-window]) / window
+    return float(np.mean(rolling ** 4) ** 0.25)
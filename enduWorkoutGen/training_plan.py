@@ -0,0 +1,261 @@
+import os
+from dataclasses import dataclass
+from typing import List, Optional, Sequence, Union
+
+import numpy as np
+
+from enduWorkoutGen.instrumentation import timed
+from enduWorkoutGen.workoutgen import IntervalTable, WorkoutGenerator, WorkoutParameters, WorkoutSegment, derive_seed
+
+# Time constants (days) of chronic and acute training load
+CTL_DAYS = 42
+ATL_DAYS = 7
+
+# Days of the exponentially weighted sums computed at once; keeps the 1 / decay^day weights in float range
+_EWMA_BLOCK_DAYS = 256
+
+# How often a week's leftover TSS is moved to the days that can still take it
+_REBALANCE_PASSES = 3
+
+WeekTemplate = Sequence[Optional[WorkoutParameters]]  # seven days from the first of the week, None for rest
+
+
+def weekly_tss_ramp(weeks: int, start_tss: float, ramp: float = 0.08, recovery_every: int = 4,
+                    recovery_factor: float = 0.6) -> np.ndarray:
+    """
+    Weekly TSS targets for a progressive block.
+
+    Every build week is ramp (e.g. 8%) above the build week before it; every recovery_every-th
+    week is a recovery week at recovery_factor of the week before, after which the build
+    carries on where it left off. recovery_every=0 means no recovery weeks.
+    """
+    week = np.arange(weeks)
+    recovery = (week + 1) % recovery_every == 0 if recovery_every else np.zeros(weeks, dtype=bool)
+    build = np.cumsum(~recovery) - 1  # the latest build week, counted without recovery weeks
+    targets = start_tss * (1 + ramp) ** np.maximum(build, 0)
+    targets[recovery] *= recovery_factor
+    return targets
+
+
+def _ewma(tss: np.ndarray, days: float, initial) -> np.ndarray:
+    """load[t] = load[t-1] + (tss[t] - load[t-1]) / days along the last axis, for all rows at once"""
+    if days <= 1:
+        raise ValueError("training load time constants must be longer than a day")
+    decay = 1 - 1 / days
+    load = np.empty_like(tss)
+    previous = np.array(np.broadcast_to(initial, tss.shape[:-1]), dtype=np.float64)
+    for start in range(0, tss.shape[-1], _EWMA_BLOCK_DAYS):
+        block = tss[..., start:start + _EWMA_BLOCK_DAYS]
+        weights = decay ** np.arange(1, block.shape[-1] + 1)
+        # load[j] = decay^(j+1) * (previous + (1 - decay) * sum(tss[i] / decay^(i+1) for i <= j))
+        load[..., start:start + block.shape[-1]] = weights * (
+            previous[..., None] + (1 - decay) * np.cumsum(block / weights, axis=-1))
+        previous = load[..., start + block.shape[-1] - 1]
+    return load
+
+
+class TrainingLoad:
+    """
+    Chronic (CTL) and acute (ATL) training load and form (TSB) of daily TSS.
+
+    daily_tss is (days,) for one athlete or (athletes, days) for many; the loads are
+    exponentially weighted sums computed with NumPy for all rows at once. Changing a
+    day with update() adds the decayed difference to the days after it instead of
+    recomputing the series.
+    """
+
+    def __init__(self, daily_tss, ctl_days: float = CTL_DAYS, atl_days: float = ATL_DAYS,
+                 initial_ctl=0.0, initial_atl=0.0):
+        self.daily_tss = np.array(daily_tss, dtype=np.float64)
+        self.ctl_days = ctl_days
+        self.atl_days = atl_days
+        self.initial_ctl = np.asarray(initial_ctl, dtype=np.float64)
+        self.initial_atl = np.asarray(initial_atl, dtype=np.float64)
+        self.ctl = _ewma(self.daily_tss, ctl_days, self.initial_ctl)
+        self.atl = _ewma(self.daily_tss, atl_days, self.initial_atl)
+
+    @property
+    def tsb(self) -> np.ndarray:
+        """Form on the morning of each day: the day before's CTL minus its ATL"""
+        form = np.empty_like(self.ctl)
+        form[..., 0] = self.initial_ctl - self.initial_atl
+        form[..., 1:] = self.ctl[..., :-1] - self.atl[..., :-1]
+        return form
+
+    def update(self, day: int, tss: float, athlete: Optional[int] = None):
+        """Set one day's TSS (of one athlete's row when there are several)"""
+        index = day if athlete is None else (athlete, day)
+        delta = tss - self.daily_tss[index]
+        if not delta:
+            return
+        self.daily_tss[index] = tss
+        for load, days in ((self.ctl, self.ctl_days), (self.atl, self.atl_days)):
+            decay = 1 - 1 / days
+            tail = load[day:] if athlete is None else load[athlete, day:]
+            tail += delta * (1 - decay) * decay ** np.arange(tail.shape[-1])
+
+
+@dataclass
+class PlannedWorkout:
+    day: int
+    name: str
+    params: WorkoutParameters
+    seed: int
+    target_tss: float
+    tss: float
+    intervals: IntervalTable
+
+
+class TrainingPlan:
+    """
+    Daily workouts of a training block and their training load.
+
+    workouts has one entry per day, None for rest days. regenerate() replaces a single
+    day and updates the load incrementally. weekly_targets is the TSS each week was
+    planned for, which weekly_shortfall compares with what the workouts actually reach.
+    """
+
+    def __init__(self, generator: WorkoutGenerator, workouts: List[Optional[PlannedWorkout]], load: TrainingLoad,
+                 tolerance: float = 1.0, exact_zone_minutes: bool = False,
+                 weekly_targets: Optional[np.ndarray] = None):
+        self.generator = generator
+        self.workouts = workouts
+        self.load = load
+        self.tolerance = tolerance
+        self.exact_zone_minutes = exact_zone_minutes
+        self.weekly_targets = weekly_targets
+
+    def __len__(self):
+        return len(self.workouts)
+
+    @property
+    def weekly_tss(self) -> np.ndarray:
+        days = len(self.workouts) - len(self.workouts) % 7
+        return self.load.daily_tss[:days].reshape(-1, 7).sum(axis=1)
+
+    @property
+    def weekly_shortfall(self) -> np.ndarray:
+        """TSS each week is below its target (negative when above), e.g. where days hit the limit of their segments"""
+        if self.weekly_targets is None:
+            raise ValueError("the plan has no weekly targets")
+        return self.weekly_targets - self.weekly_tss
+
+    def _plan_day(self, day: int, params: WorkoutParameters, target_tss: float, seed: int) -> PlannedWorkout:
+        intervals = self.generator.generate_workout_for_target(
+            params, target_tss, self.tolerance, self.exact_zone_minutes, seed=seed, clamp=True)
+        return PlannedWorkout(day, self.generator.generate_workout_name(params, seed), params, seed, target_tss,
+                              self.generator.calculate_metrics(intervals), intervals)
+
+    def regenerate(self, day: int, params: Optional[WorkoutParameters] = None, target_tss: Optional[float] = None,
+                   seed: Optional[int] = None) -> Optional[PlannedWorkout]:
+        """
+        Replace one day's workout, keeping whatever isn't given from the current one.
+
+        A rest day needs params and target_tss; params=None on a rest day leaves it as it is.
+        """
+        current = self.workouts[day]
+        params = params or (current.params if current else None)
+        if params is None:
+            return None
+        if target_tss is None:
+            if current is None:
+                raise ValueError("a rest day needs a target_tss")
+            target_tss = current.target_tss
+        if seed is None:
+            seed = self.generator.rng.getrandbits(64)  # a new workout, not the same one again
+        workout = self._plan_day(day, params, target_tss, seed)
+        self.workouts[day] = workout
+        self.load.update(day, workout.tss)
+        return workout
+
+    def rest(self, day: int):
+        """Turn a day into a rest day"""
+        self.workouts[day] = None
+        self.load.update(day, 0.0)
+
+    def write_power_streams(self, path: Union[str, os.PathLike]):
+        """1 Hz power of every day (empty for rest days) in a memory-mapped file, see streams.write_power_streams"""
+        from enduWorkoutGen.streams import write_power_streams
+        return write_power_streams([w.intervals if w else IntervalTable() for w in self.workouts], path)
+
+
+def _scaled(params: WorkoutParameters, factor: float) -> WorkoutParameters:
+    """params with the total and every segment factor times as long, in whole minutes"""
+    # Segments round down so they never outgrow the (rounded) total
+    return WorkoutParameters(
+        segments=[WorkoutSegment(s.workout_type, max(int(s.duration_minutes * factor), 1)) for s in params.segments],
+        total_duration_minutes=round(params.total_duration_minutes * factor)
+    )
+
+
+@timed("generate_plan")
+def generate_plan(week: WeekTemplate, weekly_tss: Sequence[float], generator: Optional[WorkoutGenerator] = None,
+                  seed: Optional[int] = None, tolerance: float = 1.0, exact_zone_minutes: bool = False,
+                  scale_durations: bool = True, initial_ctl: float = 0.0, initial_atl: float = 0.0) -> TrainingPlan:
+    """
+    Generate a training block: the week template repeated once per entry of weekly_tss.
+
+    With scale_durations the template is the first week, and later weeks are as much
+    longer (or shorter) as their TSS is higher (or lower), since a fixed week can only
+    take so much load by intensity alone.
+
+    A week's TSS is first split over its training days by duration. Every day is generated
+    for its share with generate_workout_for_target; days whose segments can't get there
+    settle for the closest TSS they can reach, and what the week is still missing goes to
+    the days that hit their share. When no day has room left the week stays short of its
+    target without an error; see TrainingPlan.weekly_shortfall.
+
+    Args:
+        week (WeekTemplate): Seven days of WorkoutParameters, None for rest days.
+        weekly_tss (Sequence[float]): TSS per week, e.g. from weekly_tss_ramp.
+        generator (Optional[WorkoutGenerator]): Generator (and intensity ranges) to use.
+        seed (Optional[int]): Seed for a reproducible plan; every day gets its own derived seed.
+        tolerance (float): Allowed TSS difference per workout.
+        exact_zone_minutes (bool): See WorkoutGenerator.generate_workout_for_target.
+        scale_durations (bool): Scale durations with the weekly TSS; otherwise every week has the
+            template's durations and only the intensity changes.
+        initial_ctl, initial_atl (float): Training load before the first day.
+
+    Returns:
+        TrainingPlan: Workouts per day, their CTL/ATL/TSB and the weekly targets.
+    """
+    if len(week) != 7:
+        raise ValueError("a week template has seven days")
+    weights = np.array([params.total_duration_minutes if params else 0 for params in week], dtype=np.float64)
+    if not weights.any():
+        raise ValueError("the week template has no training days")
+
+    generator = generator or WorkoutGenerator()
+    if seed is None:
+        seed = generator.rng.getrandbits(64)
+    weekly_tss = np.asarray(weekly_tss, dtype=np.float64)
+    targets = np.outer(weekly_tss, weights / weights.sum())  # (weeks, 7)
+    plan = TrainingPlan(generator, [None] * (len(weekly_tss) * 7), TrainingLoad([]), tolerance, exact_zone_minutes,
+                        weekly_tss.copy())
+    training_days = np.flatnonzero(weights)
+
+    for w in range(len(weekly_tss)):
+        factor = weekly_tss[w] / weekly_tss[0] if scale_durations and weekly_tss[0] else 1.0
+        days = [_scaled(params, factor) if params and factor != 1.0 else params for params in week]
+        pending = training_days
+        for _ in range(_REBALANCE_PASSES + 1):
+            for d in pending:
+                day = w * 7 + d
+                plan.workouts[day] = plan._plan_day(day, days[d], targets[w, d], derive_seed(seed, day))
+            tss = np.array([plan.workouts[w * 7 + d].tss for d in training_days])
+            missing = weekly_tss[w] - tss.sum()
+            if abs(missing) <= tolerance:
+                break
+            # A day short of its target is at its ceiling and one above it at its floor; every
+            # other day can still move the way the week has to go, from where it is now
+            shares = targets[w, training_days]
+            movable = tss >= shares - tolerance if missing > 0 else tss <= shares + tolerance
+            free = training_days[movable]
+            if not len(free):
+                break
+            targets[w, free] = tss[movable] + missing * weights[free] / weights[free].sum()
+            pending = free
+
+    plan.load = TrainingLoad([workout.tss if workout else 0.0 for workout in plan.workouts],
+                             initial_ctl=initial_ctl, initial_atl=initial_atl)
+    return plan
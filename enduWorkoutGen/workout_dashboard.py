@@ -1,20 +1,79 @@
 import dash
-from dash import dcc, html, Input, Output, State, callback
+from dash import dcc, html, Input, Output, State, ALL, Patch, callback, ctx
 import dash_bootstrap_components as dbc
-import plotly.graph_objects as go
 from dash.exceptions import PreventUpdate
 import base64
 import io
+import os
+import secrets
+import threading
+from concurrent.futures import ThreadPoolExecutor
 from datetime import datetime
 import json
-from enduWorkoutGen.workoutgen import WorkoutGenerator, WorkoutParameters, WorkoutType, WorkoutSegment
+from typing import Dict, List, Optional, Tuple
+from enduWorkoutGen.workoutgen import WorkoutGenerator, WorkoutParameters, WorkoutType, WorkoutSegment, derive_seed
+from enduWorkoutGen.incremental import IncrementalWorkout, SegmentMemo
+from enduWorkoutGen.canonical import Deduplicator
+from enduWorkoutGen.exporters import EXPORTERS, ExportInfo, zip_bundle
+from enduWorkoutGen.metrics import DEFAULT_FTP
+from enduWorkoutGen.workout_store import StoredWorkout, WorkoutStore
+from enduWorkoutGen.generation_cache import GenerationCache
+from enduWorkoutGen.workout_index import IndexedWorkout, WorkoutIndex
+from enduWorkoutGen.figures import FigureCache, build_overlay_figure, build_power_figure
+from enduWorkoutGen import instrumentation
+
+# Threads rendering downloads in the background, and how many workouts may wait for them
+PRERENDER_WORKERS = 2
+PRERENDER_QUEUE = 32
+
+# Overlay candidates within 5% FTP / 30 s of an earlier one look the same, so only the first is drawn
+OVERLAY_POWER_STEP = 5
+OVERLAY_TIME_STEP = 30
+
+# Slider limits; callbacks and tokens come from the browser, so anything outside them is refused
+MIN_TOTAL_MINUTES, MAX_TOTAL_MINUTES = 20, 180
+MIN_SEGMENT_MINUTES, MAX_SEGMENT_MINUTES = 5, 120
+MAX_SEGMENTS = MAX_TOTAL_MINUTES // MIN_SEGMENT_MINUTES
+MIN_FTP, MAX_FTP = 50, 600
+MAX_NAME_LENGTH = 200
 
 class WorkoutDashboard:
-    def __init__(self):
+    def __init__(self, store: Optional[WorkoutStore] = None, instrument: Optional[bool] = None,
+                 profiling: Optional[bool] = None, cache: Optional[GenerationCache] = None,
+                 index: Optional[WorkoutIndex] = None):
+        """
+        Args:
+            store (Optional[WorkoutStore]): Store for generated workouts, a default one if omitted.
+            cache (Optional[GenerationCache]): Cache for regenerated workouts, metrics and downloads.
+                Defaults to an in-process cache, backed by WORKOUTGEN_CACHE_DIR when that is set,
+                so gunicorn workers share what any of them rendered.
+            index (Optional[WorkoutIndex]): Searchable index every generated workout is added to.
+                Defaults to the SQLite file in WORKOUTGEN_INDEX; without one, search is hidden and
+                nothing is indexed (a per-process index would give each gunicorn worker its own ids).
+            instrument (Optional[bool]): Collect metrics and serve them at /metrics.
+                Defaults to the WORKOUTGEN_METRICS environment variable.
+            profiling (Optional[bool]): Enable per-request cProfile under /debug/profile.
+                Defaults to the WORKOUTGEN_PROFILING environment variable.
+        """
         self.app = dash.Dash(__name__, external_stylesheets=[dbc.themes.BOOTSTRAP])
-        self.workout_generator = WorkoutGenerator()
+        self.workout_generator = WorkoutGenerator(
+            cache=cache if cache is not None
+            else GenerationCache(directory=os.environ.get("WORKOUTGEN_CACHE_DIR") or None))
+        # Workouts of all sessions; each browser tab only holds the id of its own
+        self.workout_store = store if store is not None else WorkoutStore()
+        # Generated segments by (type, allotted seconds, seed), so an edit only regenerates the segment it changed
+        self.segment_memo = SegmentMemo(self.workout_generator)
+        self.figure_cache = FigureCache()
+        index_path = os.environ.get("WORKOUTGEN_INDEX")
+        if index is None and index_path:
+            index = WorkoutIndex(index_path)
+        self.workout_index = index
+        # Downloads are rendered here as soon as a workout is shown, so the download callback just hands them out
+        self.prerender_executor = ThreadPoolExecutor(max_workers=PRERENDER_WORKERS, thread_name_prefix="prerender")
+        self._prerender_slots = threading.BoundedSemaphore(PRERENDER_QUEUE)
         self.setup_layout()
         self.setup_callbacks()
+        self.setup_instrumentation(instrument, profiling)
 
     def setup_layout(self):
         self.app.layout = dbc.Container([
@@ -34,8 +93,8 @@ class WorkoutDashboard:
                             dbc.Label("Total Duration (minutes):"),
                             dcc.Slider(
                                 id='total-duration',
-                                min=20,
-                                max=180,
+                                min=MIN_TOTAL_MINUTES,
+                                max=MAX_TOTAL_MINUTES,
                                 step=5,
                                 value=60,
                                 marks={i: str(i) for i in range(20, 181, 20)},
@@ -75,7 +134,25 @@ class WorkoutDashboard:
 
                     # Workout Graph
                     html.Div(id='graph-container', style={'display': 'none'}, children=[
-                        dcc.Graph(id='workout-graph')
+                        dcc.Graph(id='workout-graph'),
+                        dbc.Row([
+                            dbc.Col([
+                                html.Label("Download Format"),
+                                dcc.Dropdown(
+                                    id='download-format',
+                                    options=[{'label': file_type.upper(), 'value': file_type}
+                                             for file_type in EXPORTERS]
+                                            + [{'label': "All formats (ZIP)", 'value': 'zip'}],
+                                    value='mrc',
+                                    clearable=False
+                                )
+                            ], width=4),
+                            dbc.Col([
+                                html.Label("FTP for ERG (watts)"),
+                                dbc.Input(id='download-ftp', type='number', value=DEFAULT_FTP, min=MIN_FTP, max=MAX_FTP,
+                                          step=1)
+                            ], width=4)
+                        ])
                     ]),
 
                     # Download Button
@@ -86,175 +163,507 @@ class WorkoutDashboard:
                         className="mt-3",
                         style={'display': 'none'}
                     ),
-                    dcc.Download(id="download-workout")
+                    dcc.Download(id="download-workout"),
+                    dcc.Store(id="workout-token")
                 ])
-            ])
-
-        ], fluid=True)
-
-    def setup_callbacks(self):
-        @self.app.callback(
-            Output('segments-container', 'children'),
-            [Input('add-segment', 'n_clicks')],
-            [State('segments-container', 'children')],
-            prevent_initial_call=True
-        )
-        def update_segments(n_clicks, existing_segments):
-            if n_clicks is None:
-                return []
-
-            if existing_segments is None:
-                existing_segments = []
-
-            segment_index = len(existing_segments)
+            ], className="mb-4"),
 
-            new_segment = dbc.Card([
+            # Candidate Comparison Section
+            dbc.Card([
+                dbc.CardHeader(html.H3("Candidate Comparison")),
                 dbc.CardBody([
                     dbc.Row([
                         dbc.Col([
-                            dbc.Label("Workout Type:"),
-                            dcc.Dropdown(
-                                options=[{'label': wt.value.title(), 'value': wt.value}
-                                         for wt in WorkoutType],
-                                value=WorkoutType.ENDURANCE.value,
-                                id={'type': 'segment-type', 'index': segment_index}
+                            dbc.Label("Number of candidates:"),
+                            dbc.Input(id='candidate-count', type='number', min=2, max=500, step=1, value=100),
+                        ], width=4),
+                        dbc.Col([
+                            dbc.Button(
+                                "Overlay Candidates",
+                                id="overlay-button",
+                                color="secondary",
+                                className="mt-4"
                             ),
-                        ], width=8),
+                        ], width=4),
+                    ]),
+                    html.Div(id='overlay-container', style={'display': 'none'}, children=[
+                        dcc.Graph(id='overlay-graph')
+                    ]),
+                ])
+            ], className="mb-4"),
+
+            # Workout Search Section, only with an index to search
+            dbc.Card(style=None if self.workout_index is not None else {'display': 'none'}, children=[
+                dbc.CardHeader(html.H3("Find Workouts")),
+                dbc.CardBody([
+                    dbc.Row([
                         dbc.Col([
                             dbc.Label("Duration (minutes):"),
-                            dcc.Slider(
-                                min=5,
-                                max=120,
-                                step=5,
-                                value=15,
-                                marks={i: str(i) for i in range(0, 121, 15)},
-                                id={'type': 'segment-duration', 'index': segment_index}
+                            dcc.RangeSlider(id='search-duration', min=20, max=180, step=5, value=[60, 75],
+                                            marks={i: str(i) for i in range(20, 181, 20)}),
+                        ], width=6),
+                        dbc.Col([
+                            dbc.Label("TSS:"),
+                            dcc.RangeSlider(id='search-tss', min=0, max=300, step=5, value=[70, 80],
+                                            marks={i: str(i) for i in range(0, 301, 50)}),
+                        ], width=6),
+                    ], className="mb-3"),
+                    dbc.Row([
+                        dbc.Col([
+                            dbc.Label("At least (minutes):"),
+                            dbc.Input(id='search-zone-minutes', type='number', min=0, step=1, value=20),
+                        ], width=3),
+                        dbc.Col([
+                            dbc.Label("In zone:"),
+                            dcc.Dropdown(
+                                id='search-zone',
+                                options=[{'label': wt.value.title(), 'value': wt.value} for wt in WorkoutType],
+                                value=WorkoutType.THRESHOLD.value
                             ),
-                        ], width=4),
-                    ])
+                        ], width=3),
+                        dbc.Col([
+                            dbc.Button("Search", id="search-button", color="secondary", className="mt-4"),
+                        ], width=3),
+                    ]),
+                    html.Div(id='search-results', className="mt-3"),
                 ])
-            ], className="mb-3")
+            ])
 
-            return existing_segments + [new_segment]
+        ], fluid=True)
 
-        @self.app.callback(
+    def setup_callbacks(self):
+        self.app.callback(
+            Output('segments-container', 'children'),
+            [Input('add-segment', 'n_clicks'),
+             Input({'type': 'remove-segment', 'index': ALL}, 'n_clicks')],
+            State({'type': 'segment-type', 'index': ALL}, 'id'),
+            prevent_initial_call=True
+        )(self._callback(self.update_segments))
+
+        self.app.callback(
             [Output('workout-graph', 'figure'),
              Output('workout-info', 'children'),
              Output('download-button', 'style'),
              Output('graph-container', 'style'),
-             Output('download-button', 'n_clicks')],
+             Output('download-button', 'n_clicks'),
+             Output('workout-token', 'data')],
             Input('generate-button', 'n_clicks'),
             [State('total-duration', 'value'),
-             State('segments-container', 'children')],
+             State({'type': 'segment-type', 'index': ALL}, 'value'),
+             State({'type': 'segment-duration', 'index': ALL}, 'value'),
+             State('workout-token', 'data'),
+             State('download-ftp', 'value'),
+             State({'type': 'segment-type', 'index': ALL}, 'id')],
             prevent_initial_call=True
-        )
-        def generate_workout(n_clicks, total_duration, segments):
-            if not segments:
-                raise PreventUpdate
-
-            # Parse segments
-            workout_segments = []
-            for segment in segments:
-                # Extract workout type and duration from the segment structure
-                card_body = segment['props']['children'][0]['props']['children']
-                row = card_body[0]['props']['children']
-
-                # Get workout type from first column
-                workout_type_dropdown = row[0]['props']['children'][1]
-                segment_type = workout_type_dropdown['props']['value']
-
-                # Get duration from second column
-                duration_slider = row[1]['props']['children'][1]
-                segment_duration = duration_slider['props']['value']
-
-                workout_segments.append(
-                    WorkoutSegment(WorkoutType(segment_type), segment_duration)
-                )
-
-            # Generate workout
-            params = WorkoutParameters(segments=workout_segments, total_duration_minutes=total_duration)
-            intervals = self.workout_generator.generate_workout(params)
-
-            # Create figure
-            fig = go.Figure()
-            x_values = []
-            y_values = []
-
-            for interval in intervals:
-                x_values.extend([interval.start_time / 60, interval.end_time / 60])
-                y_values.extend([interval.power, interval.power])
-
-            fig.add_trace(go.Scatter(
-                x=x_values,
-                y=y_values,
-                mode='lines',
-                name='Power'
-            ))
-
-            fig.update_layout(
-                title='Workout Profile',
-                xaxis_title='Time (minutes)',
-                yaxis_title='Power (% FTP)',
-                showlegend=True,
-                template='plotly_white'
-            )
-
-            # Calculate metrics
-            tss = self.workout_generator.calculate_metrics(intervals)
-
-            # Create workout info
-            workout_name = self.workout_generator.generate_workout_name(params)
-            description = self.workout_generator.create_workout_description(params)
-
-            info_div = html.Div([
-                html.H4(workout_name, className="mb-3"),
-                html.P(description, className="text-muted"),
-                html.P(f"Training Stress Score (TSS): {tss}", className="fw-bold")
-            ])
-
-            # Store workout data for download
-            self.current_workout = {
-                'intervals': intervals,
-                'name': workout_name,
-                'description': description
-            }
-
-            return fig, info_div, {'display': 'block'}, {'display': 'block'}, None
+        )(self._callback(self.generate_workout))
+
+        self.app.callback(
+            [Output('overlay-graph', 'figure'),
+             Output('overlay-container', 'style')],
+            Input('overlay-button', 'n_clicks'),
+            [State('candidate-count', 'value'),
+             State('total-duration', 'value'),
+             State({'type': 'segment-type', 'index': ALL}, 'value'),
+             State({'type': 'segment-duration', 'index': ALL}, 'value'),
+             State('workout-token', 'data')],
+            prevent_initial_call=True
+        )(self._callback(self.overlay_candidates))
+
+        self.app.callback(
+            Output('search-results', 'children'),
+            Input('search-button', 'n_clicks'),
+            [State('search-duration', 'value'),
+             State('search-tss', 'value'),
+             State('search-zone', 'value'),
+             State('search-zone-minutes', 'value')],
+            prevent_initial_call=True
+        )(self._callback(self.search_workouts))
+
+        self.app.callback(
+            [Output('workout-graph', 'figure', allow_duplicate=True),
+             Output('workout-info', 'children', allow_duplicate=True),
+             Output('download-button', 'style', allow_duplicate=True),
+             Output('graph-container', 'style', allow_duplicate=True),
+             Output('download-button', 'n_clicks', allow_duplicate=True),
+             Output('workout-token', 'data', allow_duplicate=True)],
+            Input({'type': 'load-indexed', 'index': ALL}, 'n_clicks'),
+            [State('workout-token', 'data'),
+             State('download-ftp', 'value')],
+            prevent_initial_call=True
+        )(self._callback(self.load_indexed_workout))
 
-        @self.app.callback(
+        self.app.callback(
             Output("download-workout", "data"),
             Input("download-button", "n_clicks"),
+            State("workout-token", "data"),
+            State("download-format", "value"),
+            State("download-ftp", "value"),
             prevent_initial_call=True
+        )(self._callback(self.download_workout))
+
+    def setup_instrumentation(self, instrument: Optional[bool], profiling: Optional[bool]):
+        if instrument is None:
+            instrument = instrumentation.REGISTRY.enabled
+        if instrument:
+            instrumentation.enable()
+            instrumentation.install_metrics_endpoint(self.app.server)
+
+        if profiling is None:
+            profiling = os.environ.get("WORKOUTGEN_PROFILING", "") not in ("", "0")
+        self.profiler = instrumentation.RequestProfiler() if profiling else None
+        if self.profiler:
+            self.profiler.install(self.app.server)
+
+    def _callback(self, func):
+        # Time every callback; PreventUpdate is Dash's normal "nothing to do", not an error
+        return instrumentation.timed_callback(func.__name__, ignored=(PreventUpdate,))(func)
+
+    @staticmethod
+    def segment_card(segment_index: int):
+        return dbc.Card([
+            dbc.CardBody([
+                dbc.Row([
+                    dbc.Col([
+                        dbc.Label("Workout Type:"),
+                        dcc.Dropdown(
+                            options=[{'label': wt.value.title(), 'value': wt.value}
+                                     for wt in WorkoutType],
+                            value=WorkoutType.ENDURANCE.value,
+                            id={'type': 'segment-type', 'index': segment_index}
+                        ),
+                    ], width=6),
+                    dbc.Col([
+                        dbc.Label("Duration (minutes):"),
+                        dcc.Slider(
+                            min=MIN_SEGMENT_MINUTES,
+                            max=MAX_SEGMENT_MINUTES,
+                            step=5,
+                            value=15,
+                            marks={i: str(i) for i in range(0, 121, 15)},
+                            id={'type': 'segment-duration', 'index': segment_index}
+                        ),
+                    ], width=4),
+                    dbc.Col([
+                        dbc.Button(
+                            "Remove",
+                            id={'type': 'remove-segment', 'index': segment_index},
+                            color="danger",
+                            outline=True,
+                            size="sm",
+                            className="mt-4"
+                        ),
+                    ], width=2),
+                ])
+            ])
+        ], className="mb-3")
+
+    def update_segments(self, add_clicks, remove_clicks, segment_ids):
+        # Only the change travels back to the browser: one appended card or one deletion
+        patch = Patch()
+        if ctx.triggered_id == 'add-segment':
+            # n_clicks only grows, so it makes a unique index even after removals
+            patch.append(self.segment_card(add_clicks))
+            return patch
+
+        # Newly added remove buttons also trigger this callback, with no clicks yet
+        if not ctx.triggered or not ctx.triggered[0]['value']:
+            raise PreventUpdate
+        position = [segment_id['index'] for segment_id in segment_ids].index(ctx.triggered_id['index'])
+        del patch[position]
+        return patch
+
+    @staticmethod
+    def workout_info(workout_name: str, description: str, metrics) -> html.Div:
+        """Name, description and headline metrics of a WorkoutMetrics or IndexedWorkout"""
+        return html.Div([
+            html.H4(workout_name, className="mb-3"),
+            html.P(description, className="text-muted"),
+            html.P(f"Training Stress Score (TSS): {metrics.tss}", className="fw-bold"),
+            html.P(f"Normalized Power: {metrics.normalized_power}% FTP "
+                   f"(IF {metrics.intensity_factor:.2f})", className="fw-bold")
+        ])
+
+    @staticmethod
+    def workout_parameters(total_duration, segment_types, segment_durations) -> WorkoutParameters:
+        return WorkoutParameters(
+            segments=[WorkoutSegment(WorkoutType(t), d) for t, d in zip(segment_types, segment_durations)],
+            total_duration_minutes=total_duration
         )
-        def download_workout(n_clicks):
-            if n_clicks is None:
-                raise PreventUpdate
-
-            if not hasattr(self, 'current_workout'):
-                raise PreventUpdate
-
-            # Create a temporary file
-            from tempfile import NamedTemporaryFile
-            import os
-
-            with NamedTemporaryFile(mode='w', delete=False, suffix='.mrc') as temp_file:
-                # Export to temporary file
-                self.workout_generator.export_mrc(
-                    self.current_workout['intervals'],
-                    temp_file.name,
-                    self.current_workout['description']
-                )
-
-                # Read the contents
-                with open(temp_file.name, 'r') as f:
-                    content = f.read()
-
-                # Clean up
-                os.unlink(temp_file.name)
-
-            return dict(
-                content=content,
-                filename=f"{self.current_workout['name']}.mrc"
-            )
+
+    @staticmethod
+    def valid_parameters(total_duration, segments) -> bool:
+        """Whether a total duration and [type, minutes] segments are something the sliders can produce"""
+        def minutes(value, low, high):
+            return isinstance(value, int) and not isinstance(value, bool) and low <= value <= high
+
+        return (minutes(total_duration, MIN_TOTAL_MINUTES, MAX_TOTAL_MINUTES)
+                and isinstance(segments, list) and 0 < len(segments) <= MAX_SEGMENTS
+                and all(isinstance(segment, (list, tuple)) and len(segment) == 2
+                        and segment[0] in [wt.value for wt in WorkoutType]
+                        and minutes(segment[1], MIN_SEGMENT_MINUTES, MAX_SEGMENT_MINUTES)
+                        for segment in segments))
+
+    @classmethod
+    def valid_token(cls, token) -> bool:
+        """Whether a token from the browser only asks for a workout the dashboard could have generated"""
+        if not isinstance(token, dict) or not isinstance(token.get('id'), str):
+            return False
+        if not isinstance(token.get('name'), str) or len(token['name']) > MAX_NAME_LENGTH:
+            return False
+        if not cls.valid_parameters(token.get('total'), token.get('segments')):
+            return False
+        seeds = token.get('segment_seeds')
+        if seeds is not None:
+            # Per-segment seeds come with the card id of every segment, see segment_seeds
+            card_ids = token.get('segment_ids')
+            if not isinstance(seeds, list) or not isinstance(card_ids, list) \
+                    or not len(seeds) == len(card_ids) == len(token['segments']) \
+                    or not all(isinstance(value, int) for value in seeds + card_ids):
+                return False
+        index_id = token.get('index_id')
+        return (token.get('seed') is None or isinstance(token['seed'], int)) and \
+            (index_id is None or isinstance(index_id, int))
+
+    def lookup_workout(self, token: Optional[dict]) -> Optional[Tuple[str, StoredWorkout]]:
+        """
+        Find the workout a session's token points to.
+
+        The token in the browser holds the workout's id plus its seed (or per-segment seeds)
+        and parameters.
+        When this process doesn't have the id (evicted, or generated by another worker),
+        the workout is read back from the workout index, or else rebuilt deterministically
+        from the seed, so any worker can serve it. Tokens outside the slider limits are
+        refused rather than rebuilt.
+        """
+        if not token or not self.valid_token(token):
+            return None
+        workout_id = token['id']
+        workout = self.workout_store.get(workout_id)
+        if workout is None:
+            params = self.workout_parameters(token['total'], *zip(*token['segments']))
+            indexed = self.workout_index.get(token['index_id']) \
+                if token.get('index_id') and self.workout_index is not None else None
+            if indexed is not None:
+                intervals = indexed.intervals
+            elif token.get('segment_seeds'):
+                intervals = IncrementalWorkout(self.workout_generator, params, token['segment_seeds'],
+                                               self.segment_memo).intervals()
+            elif token.get('seed') is not None:
+                intervals = self.workout_generator.generate_workout(params, seed=token['seed'])
+            else:
+                return None
+            description = self.workout_generator.create_workout_description(params)
+            self.workout_store.put(intervals, token['name'], description, workout_id=workout_id)
+            workout = self.workout_store.get(workout_id)
+            if workout is None:
+                return None
+        return workout_id, workout
+
+    @staticmethod
+    def segment_seeds(total_duration, segments: List[list], card_ids: List[int],
+                      previous_token: Optional[dict]) -> List[int]:
+        """
+        A seed per segment card: cards the user didn't touch since the last workout keep
+        theirs, so only edited or added segments are regenerated. Pressing Generate without
+        any change gives every segment a fresh seed, i.e. a new workout.
+        """
+        previous = {}
+        if previous_token and previous_token.get('segment_seeds') and previous_token['total'] == total_duration:
+            previous = {card: (segment, seed) for card, segment, seed in zip(
+                previous_token['segment_ids'], previous_token['segments'], previous_token['segment_seeds'])}
+        kept = [previous[card][1] if card in previous and previous[card][0] == segment else None
+                for card, segment in zip(card_ids, segments)]
+        if None not in kept and len(kept) == len(previous):
+            kept = [None] * len(kept)  # unchanged
+        # 53 bits survive the round trip through the browser's JSON numbers
+        return [seed if seed is not None else secrets.randbits(53) for seed in kept]
+
+    def generate_workout(self, n_clicks, total_duration, segment_types, segment_durations, previous_token=None,
+                         ftp=None, segment_ids=None):
+        segments = [[t, d] for t, d in zip(segment_types or [], segment_durations or [])]
+        if not self.valid_parameters(total_duration, segments):
+            raise PreventUpdate
+        if not self.valid_token(previous_token):
+            previous_token = None  # nothing to keep seeds from, or to cancel
+
+        # Every segment has its own seed; the seeds are what make it reproducible on any worker
+        params = self.workout_parameters(total_duration, segment_types, segment_durations)
+        card_ids = [segment_id['index'] for segment_id in segment_ids] if segment_ids else list(range(len(segments)))
+        seeds = self.segment_seeds(total_duration, segments, card_ids, previous_token)
+        workout = IncrementalWorkout(self.workout_generator, params, seeds, self.segment_memo)
+        intervals = workout.intervals()
+
+        # Metrics from the memoized per-segment sums, not a pass over the whole workout
+        metrics = workout.metrics()
+
+        # Create workout info
+        workout_name = self.workout_generator.generate_workout_name(params, seed=derive_seed(*seeds))
+        description = self.workout_generator.create_workout_description(params)
+
+        info_div = self.workout_info(workout_name, description, metrics)
+
+        # Store workout data for download; the token goes to this session's dcc.Store
+        workout_id = self.workout_store.put(intervals, workout_name, description)
+        self.replace_downloads(previous_token, workout_id, ftp)
+        # Not reproducible by generate_workout from a single seed, so indexed without one; the same
+        # intervals are only indexed once, so pressing Generate on an unchanged workout adds nothing
+        index_id = None
+        if self.workout_index is not None:
+            index_id = self.workout_index.add(params, None, workout_name, description, intervals, metrics,
+                                              dedup=True)
+        token = {
+            'id': workout_id,
+            'seed': None,
+            'segment_seeds': seeds,
+            'segment_ids': card_ids,
+            'name': workout_name,
+            'total': total_duration,
+            'segments': segments,
+            # Only a file-backed index has the same ids in every worker
+            'index_id': index_id if index_id is not None and self.workout_index.shared else None,
+        }
+        fig = self.figure_cache.get_or_build(workout_id, lambda: build_power_figure(intervals))
+
+        return fig, info_div, {'display': 'block'}, {'display': 'block'}, None, token
+
+    def overlay_candidates(self, n_clicks, candidate_count, total_duration, segment_types, segment_durations,
+                           token):
+        segments = [[t, d] for t, d in zip(segment_types or [], segment_durations or [])]
+        if not candidate_count or not self.valid_parameters(total_duration, segments):
+            raise PreventUpdate
+
+        params = self.workout_parameters(total_duration, segment_types, segment_durations)
+        candidates = self.workout_generator.generate_workouts_batch(
+            params, min(int(candidate_count), 500), dedup=Deduplicator(OVERLAY_POWER_STEP, OVERLAY_TIME_STEP))
+
+        # Draw the session's current workout on top, if it has one
+        current = self.lookup_workout(token)
+        fig = build_overlay_figure(candidates, highlight=current[1].intervals if current else None)
+        return fig, {'display': 'block'}
+
+    def search_workouts(self, n_clicks, duration_range, tss_range, zone, zone_minutes):
+        """List indexed workouts matching the filters; nothing is generated"""
+        if self.workout_index is None:
+            raise PreventUpdate
+        min_zone_minutes = {WorkoutType(zone): zone_minutes} if zone and zone_minutes else None
+        matches = self.workout_index.query(duration_range[0], duration_range[1], tss_range[0], tss_range[1],
+                                           min_zone_minutes)
+        if not matches:
+            return html.P("No indexed workouts match; generate some or index a library first.",
+                          className="text-muted")
+
+        header = html.Thead(html.Tr([html.Th(title) for title in
+                                     ("Name", "Minutes", "TSS", "IF", f"{zone.title()} min" if zone else "", "")]))
+        rows = [
+            html.Tr([
+                html.Td(workout.name),
+                html.Td(workout.duration_seconds // 60),
+                html.Td(workout.tss),
+                html.Td(f"{workout.intensity_factor:.2f}"),
+                html.Td(workout.time_in_zone.get(WorkoutType(zone), 0) // 60 if zone else ""),
+                html.Td(dbc.Button("Load", id={'type': 'load-indexed', 'index': workout.id}, size="sm")),
+            ])
+            for workout in matches
+        ]
+        return dbc.Table([header, html.Tbody(rows)], striped=True, hover=True, size="sm")
+
+    def load_indexed_workout(self, load_clicks, previous_token=None, ftp=None):
+        """Show an indexed workout like a freshly generated one, ready to download"""
+        if not ctx.triggered_id or not any(load_clicks):
+            raise PreventUpdate  # the buttons were just rendered
+        if self.workout_index is None:
+            raise PreventUpdate
+        workout: Optional[IndexedWorkout] = self.workout_index.get(ctx.triggered_id['index'])
+        if workout is None:
+            raise PreventUpdate
+        if not self.valid_token(previous_token):
+            previous_token = None
+
+        intervals = workout.intervals
+        workout_id = self.workout_store.put(intervals, workout.name, workout.description)
+        self.replace_downloads(previous_token, workout_id, ftp)
+        token = {
+            'id': workout_id,
+            'seed': workout.seed,
+            'name': workout.name,
+            'total': workout.params.total_duration_minutes,
+            'segments': [[s.workout_type.value, s.duration_minutes] for s in workout.params.segments],
+            'index_id': workout.id if self.workout_index.shared else None,
+        }
+        fig = self.figure_cache.get_or_build(workout_id, lambda: build_power_figure(intervals))
+        info_div = self.workout_info(workout.name, workout.description, workout)
+        return fig, info_div, {'display': 'block'}, {'display': 'block'}, None, token
+
+    @staticmethod
+    def download_ftp(ftp) -> Optional[int]:
+        """
+        FTP for the downloads from the FTP input: DEFAULT_FTP when it's empty, None when it's out of range.
+
+        Whole watts, like the input's steps, so 250 and 250.0 prerender and download under the same export_key.
+        """
+        if ftp is None:
+            return DEFAULT_FTP
+        if not isinstance(ftp, (int, float)) or isinstance(ftp, bool) or not MIN_FTP <= ftp <= MAX_FTP:
+            return None
+        return int(round(ftp))
+
+    @staticmethod
+    def export_key(file_type: str, ftp: int) -> str:
+        # ERG watts (and the ERG in a bundle) depend on the FTP, so they are stored per FTP (from download_ftp)
+        return f"{file_type}@{ftp}" if file_type in ('erg', 'zip') else file_type
+
+    def render_exports(self, workout: StoredWorkout, ftp: int) -> Dict[str, bytes]:
+        """Every download of a workout, keyed by export_key, from a single render pass"""
+        files = self.workout_generator.render(workout.intervals, list(EXPORTERS),
+                                              ExportInfo(workout.name, workout.description, ftp=ftp))
+        exports = {self.export_key(file_type, ftp): content for file_type, content in files.items()}
+        exports[self.export_key('zip', ftp)] = zip_bundle(files, workout.name)
+        return exports
+
+    def replace_downloads(self, previous_token: Optional[dict], workout_id: str, ftp: Optional[float]):
+        """
+        Start rendering the downloads of a session's new workout in the background.
+
+        Rendering for the workout it replaces is cancelled if it hasn't started. When
+        PRERENDER_QUEUE workouts are already waiting, nothing is queued and the download
+        renders on demand as before.
+        """
+        if previous_token:
+            self.workout_store.cancel(previous_token.get('id'))
+        ftp = self.download_ftp(ftp)
+        if ftp is None or not self._prerender_slots.acquire(blocking=False):
+            return
+        future = self.workout_store.prerender(workout_id, lambda w: self.render_exports(w, ftp),
+                                              self.prerender_executor)
+        if future is None:
+            self._prerender_slots.release()
+        else:
+            future.add_done_callback(lambda _: self._prerender_slots.release())
+
+    def render_download(self, workout: StoredWorkout, file_type: str, ftp: int) -> bytes:
+        """One export of a workout, or a ZIP of all of them for file_type "zip", rendered in one pass"""
+        formats = list(EXPORTERS) if file_type == 'zip' else [file_type]
+        files = self.workout_generator.render(workout.intervals, formats,
+                                              ExportInfo(workout.name, workout.description, ftp=ftp))
+        return zip_bundle(files, workout.name) if file_type == 'zip' else files[file_type]
+
+    def download_workout(self, n_clicks, token, file_type='mrc', ftp=None):
+        if n_clicks is None:
+            raise PreventUpdate
+        file_type = file_type or 'mrc'
+        ftp = self.download_ftp(ftp)
+        if not isinstance(file_type, str) or (file_type not in EXPORTERS and file_type != 'zip') or ftp is None:
+            raise PreventUpdate
+
+        found = self.lookup_workout(token)
+        if found is None:
+            raise PreventUpdate
+        workout_id, workout = found
+
+        # Usually prerendered by now; otherwise export() waits for or renders it
+        content = self.workout_store.export(workout_id, self.export_key(file_type, ftp),
+                                            lambda w: self.render_download(w, file_type, ftp))
+        return dcc.send_bytes(content, f"{workout.name}.{file_type}")
+
     def run_server(self, debug=True):
         self.app.run_server(host="0.0.0.0",port=8050,debug=debug)
\ No newline at end of file
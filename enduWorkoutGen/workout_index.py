@@ -0,0 +1,274 @@
+import json
+import sqlite3
+import threading
+import time
+from dataclasses import dataclass
+from typing import Dict, Iterable, List, Mapping, Optional, Sequence, Tuple
+
+from enduWorkoutGen.workoutgen import (INTENSITY_RANGES, IntervalTable, IntervalsLike, WorkoutParameters,
+                                       WorkoutSegment, WorkoutType)
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS workouts (
+    id INTEGER PRIMARY KEY,
+    name TEXT NOT NULL,
+    description TEXT NOT NULL,
+    type_mix TEXT NOT NULL,
+    segments TEXT NOT NULL,
+    total_minutes INTEGER NOT NULL,
+    seed TEXT,  -- derive_seed gives unsigned 64-bit seeds, beyond SQLite's INTEGER
+    intervals BLOB NOT NULL,
+    duration_seconds INTEGER NOT NULL,
+    tss REAL NOT NULL,
+    normalized_power REAL NOT NULL,
+    intensity_factor REAL NOT NULL,
+    recovery_seconds INTEGER NOT NULL,
+    created REAL NOT NULL,
+    fingerprint TEXT,  -- canonical.fingerprint of the intervals
+    UNIQUE (segments, total_minutes, seed)
+);
+CREATE TABLE IF NOT EXISTS workout_zones (
+    workout_id INTEGER NOT NULL REFERENCES workouts(id) ON DELETE CASCADE,
+    zone TEXT NOT NULL,
+    seconds INTEGER NOT NULL,
+    PRIMARY KEY (workout_id, zone)
+);
+CREATE INDEX IF NOT EXISTS workouts_type_mix ON workouts (type_mix, tss);
+CREATE INDEX IF NOT EXISTS workouts_duration ON workouts (duration_seconds, tss);
+CREATE INDEX IF NOT EXISTS workouts_tss ON workouts (tss);
+CREATE INDEX IF NOT EXISTS workout_zones_seconds ON workout_zones (zone, seconds);
+"""
+
+# (params, seed, name, description, intervals) for add_many
+WorkoutEntry = Tuple[WorkoutParameters, Optional[int], str, str, IntervalsLike]
+
+
+def type_mix(workout_types: Iterable[WorkoutType]) -> str:
+    """Order-independent key of the workout types in a workout, e.g. "threshold+vo2" """
+    return "+".join(sorted({wt.value for wt in workout_types}))
+
+
+@dataclass
+class IndexedWorkout:
+    id: int
+    name: str
+    description: str
+    params: WorkoutParameters
+    seed: Optional[int]
+    packed_intervals: bytes  # IntervalTable.tobytes()
+    duration_seconds: int
+    tss: float
+    normalized_power: float
+    intensity_factor: float
+    recovery_seconds: int
+    time_in_zone: Dict[WorkoutType, int]  # seconds
+
+    @property
+    def intervals(self) -> IntervalTable:
+        return IntervalTable.frombytes(self.packed_intervals)
+
+
+class WorkoutIndex:
+    """
+    Persistent SQLite index of generated workouts, searchable by duration, TSS, type mix and time in zone.
+
+    Every workout is stored with its parameters, seed, packed intervals (and their
+    canonical.fingerprint) and precomputed metrics, so queries never generate anything.
+    Use ":memory:" for a throwaway index.
+    """
+
+    def __init__(self, db_path: str = "workouts.sqlite", intensity_ranges=INTENSITY_RANGES):
+        self.db_path = db_path
+        self.intensity_ranges = intensity_ranges  # defines the zones of time_in_zone
+        # WAL and a busy timeout let several dashboard workers write to the same file
+        self._db = sqlite3.connect(db_path, timeout=30, check_same_thread=False)
+        self._db.execute("PRAGMA journal_mode = WAL")
+        self._db.execute("PRAGMA foreign_keys = ON")
+        self._db.executescript(SCHEMA)
+        self._migrate()
+        self._lock = threading.Lock()
+
+    @property
+    def shared(self) -> bool:
+        """Whether other processes see the same ids (a file, not ":memory:")"""
+        return self.db_path not in ("", ":memory:")
+
+    def close(self):
+        self._db.close()
+
+    def _migrate(self):
+        # Indexes written before fingerprints existed get the column, and the fingerprints of their workouts
+        columns = {row[1] for row in self._db.execute("PRAGMA table_info(workouts)")}
+        if "fingerprint" not in columns:
+            from enduWorkoutGen.canonical import fingerprint
+
+            with self._db:
+                try:
+                    self._db.execute("ALTER TABLE workouts ADD COLUMN fingerprint TEXT")
+                except sqlite3.OperationalError:
+                    pass  # another worker opening the same file just added it
+                rows = self._db.execute("SELECT id, intervals FROM workouts WHERE fingerprint IS NULL").fetchall()
+                self._db.executemany("UPDATE workouts SET fingerprint = ? WHERE id = ?",
+                                     [(fingerprint(IntervalTable.frombytes(packed)), workout_id)
+                                      for workout_id, packed in rows])
+        self._db.execute("CREATE INDEX IF NOT EXISTS workouts_fingerprint ON workouts (fingerprint)")
+
+    def add(self, params: WorkoutParameters, seed: Optional[int], name: str, description: str,
+            intervals: IntervalsLike, metrics=None, dedup: bool = False) -> Optional[int]:
+        """
+        Index one workout; metrics (a WorkoutMetrics) are computed when not given.
+
+        Returns the new id, or None when the same parameters and seed are already indexed
+        (or, with dedup, the same intervals).
+        """
+        if metrics is None:
+            return self.add_many([(params, seed, name, description, intervals)], dedup=dedup)[0]
+        from enduWorkoutGen.canonical import fingerprint
+
+        table = IntervalTable.from_intervals(intervals)
+        key = fingerprint(table)
+        if dedup and not self._new_fingerprints([key]):
+            return None
+        return self._insert([(params, seed, name, description, table, metrics, key)])[0]
+
+    def add_many(self, entries: Sequence[WorkoutEntry], ftp: Optional[int] = None,
+                 dedup: bool = False) -> List[Optional[int]]:
+        """
+        Index many workouts, computing their metrics in one vectorized pass.
+
+        With dedup, workouts whose intervals are the same as an indexed one (or an earlier
+        entry) are skipped before their metrics are computed; their id is None.
+        """
+        from enduWorkoutGen.canonical import fingerprint
+        from enduWorkoutGen.metrics import DEFAULT_FTP, compute_batch_metrics
+
+        tables = [IntervalTable.from_intervals(entry[4]) for entry in entries]
+        keys = [fingerprint(table) for table in tables]
+        kept = self._new_fingerprints(keys) if dedup else list(range(len(tables)))
+        ids: List[Optional[int]] = [None] * len(entries)
+        if not kept:
+            return ids
+        batch = compute_batch_metrics([tables[i] for i in kept], self.intensity_ranges, ftp or DEFAULT_FTP)
+        inserted = self._insert([entries[i][:4] + (tables[i], batch[k], keys[i]) for k, i in enumerate(kept)])
+        for i, workout_id in zip(kept, inserted):
+            ids[i] = workout_id
+        return ids
+
+    def _new_fingerprints(self, keys: Sequence[str]) -> List[int]:
+        """Positions of the keys that aren't indexed yet, the first of each repeated key"""
+        known = set()
+        with self._lock:
+            # In chunks, to stay below SQLite's limit on query parameters
+            for start in range(0, len(keys), 500):
+                chunk = keys[start:start + 500]
+                known.update(row[0] for row in self._db.execute(
+                    f"SELECT fingerprint FROM workouts WHERE fingerprint IN ({','.join('?' * len(chunk))})", chunk))
+        new = []
+        for i, key in enumerate(keys):
+            if key not in known:
+                known.add(key)
+                new.append(i)
+        return new
+
+    def _insert(self, rows) -> List[Optional[int]]:
+        ids = []
+        now = time.time()
+        with self._lock, self._db:
+            for params, seed, name, description, table, metrics, key in rows:
+                segments = json.dumps([[s.workout_type.value, s.duration_minutes] for s in params.segments])
+                seed = None if seed is None else str(seed)
+                cursor = self._db.execute(
+                    "INSERT OR IGNORE INTO workouts (name, description, type_mix, segments, total_minutes, seed, "
+                    "intervals, duration_seconds, tss, normalized_power, intensity_factor, recovery_seconds, created, "
+                    "fingerprint) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)",
+                    (name, description, type_mix(s.workout_type for s in params.segments), segments,
+                     params.total_duration_minutes, seed, table.tobytes(), metrics.duration_seconds, metrics.tss,
+                     metrics.normalized_power, metrics.intensity_factor, metrics.recovery_seconds, now, key))
+                if not cursor.rowcount:
+                    ids.append(None)
+                    continue
+                ids.append(cursor.lastrowid)
+                self._db.executemany(
+                    "INSERT INTO workout_zones VALUES (?, ?, ?)",
+                    [(cursor.lastrowid, zone.value, seconds) for zone, seconds in metrics.time_in_zone.items()])
+        return ids
+
+    def query(self, min_minutes: Optional[float] = None, max_minutes: Optional[float] = None,
+              min_tss: Optional[float] = None, max_tss: Optional[float] = None,
+              min_zone_minutes: Optional[Mapping[WorkoutType, float]] = None,
+              workout_types: Optional[Iterable[WorkoutType]] = None, limit: int = 20) -> List[IndexedWorkout]:
+        """
+        Find indexed workouts, e.g. 60-75 min with TSS 70-80 and at least 20 min of threshold:
+
+            index.query(60, 75, 70, 80, {WorkoutType.THRESHOLD: 20})
+
+        Args:
+            min_minutes, max_minutes: Range of the total duration.
+            min_tss, max_tss: Range of TSS.
+            min_zone_minutes (Optional[Mapping[WorkoutType, float]]): Minimum minutes in each given zone.
+            workout_types (Optional[Iterable[WorkoutType]]): Exact set of segment types.
+            limit (int): Maximum number of results.
+
+        Returns:
+            List[IndexedWorkout]: Matches closest to the middle of the TSS range first.
+        """
+        conditions, values = [], []
+        for column, operator, value, scale in (("duration_seconds", ">=", min_minutes, 60),
+                                               ("duration_seconds", "<=", max_minutes, 60),
+                                               ("tss", ">=", min_tss, 1), ("tss", "<=", max_tss, 1)):
+            if value is not None:
+                conditions.append(f"w.{column} {operator} ?")
+                values.append(value * scale)
+        if workout_types is not None:
+            conditions.append("w.type_mix = ?")
+            values.append(type_mix(workout_types))
+        for zone, minutes in (min_zone_minutes or {}).items():
+            conditions.append("EXISTS (SELECT 1 FROM workout_zones z "
+                              "WHERE z.workout_id = w.id AND z.zone = ? AND z.seconds >= ?)")
+            values.extend([zone.value, minutes * 60])
+
+        target = ((min_tss or 0) + (max_tss if max_tss is not None else (min_tss or 0))) / 2
+        sql = ("SELECT w.id, w.name, w.description, w.segments, w.total_minutes, w.seed, w.intervals, "
+               "w.duration_seconds, w.tss, w.normalized_power, w.intensity_factor, w.recovery_seconds "
+               "FROM workouts w" + (" WHERE " + " AND ".join(conditions) if conditions else "")
+               + " ORDER BY ABS(w.tss - ?), w.id LIMIT ?")
+        with self._lock:
+            rows = self._db.execute(sql, values + [target, limit]).fetchall()
+        return self._workouts(rows)
+
+    def get(self, workout_id: int) -> Optional[IndexedWorkout]:
+        with self._lock:
+            rows = self._db.execute(
+                "SELECT id, name, description, segments, total_minutes, seed, intervals, duration_seconds, tss, "
+                "normalized_power, intensity_factor, recovery_seconds FROM workouts WHERE id = ?",
+                (workout_id,)).fetchall()
+        workouts = self._workouts(rows)
+        return workouts[0] if workouts else None
+
+    def _workouts(self, rows) -> List[IndexedWorkout]:
+        if not rows:
+            return []
+        ids = [row[0] for row in rows]
+        zones: Dict[int, Dict[WorkoutType, int]] = {workout_id: {} for workout_id in ids}
+        with self._lock:
+            for workout_id, zone, seconds in self._db.execute(
+                    f"SELECT workout_id, zone, seconds FROM workout_zones "
+                    f"WHERE workout_id IN ({','.join('?' * len(ids))})", ids):
+                zones[workout_id][WorkoutType(zone)] = seconds
+
+        workouts = []
+        for (workout_id, name, description, segments, total_minutes, seed, packed, duration_seconds, tss,
+             normalized_power, intensity_factor, recovery_seconds) in rows:
+            params = WorkoutParameters(
+                segments=[WorkoutSegment(WorkoutType(t), minutes) for t, minutes in json.loads(segments)],
+                total_duration_minutes=total_minutes
+            )
+            workouts.append(IndexedWorkout(workout_id, name, description, params,
+                                           None if seed is None else int(seed), packed, duration_seconds,
+                                           tss, normalized_power, intensity_factor, recovery_seconds,
+                                           zones[workout_id]))
+        return workouts
+
+    def __len__(self):
+        with self._lock:
+            return self._db.execute("SELECT COUNT(*) FROM workouts").fetchone()[0]
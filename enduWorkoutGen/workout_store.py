@@ -0,0 +1,179 @@
+import threading
+import time
+import uuid
+from collections import OrderedDict
+from concurrent.futures import Executor, Future
+from dataclasses import dataclass, field
+from typing import Callable, Dict, Optional
+
+from enduWorkoutGen.workoutgen import IntervalTable, IntervalsLike
+
+
+@dataclass
+class StoredWorkout:
+    name: str
+    description: str
+    packed_intervals: bytes  # IntervalTable.tobytes()
+    last_access: float
+    exports: Dict[str, bytes] = field(default_factory=dict)  # file type -> rendered content
+    pending: Optional[Future] = None  # exports rendering in the background, see WorkoutStore.prerender
+
+    @property
+    def intervals(self) -> IntervalTable:
+        return IntervalTable.frombytes(self.packed_intervals)
+
+    @property
+    def nbytes(self) -> int:
+        return (len(self.packed_intervals) + len(self.name) + len(self.description)
+                + sum(len(content) for content in self.exports.values()))
+
+
+class WorkoutStore:
+    """
+    Thread-safe store for generated workouts, keyed by a random workout id.
+
+    Each browser session keeps the id of its own workout, so concurrent users never
+    see each other's results. Entries expire after ttl_seconds, and the least recently
+    used ones are evicted once max_entries or max_bytes is exceeded; the newest entry is
+    always kept, even when it alone is over max_bytes. Intervals are kept packed, and
+    exports are rendered on first request (or ahead of it with prerender) and cached with
+    the entry.
+    """
+
+    def __init__(self, max_entries: int = 512, ttl_seconds: float = 3600, max_bytes: int = 64 * 1024 * 1024,
+                 clock: Callable[[], float] = time.monotonic):
+        self.max_entries = max_entries
+        self.ttl_seconds = ttl_seconds
+        self.max_bytes = max_bytes
+        self.clock = clock
+        self._entries: "OrderedDict[str, StoredWorkout]" = OrderedDict()
+        self._nbytes = 0
+        self._lock = threading.Lock()
+
+    def put(self, intervals: IntervalsLike, name: str, description: str, workout_id: Optional[str] = None) -> str:
+        """Store a workout under workout_id (a new random id if omitted) and return the id"""
+        workout_id = workout_id or uuid.uuid4().hex
+        entry = StoredWorkout(name, description, IntervalTable.from_intervals(intervals).tobytes(), self.clock())
+        with self._lock:
+            if workout_id in self._entries:
+                self._remove(workout_id)
+            # Make room first, so the new entry is never the one evicted
+            self._evict(incoming=entry)
+            self._entries[workout_id] = entry
+            self._nbytes += entry.nbytes
+        return workout_id
+
+    def get(self, workout_id: Optional[str]) -> Optional[StoredWorkout]:
+        """Look up a workout, None if it is unknown or has expired"""
+        if workout_id is None:
+            return None
+        with self._lock:
+            entry = self._entries.get(workout_id)
+            if entry is None:
+                return None
+            now = self.clock()
+            if now - entry.last_access > self.ttl_seconds:
+                self._remove(workout_id)
+                return None
+            entry.last_access = now
+            self._entries.move_to_end(workout_id)
+            return entry
+
+    def export(self, workout_id: Optional[str], file_type: str,
+               render: Callable[[StoredWorkout], bytes]) -> Optional[bytes]:
+        """Rendered export of a workout, calling render only the first time it is requested"""
+        entry = self.get(workout_id)
+        if entry is None:
+            return None
+        content = entry.exports.get(file_type)
+        pending = entry.pending
+        if content is None and pending is not None:
+            # Already rendering in the background: wait for it rather than render again
+            try:
+                pending.result()
+            except Exception:  # cancelled or failed; render it here instead
+                pass
+            content = entry.exports.get(file_type)
+        if content is None:
+            # Render outside the lock; two concurrent first requests just render twice
+            content = render(entry)
+            self._keep_export(workout_id, entry, file_type, content)
+        return content
+
+    def prerender(self, workout_id: Optional[str], render: Callable[[StoredWorkout], Dict[str, bytes]],
+                  executor: Executor) -> Optional[Future]:
+        """
+        Render exports of a workout on executor, ahead of any request for them.
+
+        render returns several exports at once ({file type: content}); export() waits for
+        them instead of rendering the same file again. Returns the new future, None if the
+        workout is unknown or already has one.
+        """
+        entry = self.get(workout_id)
+        if entry is None:
+            return None
+        with self._lock:
+            if entry.pending is not None:
+                return None
+            entry.pending = executor.submit(self._prerender, workout_id, entry, render)
+            return entry.pending
+
+    def cancel(self, workout_id: Optional[str]) -> bool:
+        """Cancel background rendering that hasn't started yet, e.g. when a newer workout replaced this one"""
+        with self._lock:
+            entry = self._entries.get(workout_id) if workout_id is not None else None
+            pending = entry.pending if entry is not None else None
+        return pending is not None and pending.cancel()
+
+    def _prerender(self, workout_id: str, entry: StoredWorkout, render: Callable[[StoredWorkout], Dict[str, bytes]]):
+        for file_type, content in render(entry).items():
+            self._keep_export(workout_id, entry, file_type, content)
+
+    def _keep_export(self, workout_id: str, entry: StoredWorkout, file_type: str, content: bytes):
+        with self._lock:
+            if self._entries.get(workout_id) is entry and file_type not in entry.exports:
+                entry.exports[file_type] = content
+                self._nbytes += len(content)
+                self._entries.move_to_end(workout_id)
+                self._evict(keep=workout_id)
+
+    def drop_exports(self, workout_id: Optional[str]):
+        """Forget a workout's rendered exports, so the next request for them renders them again"""
+        with self._lock:
+            entry = self._entries.get(workout_id) if workout_id is not None else None
+            if entry is not None:
+                self._nbytes -= sum(len(content) for content in entry.exports.values())
+                entry.exports.clear()
+
+    def discard(self, workout_id: str):
+        with self._lock:
+            if workout_id in self._entries:
+                self._remove(workout_id)
+
+    @property
+    def nbytes(self) -> int:
+        return self._nbytes
+
+    def __len__(self):
+        return len(self._entries)
+
+    def __contains__(self, workout_id):
+        return workout_id in self._entries
+
+    def _remove(self, workout_id: str):
+        self._nbytes -= self._entries.pop(workout_id).nbytes
+
+    def _evict(self, incoming: Optional[StoredWorkout] = None, keep: Optional[str] = None):
+        # Caller holds the lock. Entries are in LRU order, so expired ones cluster at the front.
+        # Makes room for incoming (not inserted yet) as well; keep, the newest entry, is never evicted
+        now = self.clock()
+        extra_entries, extra_bytes = (1, incoming.nbytes) if incoming is not None else (0, 0)
+        while self._entries:
+            workout_id, entry = next(iter(self._entries.items()))
+            if workout_id == keep:
+                break
+            if (now - entry.last_access > self.ttl_seconds or len(self._entries) + extra_entries > self.max_entries
+                    or self._nbytes + extra_bytes > self.max_bytes):
+                self._remove(workout_id)
+            else:
+                break
@@ -1,10 +1,19 @@
-import xml.etree.ElementTree as ET
+from array import array
 from dataclasses import dataclass
 from enum import Enum
+import io
 import random
-from typing import List, Tuple
+import time
+from types import MappingProxyType
+from typing import IO, TYPE_CHECKING, Dict, Iterable, Iterator, List, Mapping, Optional, Sequence, Tuple, Union
 import os
-from datetime import datetime
+
+from enduWorkoutGen.instrumentation import record_workouts, timed
+
+if TYPE_CHECKING:
+    from enduWorkoutGen.canonical import Deduplicator
+    from enduWorkoutGen.exporters import ExportInfo
+    from enduWorkoutGen.generation_cache import GenerationCache
 
 class WorkoutType(Enum):
     ENDURANCE = "endurance"
@@ -39,6 +48,165 @@ class WorkoutInterval:
     start_time: int  # seconds
     end_time: int  # seconds
     power: int  # watts
+
+
+class IntervalRow:
+    """Read-only view of a single row of an IntervalTable, shaped like a WorkoutInterval"""
+    __slots__ = ("_table", "_index")
+
+    def __init__(self, table: "IntervalTable", index: int):
+        self._table = table
+        self._index = index
+
+    @property
+    def start_time(self) -> int:
+        return self._table.starts[self._index]
+
+    @property
+    def end_time(self) -> int:
+        return self._table.ends[self._index]
+
+    @property
+    def power(self) -> int:
+        return self._table.powers[self._index]
+
+    def __eq__(self, other):
+        if isinstance(other, (IntervalRow, WorkoutInterval)):
+            return (self.start_time, self.end_time, self.power) == (other.start_time, other.end_time, other.power)
+        return NotImplemented
+
+    def __repr__(self):
+        return f"IntervalRow(start_time={self.start_time}, end_time={self.end_time}, power={self.power})"
+
+
+class IntervalTable:
+    """
+    Columnar storage for the intervals of one workout.
+
+    Start times, end times (seconds) and powers (% of FTP) live in three contiguous
+    array('i') columns, so a workout costs 12 bytes per interval instead of one
+    WorkoutInterval object per row. Iterating or indexing yields IntervalRow views,
+    which keeps code written against List[WorkoutInterval] working.
+    """
+    __slots__ = ("starts", "ends", "powers")
+
+    def __init__(self, starts: Iterable[int] = (), ends: Iterable[int] = (), powers: Iterable[int] = ()):
+        self.starts = array('i', starts)
+        self.ends = array('i', ends)
+        self.powers = array('i', powers)
+        if not len(self.starts) == len(self.ends) == len(self.powers):
+            raise ValueError("starts, ends and powers must have the same length")
+
+    @classmethod
+    def from_intervals(cls, intervals: "IntervalsLike") -> "IntervalTable":
+        """Return intervals as an IntervalTable, converting from a list of WorkoutInterval if needed"""
+        if isinstance(intervals, IntervalTable):
+            return intervals
+        table = cls()
+        for interval in intervals:
+            table.append(interval.start_time, interval.end_time, interval.power)
+        return table
+
+    @classmethod
+    def from_buffers(cls, starts, ends, powers) -> "IntervalTable":
+        """Build a table from three buffers of C ints (e.g. int32 NumPy arrays) without per-row conversion"""
+        table = cls()
+        table.starts.frombytes(memoryview(starts).cast('B'))
+        table.ends.frombytes(memoryview(ends).cast('B'))
+        table.powers.frombytes(memoryview(powers).cast('B'))
+        if not len(table.starts) == len(table.ends) == len(table.powers):
+            raise ValueError("starts, ends and powers must have the same length")
+        return table
+
+    def append(self, start_time: int, end_time: int, power: int):
+        self.starts.append(start_time)
+        self.ends.append(end_time)
+        self.powers.append(power)
+
+    def to_intervals(self) -> List[WorkoutInterval]:
+        return [WorkoutInterval(s, e, p) for s, e, p in zip(self.starts, self.ends, self.powers)]
+
+    def to_numpy(self):
+        """Zero-copy NumPy views of the (starts, ends, powers) columns"""
+        import numpy as np
+        return tuple(np.frombuffer(column, dtype=np.intc) for column in (self.starts, self.ends, self.powers))
+
+    def tobytes(self) -> bytes:
+        """Pack the three columns into one compact bytes object (see frombytes)"""
+        return self.starts.tobytes() + self.ends.tobytes() + self.powers.tobytes()
+
+    @classmethod
+    def frombytes(cls, data: bytes) -> "IntervalTable":
+        """Unpack a table packed with tobytes"""
+        view = memoryview(data)
+        third = len(view) // 3
+        return cls.from_buffers(view[:third], view[third:2 * third], view[2 * third:])
+
+    @property
+    def nbytes(self) -> int:
+        return 3 * len(self.starts) * self.starts.itemsize
+
+    def __len__(self):
+        return len(self.starts)
+
+    def __iter__(self) -> Iterator[IntervalRow]:
+        return (IntervalRow(self, i) for i in range(len(self.starts)))
+
+    def __getitem__(self, index):
+        if isinstance(index, slice):
+            return IntervalTable(self.starts[index], self.ends[index], self.powers[index])
+        if index < 0:
+            index += len(self.starts)
+        if not 0 <= index < len(self.starts):
+            raise IndexError("interval index out of range")
+        return IntervalRow(self, index)
+
+    def __eq__(self, other):
+        if isinstance(other, IntervalTable):
+            return self.starts == other.starts and self.ends == other.ends and self.powers == other.powers
+        return NotImplemented
+
+    def __repr__(self):
+        return f"IntervalTable({len(self)} intervals)"
+
+
+IntervalsLike = Union[IntervalTable, List[WorkoutInterval]]
+
+# Exporters accept a file path or any open text/binary stream
+ExportTarget = Union[str, os.PathLike, IO]
+
+
+def _output_name(output: ExportTarget, default: str) -> str:
+    """Base file name of an export target, falling back to default for anonymous streams"""
+    if isinstance(output, (str, os.PathLike)):
+        return os.path.basename(os.fspath(output))
+    name = getattr(output, 'name', None)
+    return os.path.basename(name) if isinstance(name, str) else default
+
+
+def _write_output(output: ExportTarget, content: str, encoding: str = "utf-8"):
+    """Write rendered content to a path, a text stream or a binary stream in a single call"""
+    if isinstance(output, (str, os.PathLike)):
+        with open(output, 'w', encoding=encoding) as f:
+            f.write(content)
+    elif isinstance(output, (io.RawIOBase, io.BufferedIOBase)) or 'b' in getattr(output, 'mode', ''):
+        output.write(content.encode(encoding))
+    else:
+        output.write(content)
+
+
+def derive_seed(base_seed: int, *keys) -> int:
+    """
+    Derive an independent 64-bit seed for one job from a base seed and job keys.
+
+    The result only depends on the inputs, so a job gets the same seed no matter
+    which worker process runs it or in what order.
+    """
+    import hashlib  # only the batch CLI needs it; keeps OpenSSL out of the generator's import
+    digest = hashlib.blake2b(repr((base_seed,) + keys).encode(), digest_size=8).digest()
+    return int.from_bytes(digest, "little")
+
+
 @dataclass
 class WorkoutSegment:
     workout_type: WorkoutType
@@ -49,62 +217,91 @@ class WorkoutParameters:
     total_duration_minutes: int
 
 
-class WorkoutGenerator:
-    def __init__(self):
-        # Define intensity ranges for each workout type as percentage of FTP
-        self.intensity_ranges = {
-            WorkoutType.ENDURANCE: (65, 75),
-            WorkoutType.THRESHOLD: (95, 105),
-            WorkoutType.VO2: (106, 120),
-            WorkoutType.TEMPO: (85, 95),
-            WorkoutType.Z2: (56, 75),
-            WorkoutType.SPRINTS: (130, 200)
-        }
+# Intensity ranges for each workout type as percentage of FTP
+INTENSITY_RANGES: Mapping[WorkoutType, Tuple[int, int]] = MappingProxyType({
+    WorkoutType.ENDURANCE: (65, 75),
+    WorkoutType.THRESHOLD: (95, 105),
+    WorkoutType.VO2: (106, 120),
+    WorkoutType.TEMPO: (85, 95),
+    WorkoutType.Z2: (56, 75),
+    WorkoutType.SPRINTS: (130, 200)
+})
+
+# Typical interval durations for each type (in seconds)
+INTERVAL_DURATIONS: Mapping[WorkoutType, Tuple[int, int]] = MappingProxyType({
+    WorkoutType.ENDURANCE: (600, 1800),
+    WorkoutType.THRESHOLD: (180, 600),
+    WorkoutType.VO2: (30, 300),
+    WorkoutType.TEMPO: (300, 1200),
+    WorkoutType.Z2: (600, 1800),
+    WorkoutType.SPRINTS: (15, 30)
+})
+
+# Workout naming patterns
+WORKOUT_NAMES: Mapping[WorkoutType, Tuple[str, ...]] = MappingProxyType({
+    WorkoutType.ENDURANCE: (
+        "Long and Steady", "Base Builder", "Endurance Foundation",
+        "Distance Driver", "Aerobic Builder"
+    ),
+    WorkoutType.THRESHOLD: (
+        "FTP Booster", "Threshold Builder", "Sweet Spot Special",
+        "Power Hour", "Threshold Challenge"
+    ),
+    WorkoutType.VO2: (
+        "Oxygen Hunter", "VO2 Crusher", "Peak Power",
+        "Red Zone", "Lung Buster"
+    ),
+    WorkoutType.TEMPO: (
+        "Tempo Time", "Sustained Power", "Rhythm Rider",
+        "Tempo Builder", "Steady State"
+    ),
+    WorkoutType.Z2: (
+        "Easy Rider", "Recovery Spin", "Active Rest",
+        "Zone 2 Foundation", "Base Miles"
+    ),
+    WorkoutType.SPRINTS: (
+        "Sprint King", "Power Burst", "Lightning Rounds",
+        "Quick Strike", "Speed Demon"
+    )
+})
+
+
+def _with_overrides(table: Mapping, overrides: Optional[Mapping]) -> Mapping:
+    # Shared read-only table unless the caller customizes it
+    if not overrides:
+        return table
+    return MappingProxyType({**table, **overrides})
 
-        # Define typical interval durations for each type (in seconds)
-        self.interval_durations = {
-            WorkoutType.ENDURANCE: (600, 1800),
-            WorkoutType.THRESHOLD: (180, 600),
-            WorkoutType.VO2: (30, 300),
-            WorkoutType.TEMPO: (300, 1200),
-            WorkoutType.Z2: (600, 1800),
-            WorkoutType.SPRINTS: (15, 30)
-        }
-        # Add workout descriptions and naming patterns
-        self.workout_names = {
-            WorkoutType.ENDURANCE: [
-                "Long and Steady", "Base Builder", "Endurance Foundation",
-                "Distance Driver", "Aerobic Builder"
-            ],
-            WorkoutType.THRESHOLD: [
-                "FTP Booster", "Threshold Builder", "Sweet Spot Special",
-                "Power Hour", "Threshold Challenge"
-            ],
-            WorkoutType.VO2: [
-                "Oxygen Hunter", "VO2 Crusher", "Peak Power",
-                "Red Zone", "Lung Buster"
-            ],
-            WorkoutType.TEMPO: [
-                "Tempo Time", "Sustained Power", "Rhythm Rider",
-                "Tempo Builder", "Steady State"
-            ],
-            WorkoutType.Z2: [
-                "Easy Rider", "Recovery Spin", "Active Rest",
-                "Zone 2 Foundation", "Base Miles"
-            ],
-            WorkoutType.SPRINTS: [
-                "Sprint King", "Power Burst", "Lightning Rounds",
-                "Quick Strike", "Speed Demon"
-            ]
-        }
 
-    def generate_workout_name(self, params: WorkoutParameters) -> str:
-        """Generate a meaningful workout name for mixed workout"""
+class WorkoutGenerator:
+    def __init__(self, seed: Optional[int] = None,
+                 intensity_ranges: Optional[Mapping[WorkoutType, Tuple[int, int]]] = None,
+                 interval_durations: Optional[Mapping[WorkoutType, Tuple[int, int]]] = None,
+                 workout_names: Optional[Mapping[WorkoutType, Sequence[str]]] = None,
+                 cache: Optional["GenerationCache"] = None):
+        # Private random stream, so generators don't share (or race on) the global random module
+        self.rng = random.Random(seed)
+
+        # The module-level tables are shared by all instances; overrides replace single types
+        self.intensity_ranges = _with_overrides(INTENSITY_RANGES, intensity_ranges)
+        self.interval_durations = _with_overrides(INTERVAL_DURATIONS, interval_durations)
+        self.workout_names = _with_overrides(WORKOUT_NAMES, workout_names)
+
+        # Optional generation_cache.GenerationCache for workouts, metrics and exports
+        self.cache = cache
+
+    def _rng_for(self, seed: Optional[int]) -> random.Random:
+        """A fresh random stream for an explicit seed, otherwise the generator's own stream"""
+        return self.rng if seed is None else random.Random(seed)
+
+    def generate_workout_name(self, params: WorkoutParameters, seed: Optional[int] = None,
+                              dated: bool = True) -> str:
+        """Generate a meaningful workout name for mixed workout, prefixed with today's date if dated"""
+        rng = self._rng_for(seed)
         workout_types = [segment.workout_type for segment in params.segments]
-        base_names = [random.choice(self.workout_names[wt]).split()[0] for wt in workout_types]
-        combined_name = "Mixed_" + "_".join(base_names)
-        timestamp = datetime.now().strftime("%Y%m%d")
-        return f"{timestamp}_{combined_name}_{params.total_duration_minutes}min"
+        base_names = [rng.choice(self.workout_names[wt]).split()[0] for wt in workout_types]
+        name = f"Mixed_{'_'.join(base_names)}_{params.total_duration_minutes}min"
+        return f"{time.strftime('%Y%m%d')}_{name}" if dated else name
 
     def create_workout_description(self, params: WorkoutParameters) -> str:
         """Create a meaningful workout description for mixed workout"""
@@ -125,149 +322,477 @@ class WorkoutGenerator:
         clean_name = clean_name.replace(" ", "_")
         return f"{clean_name}.{file_type}"
 
-    def generate_workout(self, params: WorkoutParameters) -> List[WorkoutInterval]:
-        intervals = []
+    def _parameters_key(self, params: WorkoutParameters) -> tuple:
+        # Everything the generated intervals depend on, besides the seed
+        return (
+            tuple((segment.workout_type.value, segment.duration_minutes) for segment in params.segments),
+            params.total_duration_minutes,
+            sorted((wt.value, bounds) for wt, bounds in self.intensity_ranges.items()),
+            sorted((wt.value, bounds) for wt, bounds in self.interval_durations.items()),
+        )
+
+    @timed("generate_workout")
+    def generate_workout(self, params: WorkoutParameters, seed: Optional[int] = None) -> IntervalTable:
+        """
+        Generates one workout. With a cache and an explicit seed, the same parameters
+        and seed are only generated once and later calls return the cached intervals.
+        """
+        if self.cache is None or seed is None:
+            return self._generate_workout(params, self._rng_for(seed))
+        key = self.cache.key("intervals", self._parameters_key(params), seed)
+        packed = self.cache.get_or_compute(key, lambda: self._generate_workout(params, random.Random(seed)).tobytes())
+        return IntervalTable.frombytes(packed)
+
+    def _generate_workout(self, params: WorkoutParameters, rng: random.Random) -> IntervalTable:
+        intervals = IntervalTable()
         current_time = 0
         duration_seconds = params.total_duration_minutes * 60
 
         # Always start with a 5-minute warmup at 40%
         warmup_duration = 300
-        intervals.append(WorkoutInterval(0, warmup_duration, 40))
+        intervals.append(0, warmup_duration, 40)
         current_time = warmup_duration
 
         # Generate intervals for each segment
-        remaining_time = duration_seconds - 600  # Accounting for warmup and cooldown
         for segment in params.segments:
-            segment_duration_seconds = int((segment.duration_minutes / params.total_duration_minutes) * remaining_time)
-            segment_end_time = current_time + segment_duration_seconds
-
-            while current_time < segment_end_time:
-                if segment.workout_type == WorkoutType.SPRINTS:
-                    # Special handling for sprints: include recovery
-                    sprint_duration = random.randint(15, 30)
-                    recovery_duration = random.randint(60, 180)
-
-                    if current_time + sprint_duration + recovery_duration > segment_end_time:
-                        break
-
-                    sprint_power = random.randint(
-                        self.intensity_ranges[segment.workout_type][0],
-                        self.intensity_ranges[segment.workout_type][1]
-                    )
-
-                    intervals.append(WorkoutInterval(
-                        current_time,
-                        current_time + sprint_duration,
-                        sprint_power
-                    ))
-
-                    intervals.append(WorkoutInterval(
-                        current_time + sprint_duration,
-                        current_time + sprint_duration + recovery_duration,
-                        50  # Recovery at 50%
-                    ))
-
-                    current_time += sprint_duration + recovery_duration
-                else:
-                    # Regular interval generation
-                    interval_duration = random.randint(
-                        *self.interval_durations[segment.workout_type]
-                    )
-
-                    if current_time + interval_duration > segment_end_time:
-                        interval_duration = segment_end_time - current_time
-
-                    power = random.randint(
-                        self.intensity_ranges[segment.workout_type][0],
-                        self.intensity_ranges[segment.workout_type][1]
-                    )
-
-                    intervals.append(WorkoutInterval(
-                        current_time,
-                        current_time + interval_duration,
-                        power
-                    ))
-
-                    current_time += interval_duration
+            current_time = self._append_segment(intervals, segment.workout_type, current_time,
+                                                current_time + self.segment_seconds(segment, params), rng)
 
         # Add cooldown at 40%
-        intervals.append(WorkoutInterval(
+        intervals.append(
             current_time,
             duration_seconds,
             40
-        ))
+        )
 
+        record_workouts(1, len(intervals), per_workout=len(intervals))
         return intervals
 
-    def calculate_metrics(self, intervals: List[WorkoutInterval]) -> Tuple[float, int]:
-        """Calculate TSS for the workout"""
-        total_tss = 0
+    @staticmethod
+    def segment_seconds(segment: WorkoutSegment, params: WorkoutParameters) -> int:
+        """Time a segment gets in generate_workout: its share of the total, less warmup and cooldown"""
+        remaining_time = params.total_duration_minutes * 60 - 600  # Accounting for warmup and cooldown
+        return int((segment.duration_minutes / params.total_duration_minutes) * remaining_time)
 
-        for interval in intervals:
-            duration_hours = (interval.end_time - interval.start_time) / 3600
-            intensity_factor = interval.power / 100  # Convert percentage to decimal
-            tss = 100 * duration_hours * intensity_factor ** 2
-            total_tss += tss
+    def generate_segment(self, workout_type: WorkoutType, allotted_seconds: int, seed: int) -> IntervalTable:
+        """
+        One segment on its own: intervals from 0 up to at most allotted_seconds, as in generate_workout.
+
+        The building block of IncrementalWorkout. With a cache, each (type, allotted seconds,
+        seed) is generated only once.
+        """
+        if self.cache is None:
+            return self._generate_segment(workout_type, allotted_seconds, seed)
+        key = self.cache.key("segment", workout_type.value, allotted_seconds, seed,
+                             self.intensity_ranges[workout_type], self.interval_durations[workout_type])
+        return IntervalTable.frombytes(self.cache.get_or_compute(
+            key, lambda: self._generate_segment(workout_type, allotted_seconds, seed).tobytes()))
+
+    def _generate_segment(self, workout_type: WorkoutType, allotted_seconds: int, seed: int) -> IntervalTable:
+        intervals = IntervalTable()
+        self._append_segment(intervals, workout_type, 0, allotted_seconds, random.Random(seed))
+        return intervals
+
+    def _append_segment(self, intervals: IntervalTable, workout_type: WorkoutType, current_time: int,
+                        segment_end_time: int, rng: random.Random) -> int:
+        """Append one segment's intervals from current_time up to at most segment_end_time, returns where it ended"""
+        while current_time < segment_end_time:
+            if workout_type == WorkoutType.SPRINTS:
+                # Special handling for sprints: include recovery
+                sprint_duration = rng.randint(
+                    *self.interval_durations[workout_type]
+                )
+                recovery_duration = rng.randint(60, 180)
+
+                if current_time + sprint_duration + recovery_duration > segment_end_time:
+                    break
+
+                sprint_power = rng.randint(
+                    self.intensity_ranges[workout_type][0],
+                    self.intensity_ranges[workout_type][1]
+                )
+
+                intervals.append(
+                    current_time,
+                    current_time + sprint_duration,
+                    sprint_power
+                )
+
+                intervals.append(
+                    current_time + sprint_duration,
+                    current_time + sprint_duration + recovery_duration,
+                    50  # Recovery at 50%
+                )
+
+                current_time += sprint_duration + recovery_duration
+            else:
+                # Regular interval generation
+                interval_duration = rng.randint(
+                    *self.interval_durations[workout_type]
+                )
+
+                if current_time + interval_duration > segment_end_time:
+                    interval_duration = segment_end_time - current_time
+
+                power = rng.randint(
+                    self.intensity_ranges[workout_type][0],
+                    self.intensity_ranges[workout_type][1]
+                )
+
+                intervals.append(
+                    current_time,
+                    current_time + interval_duration,
+                    power
+                )
+
+                current_time += interval_duration
+        return current_time
+
+    def _zone_ranges(self) -> dict:
+        """
+        Power range per type that metrics count as time in that type's zone.
+
+        Zones run from a type's lower bound up to the next type's lower bound (see
+        metrics.zone_bounds), so overlapping ranges are cut at the next zone.
+        """
+        lower_bounds = sorted(low for low, _ in self.intensity_ranges.values())
+        ranges = {}
+        for wt, (low, high) in self.intensity_ranges.items():
+            next_lower = next((bound for bound in lower_bounds if bound > low), None)
+            ranges[wt] = (low, high if next_lower is None else min(high, next_lower - 1))
+        return ranges
+
+    @timed("generate_workout_for_target")
+    def generate_workout_for_target(self, params: WorkoutParameters, target_tss: float, tolerance: float = 1.0,
+                                    exact_zone_minutes: bool = False, seed: Optional[int] = None,
+                                    clamp: bool = False) -> IntervalTable:
+        """
+        Generates a workout whose TSS is within tolerance of target_tss, in one pass.
+
+        The structure (warmup, segment intervals, sprint recoveries, cooldown) is drawn
+        like generate_workout. Instead of keeping the random powers and hoping for the
+        right TSS, every work interval is then moved towards the bottom or top of its
+        intensity range by the same fraction, solved for directly, and the rounding to
+        whole percents is corrected one interval at a time.
+
+        Args:
+            params (WorkoutParameters): Segments and total duration.
+            target_tss (float): TSS to hit, as computed by calculate_metrics.
+            tolerance (float): Allowed difference from target_tss.
+            exact_zone_minutes (bool): Treat each segment's duration_minutes as a time-in-zone
+                target: its work intervals add up to exactly that long (sprint recoveries come
+                on top) and stay inside the type's zone as metrics counts it. Otherwise segments
+                are scaled to the total duration like generate_workout.
+            seed (Optional[int]): Seed for a reproducible workout.
+            clamp (bool): Settle for the closest reachable TSS when target_tss is out of reach
+                instead of raising.
+
+        Raises:
+            ValueError: If the segments don't fit the total duration, or the target can't be
+                reached with powers inside the intensity ranges (and clamp is off).
+        """
+        rng = self._rng_for(seed)
+        duration_seconds = params.total_duration_minutes * 60
+        power_ranges = self._zone_ranges() if exact_zone_minutes else self.intensity_ranges
+        intervals = IntervalTable()
+        intervals.append(0, 300, 40)  # 5-minute warmup at 40%, like generate_workout
+        current_time = 300
+
+        # Lay out the intervals; work intervals keep their index and power range for the solve below
+        work = []  # (index, low, high)
+        remaining_time = duration_seconds - 600
+        for segment in params.segments:
+            low, high = power_ranges[segment.workout_type]
+            if low > high:
+                raise ValueError(f"{segment.workout_type.value} has no power range inside its own zone")
+            min_duration, max_duration = self.interval_durations[segment.workout_type]
+            if exact_zone_minutes:
+                # Work seconds are the target; sprint recoveries make the block longer
+                work_left = segment.duration_minutes * 60
+                segment_end_time = None
+            else:
+                work_left = None
+                segment_end_time = current_time + int(
+                    (segment.duration_minutes / params.total_duration_minutes) * remaining_time)
+
+            while current_time < segment_end_time if work_left is None else work_left > 0:
+                interval_duration = rng.randint(min_duration, max_duration)
+                recovery = rng.randint(60, 180) if segment.workout_type == WorkoutType.SPRINTS else 0
+                if work_left is not None:
+                    # Don't leave a stub shorter than the type's intervals: take the rest in one go, or
+                    # when that would be longer than the type's intervals, leave exactly one shortest
+                    if work_left - interval_duration < min_duration:
+                        interval_duration = work_left if work_left <= max_duration else work_left - min_duration
+                    work_left -= interval_duration
+                elif recovery and current_time + interval_duration + recovery > segment_end_time:
+                    break
+                elif current_time + interval_duration > segment_end_time:
+                    interval_duration = segment_end_time - current_time
+
+                work.append((len(intervals), low, high))
+                intervals.append(current_time, current_time + interval_duration, rng.randint(low, high))
+                current_time += interval_duration
+                if recovery:
+                    intervals.append(current_time, current_time + recovery, 50)  # Recovery at 50%
+                    current_time += recovery
+
+        if current_time > duration_seconds - 300:
+            raise ValueError(f"segments take {current_time // 60} minutes with the warmup, leaving less than "
+                             f"the 5-minute cooldown in {params.total_duration_minutes} minutes")
+        intervals.append(current_time, duration_seconds, 40)  # cooldown at 40%
+
+        # TSS is sum(duration * power^2) / 360000; split it into the fixed part and the work intervals
+        powers = intervals.powers
+        durations = [end - start for start, end in zip(intervals.starts, intervals.ends)]
+        is_work = {index for index, _, _ in work}
+        fixed = sum(durations[i] * powers[i] ** 2 for i in range(len(intervals)) if i not in is_work)
+        wanted = target_tss * 360000 - fixed
+        lowest = sum(durations[i] * low * low for i, low, _ in work)
+        highest = sum(durations[i] * high * high for i, _, high in work)
+        slack = tolerance * 360000
+        if clamp and not lowest <= wanted <= highest:
+            wanted = min(max(wanted, lowest), highest)
+            target_tss = (fixed + wanted) / 360000
+        if not lowest - slack <= wanted <= highest + slack:
+            raise ValueError(f"target TSS {target_tss} is outside the reachable "
+                             f"{(fixed + lowest) / 360000:.1f}-{(fixed + highest) / 360000:.1f} for these segments")
+
+        # Move every work interval the same fraction t of the way to its bound (up for t > 0,
+        # down for t < 0). Per direction the weighted sum is A t^2 + 2 B t + C, so t is a quadratic root
+        current = sum(durations[i] * powers[i] ** 2 for i, _, _ in work)
+        up = wanted >= current
+        offsets = [(i, (high - powers[i]) if up else (powers[i] - low)) for i, low, high in work]
+        a = sum(durations[i] * offset * offset for i, offset in offsets)
+        b = sum(durations[i] * powers[i] * offset for i, offset in offsets)
+        t = (-b + max(b * b - a * (current - wanted), 0) ** 0.5) / a if a else 0.0
+        t = min(max(t, -1.0), 1.0)
+        bounds = {i: (low, high) for i, low, high in work}
+        for i, offset in offsets:
+            powers[i] = min(max(round(powers[i] + t * offset), bounds[i][0]), bounds[i][1])
+
+        # Rounding leaves a small error; nudge single intervals by 1% while that brings us closer
+        error = sum(durations[i] * powers[i] ** 2 for i in bounds) - wanted
+        while True:
+            best = None
+            for i, (low, high) in bounds.items():
+                step = 1 if error < 0 else -1
+                if not low <= powers[i] + step <= high:
+                    continue
+                new_error = error + durations[i] * ((powers[i] + step) ** 2 - powers[i] ** 2)
+                if abs(new_error) < abs(error if best is None else best[1]):
+                    best = (i, new_error, step)
+            if best is None:
+                break
+            powers[best[0]] += best[2]
+            error = best[1]
+
+        tss = self._tss(intervals)
+        if abs(tss - target_tss) > tolerance:
+            raise ValueError(f"could only get to TSS {tss} for target {target_tss}; use a larger tolerance")
+        record_workouts(1, len(intervals), per_workout=len(intervals))
+        return intervals
+
+    @timed("generate_workouts_batch")
+    def generate_workouts_batch(self, params: WorkoutParameters, n: int, seed: Optional[int] = None,
+                                dedup: Optional["Deduplicator"] = None) -> List[IntervalTable]:
+        """
+        Generates n workouts for the same parameters in one vectorized pass.
+
+        All interval durations and powers are drawn up front with NumPy instead of
+        one random.randint call per interval. Every workout has the same structure
+        as generate_workout: 5-minute warmup, the segments (sprints paired with a
+        50% recovery) and a cooldown up to the total duration.
+
+        Args:
+            params (WorkoutParameters): Segments and total duration shared by all workouts.
+            n (int): Number of workouts to generate.
+            seed (Optional[int]): Seed for the NumPy generator, for reproducible batches.
+            dedup (Optional[Deduplicator]): Drop workouts it has already seen (in this batch or
+                earlier ones), see canonical.Deduplicator.
+
+        Returns:
+            List[IntervalTable]: One interval table per generated workout, fewer with dedup.
+        """
+        import numpy as np
+
+        rng = np.random.default_rng(seed)
+        duration_seconds = params.total_duration_minutes * 60
+        remaining_time = duration_seconds - 600  # Accounting for warmup and cooldown
+
+        # Each block is a tuple of (start, end, power, keep) arrays of shape (n, columns)
+        warmup = np.full((n, 1), 300, dtype=np.int64)
+        blocks = [(np.zeros_like(warmup), warmup, np.full_like(warmup, 40), np.ones(warmup.shape, dtype=bool))]
+
+        # Segments start wherever the previous one stopped, so track a clock per workout
+        current_time = np.full(n, 300, dtype=np.int64)
+        for segment in params.segments:
+            segment_duration_seconds = int((segment.duration_minutes / params.total_duration_minutes) * remaining_time)
+            if segment_duration_seconds <= 0:
+                continue
+            min_duration, max_duration = self.interval_durations[segment.workout_type]
+            min_power, max_power = self.intensity_ranges[segment.workout_type]
+            segment_start = current_time[:, None]
+
+            if segment.workout_type == WorkoutType.SPRINTS:
+                # Draw enough sprint/recovery pairs to overfill the segment, then keep the
+                # prefix that fits, just like the break in generate_workout
+                pairs = segment_duration_seconds // (min_duration + 60)
+                if pairs == 0:
+                    continue
+                sprint = rng.integers(min_duration, max_duration + 1, size=(n, pairs))
+                recovery = rng.integers(60, 181, size=(n, pairs))
+                sprint_power = rng.integers(min_power, max_power + 1, size=(n, pairs))
+
+                pair_end = np.cumsum(sprint + recovery, axis=1)
+                pair_start = pair_end - sprint - recovery
+                keep = pair_end <= segment_duration_seconds
+
+                # Interleave sprint and recovery columns
+                start = np.stack([pair_start, pair_start + sprint], axis=2).reshape(n, 2 * pairs)
+                end = np.stack([pair_start + sprint, pair_end], axis=2).reshape(n, 2 * pairs)
+                power = np.stack([sprint_power, np.full_like(sprint_power, 50)], axis=2).reshape(n, 2 * pairs)
+                keep = np.repeat(keep, 2, axis=1)
+
+                current_time = current_time + np.where(keep, end, 0).max(axis=1)
+            else:
+                # Enough intervals to fill the segment even if every draw is the shortest
+                columns = -(-segment_duration_seconds // min_duration)
+                durations = rng.integers(min_duration, max_duration + 1, size=(n, columns))
+                power = rng.integers(min_power, max_power + 1, size=(n, columns))
+
+                # The last interval is cut at the segment end
+                end = np.minimum(np.cumsum(durations, axis=1), segment_duration_seconds)
+                start = np.concatenate([np.zeros((n, 1), dtype=end.dtype), end[:, :-1]], axis=1)
+                keep = start < segment_duration_seconds
+
+                current_time = current_time + segment_duration_seconds
+
+            blocks.append((segment_start + start, segment_start + end, power, keep))
+
+        # Add cooldown at 40%
+        cooldown_start = current_time[:, None]
+        blocks.append((cooldown_start, np.full_like(cooldown_start, duration_seconds),
+                       np.full_like(cooldown_start, 40), np.ones(cooldown_start.shape, dtype=bool)))
+
+        start, end, power, keep = (np.concatenate(column, axis=1) for column in zip(*blocks))
+        start, end, power = (column.astype(np.intc) for column in (start, end, power))
+        record_workouts(n, int(keep.sum()))
+
+        workouts = [
+            IntervalTable.from_buffers(start[i][keep[i]], end[i][keep[i]], power[i][keep[i]])
+            for i in range(n)
+        ]
+        if dedup is not None:
+            workouts = [workouts[i] for i in dedup.unique(workouts)]
+        return workouts
+
+    @timed("calculate_metrics")
+    def calculate_metrics(self, intervals: IntervalsLike) -> float:
+        """Calculate TSS for the workout"""
+        # Not cached: hashing the intervals for a cache key costs about as much as the sum itself
+        return self._tss(IntervalTable.from_intervals(intervals))
+
+    @staticmethod
+    def _tss(table: IntervalTable) -> float:
+        # TSS = 100 * hours * IF^2 per interval, with power in % of FTP
+        weighted_seconds = sum(
+            (end - start) * power * power
+            for start, end, power in zip(table.starts, table.ends, table.powers)
+        )
+        total_tss = 100 * (weighted_seconds / 3600) / 100 ** 2
 
         return round(total_tss, 1)
 
-    def export_mrc(self, intervals: List[WorkoutInterval], filename: str, description: str):
-        """Export workout to MRC format with percentages of FTP"""
-        with open(filename, 'w') as f:
-            f.write("[COURSE HEADER]\n")
-            f.write("VERSION = 2\n")
-            f.write("UNITS = ENGLISH\n")
-            f.write(f"DESCRIPTION = {description}\n")
-            f.write(f"FILE NAME = {os.path.basename(filename)}\n")
-            f.write("MINUTES PERCENT\n")
-            f.write("[END COURSE HEADER]\n\n")
-
-            f.write("[COURSE DATA]\n")
-            for interval in intervals:
-                # Convert seconds to minutes
-                start_minutes = round(interval.start_time / 60, 2)
-                end_minutes = round(interval.end_time / 60, 2)
-
-                # Format with 2 decimal places for minutes
-                f.write(f"{start_minutes:.2f}\t{interval.power}\n")
-                f.write(f"{end_minutes:.2f}\t{interval.power}\n")
-            f.write("[END COURSE DATA]\n")
-
-    def export_zwo(self, intervals: List[WorkoutInterval], filename: str, workout_name: str = "Workout",
-                   author: str = "Unknown"):
+    @timed("calculate_workout_metrics")
+    def calculate_workout_metrics(self, workouts, ftp: Optional[int] = None):
         """
-        Exports a list of WorkoutInterval objects to a .zwo file.
+        Calculates TSS, normalized power, IF, kJ and time in zone in one vectorized pass.
 
         Args:
-            intervals (List[WorkoutInterval]): List of workout intervals.
-            filename (str): The name of the output .zwo file.
-            workout_name (str): Name of the workout.
-            author (str): Author of the workout.
+            workouts: A single workout, or a list of workouts (e.g. from generate_workouts_batch).
+            ftp (Optional[int]): Athlete FTP in watts for kJ, defaults to metrics.DEFAULT_FTP.
+
+        Returns:
+            WorkoutMetrics for a single workout, BatchMetrics for a list of workouts.
+        """
+        from enduWorkoutGen.metrics import DEFAULT_FTP, WorkoutMetrics, compute_metrics
+        ftp = ftp or DEFAULT_FTP
+        single = isinstance(workouts, IntervalTable) or (workouts and isinstance(workouts[0], WorkoutInterval))
+        if self.cache is None or not single:
+            return compute_metrics(workouts, self.intensity_ranges, ftp)
+        table = IntervalTable.from_intervals(workouts)
+        key = self.cache.key("metrics", table.tobytes(), ftp,
+                             sorted((wt.value, bounds) for wt, bounds in self.intensity_ranges.items()))
+        return WorkoutMetrics.frombytes(self.cache.get_or_compute(
+            key, lambda: compute_metrics(table, self.intensity_ranges, ftp).tobytes()))
+
+    @timed("render")
+    def render(self, intervals: IntervalsLike, formats: Sequence[str], info: Optional["ExportInfo"] = None,
+               file_names: Optional[Mapping[str, str]] = None) -> Dict[str, bytes]:
         """
-        # Create root element
-        root = ET.Element("workout_file")
+        Render a workout to several formats (see exporters.EXPORTERS) in one pass over its intervals.
 
-        # Add metadata
-        name_elem = ET.SubElement(root, "name")
-        name_elem.text = workout_name
+        With a cache, formats rendered before are taken from it and only the rest are rendered.
 
-        author_elem = ET.SubElement(root, "author")
-        author_elem.text = author
+        Args:
+            intervals (IntervalsLike): Workout intervals.
+            formats (Sequence[str]): File types, e.g. ["mrc", "zwo", "erg", "fit"].
+            info (Optional[ExportInfo]): Name, description, author and FTP (for ERG).
+            file_names (Optional[Mapping[str, str]]): File name written into MRC/ERG headers per file type.
 
-        description_elem = ET.SubElement(root, "description")
-        description_elem.text = f"Generated by workoutgen"
+        Returns:
+            Dict[str, bytes]: Encoded file content per file type.
+        """
+        from enduWorkoutGen.exporters import ExportInfo, render
+        info = info or ExportInfo()
+        table = IntervalTable.from_intervals(intervals)
+        if self.cache is None:
+            return render(table, formats, info, file_names)
+
+        packed = table.tobytes()
+        keys = {file_type: self.cache.key("export", file_type, packed, info, (file_names or {}).get(file_type))
+                for file_type in formats}
+        files = {file_type: self.cache.get(key) for file_type, key in keys.items()}
+        missing = [file_type for file_type, content in files.items() if content is None]
+        if missing:
+            for file_type, content in render(table, missing, info, file_names).items():
+                self.cache.put(keys[file_type], content)
+                files[file_type] = content
+        return files
+
+    @timed("render_mrc")
+    def render_mrc(self, intervals: IntervalsLike, description: str, file_name: str = "workout.mrc") -> str:
+        """Render workout to MRC format with percentages of FTP"""
+        from enduWorkoutGen.exporters import ExportInfo
+        return self.render(intervals, ["mrc"], ExportInfo(description=description), {"mrc": file_name})["mrc"].decode()
+
+    def export_mrc(self, intervals: IntervalsLike, filename: ExportTarget, description: str):
+        """Export workout to MRC format, to a file path or an open text/binary stream"""
+        content = self.render_mrc(intervals, description, _output_name(filename, "workout.mrc"))
+        _write_output(filename, content)
+
+    @timed("render_zwo")
+    def render_zwo(self, intervals: IntervalsLike, workout_name: str = "Workout",
+                   author: str = "Unknown", description: str = "Generated by workoutgen") -> str:
+        """
+        Renders workout intervals to the .zwo format.
 
-        # Add workout steps
-        workout_elem = ET.SubElement(root, "workout")
-        for interval in intervals:
-            if interval.interval_type == "steady_state":
-                ET.SubElement(workout_elem, "SteadyState", Duration=str(interval.duration), Power=str(interval.power))
-            elif interval.interval_type == "intervals":
-                ET.SubElement(workout_elem, "IntervalsT", Repeat=str(interval.repeat),
-                              OnDuration=str(interval.on_duration), OffDuration=str(interval.off_duration),
-                              OnPower=str(interval.on_power), OffPower=str(interval.off_power))
-
-        # Write to file
-        tree = ET.ElementTree(root)
-        tree.write(filename, encoding="utf-8", xml_declaration=True)
+        Adjacent intervals at the same power become one SteadyState, and runs of
+        identical on/off pairs (like sprints with their 50% recovery) collapse into
+        a single IntervalsT element. Elements are emitted one at a time and joined,
+        without building an XML tree.
+
+        Args:
+            intervals (IntervalsLike): Workout intervals.
+            workout_name (str): Name of the workout.
+            author (str): Author of the workout.
+            description (str): Description shown on the trainer.
+        """
+        from enduWorkoutGen.exporters import ExportInfo
+        return self.render(intervals, ["zwo"], ExportInfo(workout_name, description, author))["zwo"].decode()
+
+    def export_zwo(self, intervals: IntervalsLike, filename: ExportTarget, workout_name: str = "Workout",
+                   author: str = "Unknown", description: str = "Generated by workoutgen"):
+        """Export workout to a .zwo file path or an open text/binary stream"""
+        _write_output(filename, self.render_zwo(intervals, workout_name, author, description))
 
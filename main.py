@@ -1,4 +1,5 @@
 from enduWorkoutGen.workoutgen import WorkoutGenerator, WorkoutParameters, WorkoutType, WorkoutSegment
+from enduWorkoutGen.exporters import ExportInfo
 
 # Print available workout types
 WorkoutType.list_workout_types()
@@ -19,8 +20,6 @@ workout_params = WorkoutParameters(
 intervals = generator.generate_workout(workout_params)
 workout_name = generator.generate_workout_name(workout_params)
 description = generator.create_workout_description(workout_params)
-filename = generator.create_filename(workout_name)
-generator.export_mrc(intervals, filename, description)
 
 
 # Calculate metrics
@@ -36,10 +35,12 @@ print(f"\nDescription:")
 print(description)
 print(f"\nMetrics:")
 print(f"TSS: {tss}")
-print(f"\nFile saved as: {filename}")
-
-# Export to MRC file
-generator.export_mrc(intervals, filename, description)
 
-# Export to ZWO file
-generator.export_zwo(intervals, filename, description)
\ No newline at end of file
+# Export to MRC and ZWO files in one pass over the intervals
+files = generator.render(intervals, ["mrc", "zwo"], ExportInfo(workout_name, description),
+                         {"mrc": filename})
+for file_type, content in files.items():
+    path = generator.create_filename(workout_name, file_type)
+    with open(path, "wb") as f:
+        f.write(content)
+    print(f"File saved as: {path}")
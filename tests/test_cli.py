@@ -0,0 +1,15 @@
+import pytest
+
+from enduWorkoutGen.cli import parse_args
+
+
+@pytest.mark.parametrize("argv", [["-j", "0"], ["-j", "-2"], ["--power-step", "0"], ["--time-step", "-1"]])
+def test_counts_and_steps_below_one_are_refused(argv, capsys):
+    with pytest.raises(SystemExit) as exit_info:
+        parse_args(argv)
+    assert exit_info.value.code == 2
+    assert "must be at least 1" in capsys.readouterr().err
+
+
+def test_workers():
+    assert parse_args(["-j", "3"]).workers == 3
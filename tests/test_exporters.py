@@ -0,0 +1,24 @@
+from enduWorkoutGen.exporters import render
+from enduWorkoutGen.workoutgen import IntervalTable
+
+
+def _sprints(pairs):
+    table = IntervalTable()
+    table.append(0, 300, 40)
+    current = 300
+    for sprint, recovery, power in pairs:
+        table.append(current, current + sprint, power)
+        table.append(current + sprint, current + sprint + recovery, 50)
+        current += sprint + recovery
+    table.append(current, current + 300, 40)
+    return table
+
+
+def test_zwo_collapses_repeated_pairs():
+    zwo = render(_sprints([(30, 120, 150)] * 4), ["zwo"])["zwo"].decode()
+    assert zwo.count("<IntervalsT") == 1 and 'Repeat="4"' in zwo
+
+
+def test_zwo_keeps_pairs_that_differ():
+    zwo = render(_sprints([(30, 120, 150), (25, 120, 150), (30, 90, 160)]), ["zwo"])["zwo"].decode()
+    assert "<IntervalsT" not in zwo
@@ -0,0 +1,30 @@
+import io
+
+import pytest
+
+from enduWorkoutGen.importers import read_mrc
+from enduWorkoutGen.workoutgen import WorkoutGenerator, WorkoutParameters, WorkoutSegment, WorkoutType
+
+
+@pytest.mark.parametrize("extra", ["", "\nTarget = 95% of FTP\nMINUTES at threshold: 20\n[Notes]"])
+def test_export_mrc_round_trips_through_read_mrc(tmp_path, extra):
+    generator = WorkoutGenerator()
+    params = WorkoutParameters([WorkoutSegment(WorkoutType.TEMPO, 20), WorkoutSegment(WorkoutType.SPRINTS, 10)], 60)
+    intervals = generator.generate_workout(params, seed=7)
+    description = generator.create_workout_description(params) + extra
+    path = tmp_path / "workout.mrc"
+    generator.export_mrc(intervals, path, description)
+
+    workout = read_mrc(path)
+    assert workout.description == description
+    assert workout.name == "workout"
+    assert list(zip(workout.intervals.starts, workout.intervals.ends, workout.intervals.powers)) == \
+        list(zip(intervals.starts, intervals.ends, intervals.powers))
+
+
+def test_read_mrc_still_reads_the_header_after_a_description():
+    workout = read_mrc(io.StringIO(
+        "[COURSE HEADER]\nDESCRIPTION = two\nlines\nFTP = 200\nMINUTES WATTS\n[END COURSE HEADER]\n"
+        "[COURSE DATA]\n0.00\t100\n1.00\t100\n[END COURSE DATA]\n"))
+    assert workout.description == "two\nlines"
+    assert list(workout.intervals.powers) == [50]
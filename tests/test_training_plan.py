@@ -0,0 +1,22 @@
+from enduWorkoutGen.training_plan import generate_plan
+from enduWorkoutGen.workoutgen import WorkoutGenerator, WorkoutParameters, WorkoutSegment, WorkoutType, derive_seed
+
+
+def _day(workout_type, total, minutes):
+    return WorkoutParameters([WorkoutSegment(workout_type, minutes)], total)
+
+
+def test_reachable_weekly_tss_is_met():
+    # Short endurance days sit at their floor above their share; the threshold day has to take up the rest
+    week = [_day(WorkoutType.ENDURANCE, 60, 40), None, _day(WorkoutType.ENDURANCE, 90, 60), None,
+            _day(WorkoutType.ENDURANCE, 45, 30), _day(WorkoutType.THRESHOLD, 150, 100), None]
+    generator = WorkoutGenerator()
+    reach = [sum(generator.calculate_metrics(generator.generate_workout_for_target(
+                 params, target, seed=derive_seed(1, day), clamp=True))
+                 for day, params in enumerate(week) if params)
+             for target in (0, 1e6)]
+    target = sum(reach) / 2
+    assert reach[0] < target < reach[1]
+
+    plan = generate_plan(week, [target], generator=generator, seed=1)
+    assert abs(plan.weekly_shortfall[0]) <= plan.tolerance
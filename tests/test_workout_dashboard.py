@@ -0,0 +1,60 @@
+import base64
+
+import pytest
+from dash.exceptions import PreventUpdate
+
+from enduWorkoutGen.exporters import EXPORTERS
+from enduWorkoutGen.metrics import DEFAULT_FTP
+from enduWorkoutGen.workout_dashboard import WorkoutDashboard
+
+
+@pytest.fixture(scope="module")
+def dashboard():
+    return WorkoutDashboard()
+
+
+def generate(dashboard, previous_token=None):
+    return dashboard.generate_workout(1, 60, ["tempo", "vo2"], [20, 15], previous_token)[-1]
+
+
+@pytest.mark.parametrize("changes", [
+    {"segment_ids": None},
+    {"segment_ids": [[1], [2]]},
+    {"segment_ids": [0]},
+    {"segment_seeds": ["1", "2"]},
+])
+def test_malformed_previous_token_is_ignored(dashboard, changes):
+    token = dict(generate(dashboard), **changes)
+    assert not WorkoutDashboard.valid_token(token)
+    assert WorkoutDashboard.valid_token(generate(dashboard, token))
+
+
+def test_previous_token_keeps_untouched_segments(dashboard):
+    token = generate(dashboard)
+    changed = dashboard.generate_workout(1, 60, ["tempo", "vo2"], [20, 20], token)[-1]
+    assert changed["segment_seeds"][0] == token["segment_seeds"][0]
+    assert changed["segment_seeds"][1] != token["segment_seeds"][1]
+
+
+@pytest.mark.parametrize("file_type, ftp", [
+    ("exe", 250), (["erg"], 250), ("erg", 0), ("erg", -250), ("erg", 10_000), ("erg", float("nan")), ("erg", "250"),
+])
+def test_download_refuses_unknown_format_or_ftp(dashboard, file_type, ftp):
+    with pytest.raises(PreventUpdate):
+        dashboard.download_workout(1, generate(dashboard), file_type, ftp)
+
+
+def test_download_without_ftp_uses_the_default(dashboard):
+    download = dashboard.download_workout(1, generate(dashboard), "erg", None)
+    assert download["filename"].endswith(".erg")
+    assert f"FTP = {DEFAULT_FTP}" in base64.b64decode(download["content"]).decode()
+
+
+def test_prerendered_erg_is_found_for_a_float_ftp(dashboard):
+    token = dashboard.generate_workout(1, 60, ["tempo", "vo2"], [20, 15], None, 250.0)[-1]
+    workout = dashboard.workout_store.get(token["id"])
+    if workout.pending is not None:
+        workout.pending.result()
+    assert dashboard.export_key("erg", dashboard.download_ftp(250)) in workout.exports
+    dashboard.download_workout(1, token, "erg", 250)
+    assert set(workout.exports) == {dashboard.export_key(file_type, 250) for file_type in [*EXPORTERS, "zip"]}
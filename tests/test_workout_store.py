@@ -0,0 +1,44 @@
+from enduWorkoutGen.workout_store import WorkoutStore
+from enduWorkoutGen.workoutgen import IntervalTable
+
+
+def _workout(intervals=1):
+    table = IntervalTable()
+    for i in range(intervals):
+        table.append(i * 60, (i + 1) * 60, 100)
+    return table
+
+
+def test_put_keeps_a_workout_larger_than_max_bytes():
+    store = WorkoutStore(max_bytes=100)
+    kept = store.put(_workout(), "small", "")
+    workout_id = store.put(_workout(50), "large", "")
+    assert store.get(workout_id) is not None
+    assert kept not in store
+
+
+def test_put_evicts_the_least_recently_used_first():
+    store = WorkoutStore(max_entries=2)
+    first, second = store.put(_workout(), "first", ""), store.put(_workout(), "second", "")
+    store.get(first)
+    third = store.put(_workout(), "third", "")
+    assert first in store and third in store and second not in store
+    assert len(store) == 2
+
+
+def test_export_keeps_its_workout():
+    store = WorkoutStore(max_bytes=1000)
+    workout_id = store.put(_workout(), "only", "")
+    assert store.export(workout_id, "mrc", lambda entry: b"x" * 2000) == b"x" * 2000
+    assert store.get(workout_id) is not None
+    assert store.nbytes == store.get(workout_id).nbytes
+
+
+def test_drop_exports_keeps_the_byte_count():
+    store = WorkoutStore()
+    workout_id = store.put(_workout(), "only", "")
+    empty = store.nbytes
+    store.export(workout_id, "mrc", lambda entry: b"x" * 100)
+    store.drop_exports(workout_id)
+    assert store.nbytes == empty and not store.get(workout_id).exports
+    assert store.export(workout_id, "mrc", lambda entry: b"y") == b"y"
@@ -0,0 +1,20 @@
+import pytest
+
+from enduWorkoutGen.workoutgen import INTERVAL_DURATIONS, WorkoutGenerator, WorkoutParameters, WorkoutSegment, WorkoutType
+
+
+@pytest.mark.parametrize("workout_type", list(WorkoutType))
+def test_exact_zone_minutes_keeps_work_intervals_in_their_duration_range(workout_type):
+    generator = WorkoutGenerator()
+    min_duration, max_duration = INTERVAL_DURATIONS[workout_type]
+    # Sprint recoveries come on top of the work, so fewer sprint minutes fit
+    most_minutes = 10 if workout_type == WorkoutType.SPRINTS else 40
+    for minutes in range(-(-min_duration // 60), most_minutes + 1):
+        params = WorkoutParameters([WorkoutSegment(workout_type, minutes)], 180)
+        for seed in range(10):
+            workout = generator.generate_workout_for_target(params, 0, exact_zone_minutes=True, seed=seed, clamp=True)
+            # Between warmup and cooldown; sprint recoveries are the 50% intervals
+            rows = list(zip(workout.starts, workout.ends, workout.powers))[1:-1]
+            work = [end - start for start, end, power in rows if workout_type != WorkoutType.SPRINTS or power != 50]
+            assert sum(work) == minutes * 60
+            assert all(min_duration <= duration <= max_duration for duration in work), (minutes, seed, work)